@@ -12,13 +12,13 @@ import unittest
 
 from simphony.core.cuba import CUBA
 from jyulb.cuba_extension import CUBAExtension
-from simphony.cuds.lattice import make_cubic_lattice
 from simphony.engine import jyulb_internal_isothermal as lb
 from jyulb.internal.common.proxy_lattice import ProxyLattice
 from simphony.cuds.abc_modeling_engine import ABCModelingEngine
 
 from simphony.engine import proxy
 from simphony_network.model import CUDS
+from simphony_network.geometry import LatticeDescriptor
 
 
 import logging
@@ -88,24 +88,22 @@ class ProxyEngineTestCase(unittest.TestCase):
         engine.BC[CUBA.DENSITY] = {'open': 'periodic',
                                    'wall': 'noFlux'}
 
-        # Configure a lattice
-        lat = make_cubic_lattice("lattice1", self.dr,
-                                 (self.nx, self.ny, self.nz))
+        # Describe a lattice, the remote host builds it
+        lat = LatticeDescriptor("lattice1", (self.nx, self.ny, self.nz),
+                                self.dr)
 
         # Set geometry for a Poiseuille channel
-        for node in lat.iter_nodes():
-            if node.index[0] == 0 or node.index[0] == self.nx-1:
-                node.data[CUBA.MATERIAL_ID] = ProxyLattice.SOLID_ENUM
-            else:
-                node.data[CUBA.MATERIAL_ID] = ProxyLattice.FLUID_ENUM
-            lat.update_nodes([node])
+        lat.assign(CUBA.MATERIAL_ID, ProxyLattice.FLUID_ENUM)
+        lat.assign(CUBA.MATERIAL_ID, ProxyLattice.SOLID_ENUM,
+                   upper=(0, None, None))
+        lat.assign(CUBA.MATERIAL_ID, ProxyLattice.SOLID_ENUM,
+                   lower=(self.nx-1, None, None))
 
         # Initialize flow variables at fluid lattice nodes
-        for node in lat.iter_nodes():
-            if node.data[CUBA.MATERIAL_ID] == ProxyLattice.FLUID_ENUM:
-                node.data[CUBA.VELOCITY] = (0, 0, 0)
-                node.data[CUBA.DENSITY] = 1.0
-            lat.update_nodes([node])
+        lat.assign(CUBA.VELOCITY, (0, 0, 0),
+                   where=(CUBA.MATERIAL_ID, ProxyLattice.FLUID_ENUM))
+        lat.assign(CUBA.DENSITY, 1.0,
+                   where=(CUBA.MATERIAL_ID, ProxyLattice.FLUID_ENUM))
 
         # Add lattice to the engine
         engine.add_dataset(lat)
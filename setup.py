@@ -1,4 +1,21 @@
+import sys
+
 from setuptools import setup, find_packages
+from setuptools.command.build_py import build_py
+
+# Modules written for python 3 only, byte-compiling them on python 2 fails
+PY3_MODULES = ('aio', 'aio_tests')
+
+
+class BuildPy(build_py):
+    """Leave the python 3 only modules out of python 2 installs"""
+    def find_package_modules(self, package, package_dir):
+        modules = build_py.find_package_modules(self, package, package_dir)
+        if sys.version_info[0] < 3:
+            modules = [(pkg, module, path) for pkg, module, path in modules
+                       if not (pkg == 'simphony_network' and
+                               module in PY3_MODULES)]
+        return modules
 
 
 setup(
@@ -7,6 +24,7 @@ setup(
     author='SimPhoNy FP7 European Project',
     description='SimPhoNy network layer',
     packages=find_packages(),
+    cmdclass={'build_py': BuildPy},
     install_requires=['simphony',
                       'gevent>=1.0',
                       'pyzmq>=13.1.0',
@@ -20,6 +38,7 @@ setup(
         'console_scripts': [
             'simphony = simphony_network.server:run_server'],
         'simphony.engine': [
-            'proxy = simphony_network.proxy']
+            'proxy = simphony_network.proxy',
+            'synthetic = simphony_network.benchmarks.synthetic']
         }
 )
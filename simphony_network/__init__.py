@@ -3,4 +3,9 @@ This module is part of simphony-network package.
 
 Here the public API of this package is defined.
 """
-from .application import SimphonyApplication
+import sys
+
+# The server and the gevent based client run on python 2 only. On python 3
+# only the asyncio client in `simphony_network.aio` is available.
+if sys.version_info[0] == 2:
+    from .application import SimphonyApplication
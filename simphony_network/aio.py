@@ -0,0 +1,366 @@
+"""
+This module is part of simphony-network package.
+
+asyncio client for the `SimphonyAPI` of a SimPhoNy server.
+
+The client speaks the zerorpc wire protocol (version 3) directly on top of
+pyzmq's asyncio sockets, hence it talks to the existing servers without
+pulling gevent into the event loop. All the calls of a client are
+multiplexed over a single DEALER socket, one zerorpc channel per call, so
+thousands of concurrent jobs can be driven from one event loop.
+
+This module requires python 3.6 or newer.
+"""
+import asyncio
+import functools
+import pickle
+import time
+import uuid
+
+import msgpack
+import msgpack_numpy
+import zmq
+import zmq.asyncio
+
+# Version of the zerorpc protocol spoken by the client
+PROTOCOL_VERSION = 3
+
+# Number of events a stream may send before the server waits for more
+STREAM_SLOTS = 100
+
+# States in which a remote wrapper will not change anymore
+FINISHED_STATES = ('done', 'failed', 'cancelled', 'timed_out')
+
+
+class RemoteError(Exception):
+    """An exception raised by the remote server.
+
+    Attributes
+    ----------
+    name: str
+        name of the remote exception type
+    human_msg: str
+        the remote error message
+    human_traceback: str
+        the remote traceback
+    """
+    def __init__(self, name, human_msg, human_traceback):
+        super().__init__(human_msg)
+        self.name = name
+        self.human_msg = human_msg
+        self.human_traceback = human_traceback
+
+    def __str__(self):
+        return '%s: %s' % (self.name, self.human_msg)
+
+
+class LostRemote(Exception):
+    """The server stopped answering heartbeats of a call."""
+
+
+def _text(value):
+    """Return the given value as str, servers may send bytes"""
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+    return value
+
+
+def _decode(value):
+    """Recursively turn the bytes of a result into str"""
+    if isinstance(value, dict):
+        return dict((_decode(k), _decode(v)) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return [_decode(item) for item in value]
+    return _text(value)
+
+
+def _unpack(blob):
+    """Unpack an event, keeping the payload strings as raw bytes"""
+    return msgpack.unpackb(blob, raw=True, object_hook=msgpack_numpy.decode)
+
+
+class _Channel(object):
+    """State of a single call on the multiplexed socket"""
+    def __init__(self, channel_id):
+        self.id = channel_id
+        self.queue = asyncio.Queue()
+        self.last_seen = time.monotonic()
+        # Slots reserved for the events the server may send without waiting
+        self.reserved = 1
+
+
+class AsyncClient(object):
+    """Low level asyncio zerorpc client.
+
+    Parameters
+    ----------
+    endpoint: str
+        endpoint of the server, e.g. 'tcp://localhost:8020'
+    heartbeat: float
+        seconds between heartbeats, as configured on the server
+    context: zmq.asyncio.Context, optional
+        the context to create the socket in
+    """
+    def __init__(self, endpoint, heartbeat=5, context=None):
+        self._endpoint = endpoint
+        self._heartbeat = heartbeat
+        self._context = context or zmq.asyncio.Context.instance()
+        self._socket = self._context.socket(zmq.DEALER)
+        self._socket.connect(endpoint)
+        self._channels = {}
+        self._tasks = []
+
+    def _ensure_tasks(self):
+        """Start the receiver and heartbeat tasks on the running loop"""
+        if not self._tasks:
+            self._tasks = [asyncio.ensure_future(self._receive()),
+                           asyncio.ensure_future(self._send_heartbeats())]
+
+    async def _emit(self, name, args, response_to=None, message_id=None):
+        """Send an event and return its message id"""
+        message_id = message_id or uuid.uuid4().hex.encode('ascii')
+        header = {'message_id': message_id, 'v': PROTOCOL_VERSION}
+        if response_to is not None:
+            header['response_to'] = response_to
+        packed = msgpack.packb((header, name, args), use_bin_type=True,
+                               default=msgpack_numpy.encode)
+        await self._socket.send_multipart([b'', packed])
+        return message_id
+
+    async def _receive(self):
+        """Dispatch the incoming events to their channels"""
+        while True:
+            frames = await self._socket.recv_multipart()
+            header, name, args = _unpack(frames[-1])
+            channel = self._channels.get(header.get(b'response_to'))
+            if channel is None:
+                continue
+            channel.last_seen = time.monotonic()
+            name = _text(name)
+            if name == '_zpc_hb':
+                continue
+            channel.queue.put_nowait((name, args))
+
+    async def _send_heartbeats(self):
+        """Keep the open channels alive and detect lost servers"""
+        while True:
+            await asyncio.sleep(self._heartbeat)
+            now = time.monotonic()
+            for channel in list(self._channels.values()):
+                if now > channel.last_seen + self._heartbeat * 2:
+                    channel.queue.put_nowait(('_lost_remote', None))
+                    continue
+                await self._emit('_zpc_hb', (0,), channel.id)
+
+    async def _open(self, method, args):
+        """Send a request on a new channel"""
+        self._ensure_tasks()
+        # Register the channel first, the answer may arrive while sending
+        channel = _Channel(uuid.uuid4().hex.encode('ascii'))
+        self._channels[channel.id] = channel
+        await self._emit(method, args, message_id=channel.id)
+        return channel
+
+    async def _next(self, channel, timeout):
+        """Return the next event of a channel"""
+        name, args = await asyncio.wait_for(channel.queue.get(), timeout)
+        channel.reserved -= 1
+        if name == '_lost_remote':
+            raise LostRemote('Lost remote after %ss heartbeat'
+                             % (self._heartbeat * 2))
+        if name == 'ERR':
+            raise RemoteError(*[_text(arg) for arg in args])
+        return name, args
+
+    def _close(self, channel):
+        self._channels.pop(channel.id, None)
+
+    async def call(self, method, *args, timeout=None):
+        """Call a remote method and return its result.
+
+        Parameters
+        ----------
+        method: str
+            name of the remote method
+        args:
+            positional arguments of the method
+        timeout: float, optional
+            seconds to wait for the result, for ever by default
+        """
+        channel = await self._open(method, args)
+        try:
+            _, args = await self._next(channel, timeout)
+            return args[0]
+        finally:
+            self._close(channel)
+
+    async def stream(self, method, *args, timeout=None):
+        """Call a remote streaming method and iterate over its results.
+
+        Parameters
+        ----------
+        method: str
+            name of the remote method
+        args:
+            positional arguments of the method
+        timeout: float, optional
+            seconds to wait for every single result, for ever by default
+        """
+        channel = await self._open(method, args)
+        try:
+            while True:
+                name, args = await self._next(channel, timeout)
+                if name == 'STREAM_DONE':
+                    return
+                # Let the server send more before it runs out of slots
+                if channel.reserved < STREAM_SLOTS // 2:
+                    slots = STREAM_SLOTS - channel.reserved
+                    channel.reserved += slots
+                    await self._emit('_zpc_more', (slots,), channel.id)
+                yield args
+        finally:
+            self._close(channel)
+
+    def close(self):
+        """Close the socket and stop the background tasks"""
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        self._socket.close(linger=0)
+
+
+class AsyncSimphonyClient(object):
+    """asyncio counterpart of the `SimphonyAPI` surface.
+
+    CUDS objects and datasets are pickled with protocol 2 by default, which
+    python 2 servers are able to read.
+
+    Parameters
+    ----------
+    host: str
+        the host running the SimPhoNy server
+    port: int
+        the API port of the server
+    dumps: callable, optional
+        serializer of CUDS objects and datasets
+    loads: callable, optional
+        deserializer of the datasets sent by the server
+    """
+    def __init__(self, host, port=8020, dumps=None, loads=None):
+        self._client = AsyncClient('tcp://{host}:{port}'.format(host=host,
+                                                               port=port))
+        self._dumps = dumps or functools.partial(pickle.dumps, protocol=2)
+        self._loads = loads or functools.partial(pickle.loads,
+                                                 encoding='latin1')
+
+    async def echo(self, msg):
+        """Echos the given message"""
+        return _text(await self._client.call('echo', msg))
+
+    async def get_metrics(self):
+        """Return the metrics of the server in Prometheus format"""
+        return _text(await self._client.call('get_metrics'))
+
+    async def create_wrapper(self, wrapper_type, cuds):
+        """Create a remote wrapper of the given type and return its id"""
+        return _text(await self._client.call('create_wrapper',
+                                             wrapper_type,
+                                             self._dumps(cuds)))
+
+    async def run_wrapper(self, wrapper_id, options=None):
+        """Start running the given remote wrapper"""
+        return await self._client.call('run_wrapper', wrapper_id, options)
+
+    async def get_wrapper_state(self, wrapper_id):
+        """Return the state of the given remote wrapper"""
+        return _text(await self._client.call('get_wrapper_state',
+                                             wrapper_id))
+
+    async def get_wrapper_stats(self, wrapper_id):
+        """Return the resources used by the given remote wrapper so far"""
+        return _decode(await self._client.call('get_wrapper_stats',
+                                               wrapper_id))
+
+    async def get_wrapper_memory(self, wrapper_id):
+        """Return the estimated memory held by the given remote wrapper"""
+        return _decode(await self._client.call('get_wrapper_memory',
+                                               wrapper_id))
+
+    async def pull_dataset(self, wrapper_id, endpoint, source_wrapper_id,
+                           name):
+        """Make the server fetch a dataset of a wrapper on another server"""
+        return await self._client.call('pull_dataset', wrapper_id, endpoint,
+                                       source_wrapper_id, name)
+
+    async def push_dataset(self, wrapper_id, name, endpoint,
+                           target_wrapper_id):
+        """Make the server send a dataset to a wrapper on another server"""
+        return await self._client.call('push_dataset', wrapper_id, name,
+                                       endpoint, target_wrapper_id)
+
+    async def get_wrapper_trace(self, wrapper_id):
+        """Return the spans the remote host recorded for the given wrapper"""
+        return _decode(await self._client.call('get_wrapper_trace',
+                                               wrapper_id))
+
+    async def wait(self, wrapper_id, poll_interval=1.0):
+        """Wait until the given remote wrapper finishes and return its state"""
+        while True:
+            state = await self.get_wrapper_state(wrapper_id)
+            if state in FINISHED_STATES:
+                return state
+            await asyncio.sleep(poll_interval)
+
+    async def run(self, wrapper_type, cuds, options=None, poll_interval=1.0):
+        """Create and run a remote wrapper, wait for it and return its id"""
+        wrapper_id = await self.create_wrapper(wrapper_type, cuds)
+        await self.run_wrapper(wrapper_id, options)
+        await self.wait(wrapper_id, poll_interval)
+        return wrapper_id
+
+    async def checkpoint_wrapper(self, wrapper_id):
+        """Checkpoint the current state of the given remote wrapper"""
+        return await self._client.call('checkpoint_wrapper', wrapper_id)
+
+    async def cancel_wrapper(self, wrapper_id):
+        """Stop the given remote wrapper and return its state"""
+        return _text(await self._client.call('cancel_wrapper', wrapper_id))
+
+    async def delete_wrapper(self, wrapper_id):
+        """Delete the given remote wrapper and its recorded trajectories"""
+        return await self._client.call('delete_wrapper', wrapper_id)
+
+    async def get_dataset(self, wrapper_id, name):
+        """Return a dataset of the given remote wrapper"""
+        return self._loads(await self._client.call('get_dataset',
+                                                   wrapper_id, name))
+
+    async def iter_datasets(self, wrapper_id, names):
+        """Iterate over datasets of a remote wrapper as they arrive.
+
+        All the datasets are requested at once, hence transfers overlap.
+        """
+        pending = [asyncio.ensure_future(self.get_dataset(wrapper_id, name))
+                   for name in names]
+        try:
+            for future in asyncio.as_completed(pending):
+                yield await future
+        finally:
+            for future in pending:
+                future.cancel()
+
+    async def get_trajectory_info(self, wrapper_id, name):
+        """Describe the recorded trajectory of a dataset"""
+        return _decode(await self._client.call('get_trajectory_info',
+                                               wrapper_id, name))
+
+    async def iter_trajectory(self, wrapper_id, name, start=0, stop=None,
+                              attributes=None):
+        """Iterate over recorded frames of a dataset as they are streamed"""
+        async for frame in self._client.stream('iter_trajectory', wrapper_id,
+                                               name, start, stop, attributes):
+            yield _decode(frame)
+
+    def close(self):
+        """Close the connection to the server"""
+        self._client.close()
@@ -0,0 +1,107 @@
+"""
+This module is part of simphony-network package.
+
+Testing module for the asyncio client, run on python 3 only.
+
+The client talks to a plain zerorpc server running in a thread, hence the
+protocol is checked against the reference implementation.
+"""
+import time
+import asyncio
+import threading
+import unittest
+
+import gevent
+import zerorpc
+
+from .aio import AsyncClient, LostRemote, RemoteError, STREAM_SLOTS
+
+ENDPOINT = 'tcp://127.0.0.1:18090'
+
+
+class LoopbackAPI(object):
+
+    def echo(self, msg):
+        return msg
+
+    def fail(self, msg):
+        raise KeyError(msg)
+
+    def sleep(self, seconds):
+        gevent.sleep(seconds)
+        return seconds
+
+    def block(self, seconds):
+        # Blocks the event loop of the server, heartbeats included
+        time.sleep(seconds)
+        return seconds
+
+    @zerorpc.stream
+    def count(self, n):
+        return iter(range(n))
+
+
+def serve(ready):
+    server = zerorpc.Server(LoopbackAPI(), heartbeat=1)
+    server.bind(ENDPOINT)
+    ready.set()
+    server.run()
+
+
+class AsyncClientTestCase(unittest.TestCase):
+
+    """Test case for AsyncClient class against a zerorpc server."""
+
+    @classmethod
+    def setUpClass(cls):
+        ready = threading.Event()
+        threading.Thread(target=serve, args=(ready,), daemon=True).start()
+        ready.wait(5)
+
+    def run_client(self, coroutine):
+        """Run a coroutine taking a client on a new event loop"""
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        client = AsyncClient(ENDPOINT, heartbeat=1)
+        try:
+            return loop.run_until_complete(coroutine(client))
+        finally:
+            client.close()
+            # Let the cancelled tasks of the client finish
+            loop.run_until_complete(asyncio.sleep(0))
+
+    def test_call(self):
+        """Results and remote errors come back on their own channels."""
+        async def calls(client):
+            results = await asyncio.gather(*[client.call('echo', i)
+                                             for i in range(10)])
+            with self.assertRaises(RemoteError) as caught:
+                await client.call('fail', 'missing')
+            return results, caught.exception
+
+        results, error = self.run_client(calls)
+        self.assertEqual(results, list(range(10)))
+        self.assertEqual(error.name, 'KeyError')
+
+    def test_heartbeat(self):
+        """Calls outliving the heartbeat are kept alive."""
+        async def call(client):
+            return await client.call('sleep', 2.5)
+
+        self.assertEqual(self.run_client(call), 2.5)
+
+    def test_lost_remote(self):
+        """A server missing heartbeats is lost."""
+        async def call(client):
+            return await client.call('block', 4)
+
+        self.assertRaises(LostRemote, self.run_client, call)
+
+    def test_stream(self):
+        """Streams longer than the slots ask the server for more."""
+        async def stream(client):
+            return [item async for item in
+                    client.stream('count', STREAM_SLOTS * 3)]
+
+        self.assertEqual(self.run_client(stream),
+                         list(range(STREAM_SLOTS * 3)))
@@ -4,14 +4,19 @@ This module is part of simphony-network package.
 The public API of the running simphony application is defined here.
 Only these methods will be available remotely.
 """
+import zerorpc
+
+from .memory import MemoryProfiler
 
 
 class SimphonyAPI(object):
     """
     Public API to be exposed.
     """
-    def __init__(self, manager):
+    def __init__(self, manager, metrics=None):
         self._manager = manager
+        self._metrics = metrics
+        self._memory = MemoryProfiler()
 
     def echo(self, msg):
         """Echos the given message.
@@ -23,6 +28,81 @@ class SimphonyAPI(object):
         """
         return msg
 
+    def get_metrics(self):
+        """Return the metrics of the serving process in Prometheus format.
+
+        With several workers, the metrics of the worker which answers.
+        """
+        if self._metrics is None:
+            return ''
+        return self._metrics.render()
+
+    def start_memory_profiling(self):
+        """Start memory profiling with a baseline snapshot.
+
+        Snapshots count the live objects of every type, the serving process
+        is blocked while they are taken. With several workers, profiling
+        applies to the worker which answers.
+
+        Returns
+        -------
+        dict
+            id of the baseline snapshot, resident memory of the process,
+            and the number of live objects and their bytes
+        """
+        return self._memory.start()
+
+    def stop_memory_profiling(self):
+        """Stop memory profiling and drop its snapshots"""
+        self._memory.stop()
+
+    def take_memory_snapshot(self):
+        """Take a snapshot to diff later, see `diff_memory_snapshots`.
+
+        Returns
+        -------
+        dict
+            summary of the snapshot as of `start_memory_profiling`
+        """
+        if not self._memory.started:
+            raise KeyError('Memory profiling is not started.')
+        return self._memory.snapshot()
+
+    def get_memory_top(self, limit=10):
+        """Return the types of live objects holding the most memory.
+
+        Parameters
+        ----------
+        limit: int
+            number of types to return
+
+        Returns
+        -------
+        list of dict
+            type name, count of objects and their bytes, largest first
+        """
+        return self._memory.top(limit)
+
+    def diff_memory_snapshots(self, old_id=None, new_id=None, limit=10):
+        """Return the types of objects whose memory changed the most.
+
+        Parameters
+        ----------
+        old_id: int, optional
+            snapshot to compare to, the baseline by default
+        new_id: int, optional
+            snapshot to compare, the live objects by default
+        limit: int
+            number of types to return
+
+        Returns
+        -------
+        dict
+            seconds between the snapshots, resident memory of the process
+            and the changed types with their counts and bytes
+        """
+        return self._memory.diff(old_id, new_id, limit)
+
     def create_wrapper(self, wrapper_type,
                        cuds,
                        **kwargs):
@@ -38,7 +118,8 @@ class SimphonyAPI(object):
             code which is loaded into that entry point.
 
         cuds: CUDSModel
-            contains the following attributes
+            pickled, or a message of `serialization.dumps`. Contains the
+            following attributes
                 BC: DataContainer
                     boundary conditions
 
@@ -60,14 +141,154 @@ class SimphonyAPI(object):
                                             cuds,
                                             **kwargs)
 
-    def run_wrapper(self, wrapper_id):
+    def run_wrapper(self, wrapper_id, options=None):
         """Run the modeling engine recognized by the given id.
 
         Run the modeling engine using the configured settings (e.g. CM, BC,
         and SP) and the configured state data (e.g. particle, mesh and
         lattice data).
+
+        Parameters
+        ----------
+        wrapper_id: str
+            uuid of the wrapper
+        options: dict, optional
+            run options, e.g. `record_every` to record a trajectory frame
+            every given number of time steps.
+        """
+        return self._manager.run_wrapper(wrapper_id, options)
+
+    def cancel_wrapper(self, wrapper_id):
+        """Stop the run of the given wrapper and free its engine.
+
+        Parameters
+        ----------
+        wrapper_id: str
+            uuid of the wrapper
+
+        Returns
+        -------
+        str
+            state of the wrapper
+        """
+        return self._manager.cancel_wrapper(wrapper_id)
+
+    def checkpoint_wrapper(self, wrapper_id):
+        """Checkpoint the current state of the given wrapper.
+
+        Parameters
+        ----------
+        wrapper_id: str
+            uuid of the wrapper
+
+        Returns
+        -------
+        int
+            time steps of the current run which are done, None if the
+            wrapper is not running
+        """
+        return self._manager.checkpoint_wrapper(wrapper_id)
+
+    def delete_wrapper(self, wrapper_id):
+        """Delete the given wrapper along with its datasets and trajectories.
+
+        Parameters
+        ----------
+        wrapper_id: str
+            uuid of the wrapper
+        """
+        return self._manager.delete_wrapper(wrapper_id)
+
+    def create_pipeline(self, stages):
+        """Create the wrappers of a pipeline of stages and run it.
+
+        Parameters
+        ----------
+        stages: list of dict
+            every stage has a `name`, an engine `type` and a `cuds` like
+            given to `create_wrapper`. Optional `inputs` list pairs of an
+            earlier stage and the name of one of its datasets, optional
+            `options` are the run options of the stage.
+
+        Returns
+        -------
+        dict
+            `pipeline_id` and the `wrappers`, stage name to wrapper id
+        """
+        return self._manager.create_pipeline(stages)
+
+    def get_pipeline_state(self, pipeline_id):
+        """Return the state of the given pipeline and of its stages.
+
+        Parameters
+        ----------
+        pipeline_id: str
+            uuid of the pipeline
+
+        Returns
+        -------
+        dict
+            `state` of the pipeline and the `stages`, stage name to its
+            `wrapper_id` and `state`
+        """
+        return self._manager.get_pipeline_state(pipeline_id)
+
+    def delete_pipeline(self, pipeline_id):
+        """Delete the given finished pipeline along with its wrappers.
+
+        Parameters
+        ----------
+        pipeline_id: str
+            uuid of the pipeline
+        """
+        return self._manager.delete_pipeline(pipeline_id)
+
+    def get_wrapper_stats(self, wrapper_id):
+        """Return the resources used by the given wrapper so far.
+
+        Parameters
+        ----------
+        wrapper_id: str
+            uuid of the wrapper
+
+        Returns
+        -------
+        dict
+            run and CPU time, peak memory, bytes transferred and time spent
+            in serialization
         """
-        return self._manager.run_wrapper(wrapper_id)
+        return self._manager.get_wrapper_stats(wrapper_id)
+
+    def get_wrapper_memory(self, wrapper_id):
+        """Estimate the memory held by the given wrapper.
+
+        Parameters
+        ----------
+        wrapper_id: str
+            uuid of the wrapper
+
+        Returns
+        -------
+        dict
+            bytes of every dataset, of the buffered trajectories and of the
+            whole engine
+        """
+        return self._manager.get_wrapper_memory(wrapper_id)
+
+    def get_wrapper_trace(self, wrapper_id):
+        """Return the spans the server recorded for the given wrapper.
+
+        Parameters
+        ----------
+        wrapper_id: str
+            uuid of the wrapper
+
+        Returns
+        -------
+        dict
+            trace id and spans of the wrapper, times on the server clock
+        """
+        return self._manager.get_wrapper_trace(wrapper_id)
 
     def get_wrapper_state(self, wrapper_id):
         """ Get the current state of the given wrapper.
@@ -92,10 +313,45 @@ class SimphonyAPI(object):
         id: str
             the modeling engine's id
         dataset : ABCLattice, ABCMesh or ABCParticles
-            dataset to be added.
+            dataset to be added, pickled or a message of
+            `serialization.dumps`
         """
         return self._manager.add_dataset(wrapper_id, dataset)
 
+    def pull_dataset(self, wrapper_id, endpoint, source_wrapper_id, name):
+        """Fetch a dataset of a wrapper on another server and add it.
+
+        Parameters
+        ----------
+        wrapper_id: str
+            uuid of the wrapper to add the dataset to
+        endpoint: str
+            API endpoint of the other server, e.g. 'tcp://pc-116:8020'
+        source_wrapper_id: str
+            uuid of the wrapper on the other server
+        name: str
+            name of the dataset
+        """
+        return self._manager.pull_dataset(wrapper_id, endpoint,
+                                          source_wrapper_id, name)
+
+    def push_dataset(self, wrapper_id, name, endpoint, target_wrapper_id):
+        """Send a dataset to a wrapper on another server.
+
+        Parameters
+        ----------
+        wrapper_id: str
+            uuid of the wrapper owning the dataset
+        name: str
+            name of the dataset
+        endpoint: str
+            API endpoint of the other server, e.g. 'tcp://pc-116:8020'
+        target_wrapper_id: str
+            uuid of the wrapper on the other server
+        """
+        return self._manager.push_dataset(wrapper_id, name, endpoint,
+                                          target_wrapper_id)
+
     def remove_dataset(self, wrapper_id, name):
         """Remove a dataset from the correspoinding modeling engine
 
@@ -109,7 +365,7 @@ class SimphonyAPI(object):
         return self._manager.remove_dataset(wrapper_id, name)
 
 
-    def get_dataset(self, wrapper_id, name):
+    def get_dataset(self, wrapper_id, name, out_of_band=False):
         """Get a dataset from the correspoinding modeling engine
 
         Parameters
@@ -118,9 +374,55 @@ class SimphonyAPI(object):
             the modeling engine's id
         name: str
             name of the dataset
+        out_of_band: bool
+            return a message of `serialization.dumps` instead of a pickle
 
         Returns
         -------
         ABCMesh or ABCLattice or ABCParticles
+            pickled, or as a message
+        """
+        return self._manager.get_dataset(wrapper_id, name, out_of_band)
+
+    def get_trajectory_info(self, wrapper_id, name):
+        """Describe the recorded trajectory of a dataset.
+
+        Parameters
+        ----------
+        wrapper_id: str
+            uuid of the wrapper
+        name: str
+            name of the dataset
+
+        Returns
+        -------
+        dict
+            number of frames, their time steps and the recorded attributes
+        """
+        return self._manager.get_trajectory_info(wrapper_id, name)
+
+    @zerorpc.stream
+    def iter_trajectory(self, wrapper_id, name, start=0, stop=None,
+                        attributes=None):
+        """Stream recorded frames of a dataset.
+
+        Parameters
+        ----------
+        wrapper_id: str
+            uuid of the wrapper
+        name: str
+            name of the dataset
+        start: int
+            first frame to send
+        stop: int, optional
+            frame to stop before
+        attributes: list of str, optional
+            names of the attributes to send, all of them by default
+
+        Returns
+        -------
+        iterator of dict
+            frame number, time step and attribute arrays of every frame
         """
-        return self._manager.get_dataset(wrapper_id, name)
+        return self._manager.iter_trajectory(wrapper_id, name, start, stop,
+                                             attributes)
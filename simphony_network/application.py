@@ -11,12 +11,19 @@ This class acts like a router, it forwards the messags to the manager
 object which is defined in the beginning. The rest of interactions between
 application object and the rest of application will hapen utilizing signals.
 """
+import os
+import ctypes
+import platform
+import ctypes.util
+import signal as signals
+import shutil
 import logging
+import tempfile
 
 import gevent
+import gevent.os
 import zmq.green as zmq
 import zerorpc
-import msgpack
 # Monkey patching msgpack to support numpy arrays
 import msgpack_numpy as mn
 mn.patch()
@@ -25,6 +32,82 @@ from blinker import signal
 from . import constants
 from .api import SimphonyAPI
 from .manager import SimphonyManager
+from .publisher import EventPublisher
+from .broker import WorkerBroker
+from .metrics import MetricsRegistry, RPCMetrics, HubMonitor, serve_metrics
+from . import tracing
+
+
+def _die_with_parent():
+    """Get terminated once the parent process dies, on Linux only"""
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        # PR_SET_PDEATHSIG
+        libc.prctl(1, signals.SIGTERM)
+    except (OSError, AttributeError):
+        pass
+
+
+def report_startup(endpoint, ready_id=None, **report):
+    """Report to the farm starting a server that it is ready or failed.
+
+    Parameters
+    ----------
+    endpoint: str
+        endpoint the farm listens at, nothing is reported if None
+    ready_id: str, optional
+        id telling the servers of a farm apart, the host name by default
+    report:
+        `ready=True` or the `error` the server failed with
+    """
+    if not endpoint:
+        return
+    report.update(id=ready_id or platform.node(), pid=os.getpid())
+    context = zmq.Context.instance()
+    socket = context.socket(zmq.PUSH)
+    # Give the report a moment to leave before the socket is closed
+    socket.setsockopt(zmq.LINGER, 1000)
+    socket.connect(endpoint)
+    socket.send_json(report)
+    socket.close()
+
+
+def _wait_workers(socket, pids):
+    """Wait until every worker reported that it is ready.
+
+    Workers report with their index as id, see `report_startup`.
+
+    Parameters
+    ----------
+    socket: zmq.Socket
+        PULL socket the workers report to
+    pids: list of int
+        process ids of the workers, by index
+
+    Raises
+    ------
+    RuntimeError
+        as soon as a worker fails to start or exits before it is ready
+    """
+    pending = set(range(len(pids)))
+    while pending:
+        if socket.poll(100):
+            report = socket.recv_json()
+            if report.get('error'):
+                raise RuntimeError('Worker %s failed to start: %s'
+                                   % (report['id'], report['error']))
+            pending.discard(int(report['id']))
+            continue
+        for index in pending:
+            pid, status = gevent.os.waitpid(pids[index], os.WNOHANG)
+            if not pid:
+                continue
+            if os.WIFSIGNALED(status):
+                reason = 'killed by signal %s' % os.WTERMSIG(status)
+            else:
+                reason = 'exit status %s' % os.WEXITSTATUS(status)
+            raise RuntimeError('Worker %s exited before it was ready, %s.'
+                               % (index, reason))
 
 
 class SimphonyApplication(object):
@@ -37,13 +120,15 @@ class SimphonyApplication(object):
         config: dict
             a dictionary containing configuration key/values.
         """
-        if not config:
-            config = {'API_PORT': 8020,
-                      'PUB_PORT': 8021,
-                      'SERVER_IP': '0.0.0.0',
-                      'LOG_LEVEL': logging.DEBUG}
-        self.config = config
+        self.config = dict(constants.DEFAULT_CONFIG)
+        self.config.update(config or {})
+        config = self.config
+        if config['WORKERS'] > 1 and config['CHECKPOINT_DIR']:
+            # Every worker would resume the same wrappers
+            raise ValueError('CHECKPOINT_DIR needs a single worker.')
         self.manager = SimphonyManager(self.config)
+        # Sockets to bind before the server is ready
+        self._unbound = set(['api', 'pub'])
         # Configure main logger
         self.logger = logging.getLogger('simphony')
         self.logger.propagate = False
@@ -59,47 +144,178 @@ class SimphonyApplication(object):
         """
         return "tcp://%s:%s" % (self.config['SERVER_IP'], self.config['API_PORT'])
 
+    def get_pub_endpoint(self):
+        """Return the publisher endpoint
+        """
+        return "tcp://%s:%s" % (self.config['SERVER_IP'], self.config['PUB_PORT'])
+
     def run(self):
         """Run SimPhoNy server loop. Will run for ever."""
-        gevent.joinall([gevent.spawn(self._run_api_listener),
-                        gevent.spawn(self._run_publisher)])
+        try:
+            if self.config['WORKERS'] > 1:
+                self._run_workers()
+                return
+
+            gevent.joinall([gevent.spawn(self._run_api_listener),
+                            gevent.spawn(self._run_publisher)],
+                           raise_error=True)
+        except Exception as e:
+            if self._unbound:
+                self._report(error=repr(e))
+            raise
+
+    def _report(self, **report):
+        report_startup(self.config['READY_ENDPOINT'],
+                       self.config['READY_ID'], **report)
+
+    def _bound(self, name):
+        """Report the server ready once all of its sockets are bound"""
+        self._unbound.discard(name)
+        if not self._unbound:
+            self._report(ready=True)
+
+    def _run_workers(self):
+        """Fork the worker processes and route their traffic.
+
+        Every worker runs its own API listener and publisher on internal
+        endpoints, the parent process runs the broker in front of them.
+        Engines are already loaded by then and shared with the workers.
+        Workers report to the parent once their sockets are bound, the
+        server is ready once all of them did.
+        """
+        ipc_dir = tempfile.mkdtemp(prefix='simphony-')
+        api_endpoints = ['ipc://%s/api-%s' % (ipc_dir, i)
+                         for i in range(self.config['WORKERS'])]
+        pub_endpoint = 'ipc://%s/pub' % ipc_dir
+        ready_endpoint = 'ipc://%s/ready' % ipc_dir
 
-    def _run_api_listener(self):
-        """Run API listener. Will listen for incoming commands."""
-        conn_string = "tcp://{ip}:{port}".format(ip=self.config['SERVER_IP'],
-                                                 port=self.config['API_PORT'])
+        pids = []
+        for index, endpoint in enumerate(api_endpoints):
+            pid = gevent.fork()
+            if pid == 0:
+                _die_with_parent()
+                self.config['READY_ENDPOINT'] = ready_endpoint
+                self.config['READY_ID'] = str(index)
+                self.manager.restrict_placement(index, len(api_endpoints))
+                metrics_port = None
+                if self.config['METRICS_PORT']:
+                    metrics_port = self.config['METRICS_PORT'] + index
+                status = 0
+                try:
+                    gevent.joinall([
+                        gevent.spawn(self._run_api_listener, endpoint,
+                                     metrics_port),
+                        gevent.spawn(self._run_publisher, pub_endpoint)],
+                        raise_error=True)
+                except Exception as e:
+                    self.logger.exception('Worker %s failed.' % index)
+                    status = 1
+                    if self._unbound:
+                        self._report(error=repr(e))
+                        # Deliver the report before exiting
+                        zmq.Context.instance().term()
+                finally:
+                    os._exit(status)
+            pids.append(pid)
+        self.logger.info('Started %s workers: %s' % (len(pids), pids))
+
+        # Being terminated stops the workers too
+        gevent.signal(signals.SIGTERM, gevent.kill, gevent.getcurrent(),
+                      SystemExit)
+        context = zmq.Context()
+        ready = context.socket(zmq.PULL)
+        try:
+            ready.bind(ready_endpoint)
+            self.logger.info("Starting API at %s" % self.get_api_endpoint())
+            broker = WorkerBroker(self.get_api_endpoint(),
+                                  api_endpoints,
+                                  self.get_pub_endpoint(),
+                                  pub_endpoint)
+            _wait_workers(ready, pids)
+            self._bound('api')
+            self._bound('pub')
+            broker.run()
+        finally:
+            ready.close(linger=0)
+            context.term()
+            for pid in pids:
+                try:
+                    os.kill(pid, signals.SIGTERM)
+                except OSError:
+                    # Already exited
+                    pass
+            shutil.rmtree(ipc_dir, ignore_errors=True)
+
+    def _run_api_listener(self, endpoint=None, metrics_port=None):
+        """Run API listener. Will listen for incoming commands.
+
+        Parameters
+        ----------
+        endpoint: str, optional
+            endpoint to bind to instead of the configured one
+        metrics_port: int, optional
+            port to serve the metrics at instead of the configured one
+        """
+        conn_string = endpoint or self.get_api_endpoint()
         self.logger.info("Starting API at %s" % conn_string)
         #self._register_handlers()
-        self.api = SimphonyAPI(self.manager)
-        s = zerorpc.Server(self.api)
+        self.manager.start()
+
+        # Every API call is measured, the hub is watched for blocking
+        self.metrics = MetricsRegistry()
+        self.api = SimphonyAPI(self.manager, self.metrics)
+        gevent.spawn(HubMonitor(self.metrics).run)
+        metrics_port = metrics_port or self.config['METRICS_PORT']
+        if metrics_port:
+            gevent.spawn(serve_metrics, self.metrics,
+                         self.config['METRICS_IP'], metrics_port)
+
+        # Trace ids of the clients are picked up from the call headers
+        tracing.install()
+        s = zerorpc.Server(RPCMetrics(self.metrics).instrument(self.api))
         s.bind(conn_string)
+        self._bound('api')
         s.run()
 
-    def _run_publisher(self):
-        """Run the publisher channel. Will publish messages."""
+    def _run_publisher(self, endpoint=None):
+        """Run the publisher channel. Will publish messages.
+
+        Parameters
+        ----------
+        endpoint: str, optional
+            endpoint of a broker to connect to instead of binding to the
+            configured publisher port
+        """
         context = zmq.Context()
         socket = context.socket(zmq.PUB)
-        self.logger.info('Starting publisher at tcp://*:%s' % self.config['PUB_PORT'])
-        socket.bind("tcp://%s:%s" % (self.config['SERVER_IP'], self.config['PUB_PORT']))
+        # Bound the queue kept for every subscriber, messages to a slow
+        # subscriber are dropped once its high-water mark is reached.
+        socket.setsockopt(zmq.SNDHWM, self.config['PUB_HWM'])
+        if endpoint:
+            self.logger.info('Connecting publisher to %s' % endpoint)
+            socket.connect(endpoint)
+            self._bound('pub')
+        else:
+            self.logger.info('Starting publisher at tcp://*:%s' % self.config['PUB_PORT'])
+            socket.bind(self.get_pub_endpoint())
+            self._bound('pub')
+
+        publisher = EventPublisher(socket,
+                                   self.config['PUB_BATCH_WINDOW'],
+                                   constants.CONFLATED_EVENTS)
 
         def publish_handler(sender, topic=None, **kwargs):
             """Handle publish requests.
 
             Parameters
             ----------
-            topic: int
-                an integer designating type of a message.
+            topic: str
+                prefix of the message, e.g. the id of the wrapper that the
+                message is about. Subscribers filter messages on it.
             """
-            if not topic:
-                raise Exception("No topic given. Won't publish anything without it.")
-
-            # ZMQ only transports the messages, it's up to us to decide the format
-            packed = msgpack.packb(kwargs)
-
-            # Send the packed message with corresponding topic.
             # Topics will be used to categorize published messages.
             # Listener can ignore certain topics and only get what they want.
-            socket.send('%s %s' % (topic, packed))
+            publisher.publish(topic, **kwargs)
 
         # Here we create the publish signal. Anyone intrested in publishing
         # a message to clients will have to get this signal instance and use
@@ -110,3 +326,6 @@ class SimphonyApplication(object):
         # passing `weak` parameter we make sure that the handler will not be
         # removed when it goes out of scope.
         publish.connect(publish_handler, weak=False)
+
+        # Send the queued messages in batches
+        publisher.run()
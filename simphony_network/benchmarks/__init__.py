@@ -0,0 +1,6 @@
+"""
+This module is part of simphony-network package.
+
+Benchmarks of the SimPhoNy network layer. Every module can be run as a
+script and prints its results as JSON lines.
+"""
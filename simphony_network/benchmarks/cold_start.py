@@ -0,0 +1,63 @@
+"""
+This module is part of simphony-network package.
+
+Cold start time of a SimPhoNy server: the time from launching the
+`simphony` process until its first RPC is answered.
+
+The server is started twice, first with an empty engine index cache, then
+with the cache written by the first run.
+
+Usage::
+
+    python -m simphony_network.benchmarks.cold_start
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+from .throughput import wait_ready
+
+
+def measure(port, cache_path):
+    """Return seconds from launching a server until it answers an RPC"""
+    start = time.time()
+    server = subprocess.Popen([sys.executable, '-m', 'simphony_network.server',
+                               '--ip', '127.0.0.1',
+                               '--api-port', str(port),
+                               '--pub-port', str(port + 1),
+                               '--engine-cache', cache_path])
+    try:
+        if not wait_ready('tcp://127.0.0.1:%s' % port):
+            raise RuntimeError('Server did not start.')
+        return time.time() - start
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Measure the time until a new server answers an RPC.')
+    parser.add_argument('--port', type=int, default=8120,
+                        help='API port of the benchmarked server')
+    args = parser.parse_args(argv)
+
+    cache_dir = tempfile.mkdtemp()
+    try:
+        cache_path = os.path.join(cache_dir, 'engines.json')
+        for cache in ('cold', 'warm'):
+            print json.dumps({'benchmark': 'cold_start',
+                              'engine_cache': cache,
+                              'seconds': measure(args.port, cache_path)})
+            sys.stdout.flush()
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+if __name__ == '__main__':
+    main()
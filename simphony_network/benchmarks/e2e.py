@@ -0,0 +1,194 @@
+"""
+This module is part of simphony-network package.
+
+End-to-end cost of remote jobs on a loopback server.
+
+A local server is started with the synthetic engine configured through its
+environment. For every container type and dataset size, jobs are submitted
+through `ProxyEngine` and their dataset is fetched back. Every result line
+reports the job latency, the time spent per phase of the job, the bytes
+moved and the transfer throughput, and the CPU the server spent per job.
+
+The synthetic engine is found through the `simphony.engine` entry point,
+hence the package has to be installed, e.g. with `pip install -e .`.
+Sizes of up to 10^7 items can be given with `--sizes`, datasets are built
+as CUDS objects in the benchmark process, which takes a while for the
+large ones.
+
+Usage::
+
+    python -m simphony_network.benchmarks.e2e --sizes 1000 10000 100000
+"""
+import os
+import sys
+import json
+import time
+import math
+import argparse
+import subprocess
+
+from simphony.core.cuba import CUBA
+from simphony.core.data_container import DataContainer
+from simphony.cuds.lattice import make_cubic_lattice
+from simphony.cuds.particles import Particles, Particle
+from simphony.cuds.mesh import Mesh, Point
+
+from ..model import CUDS
+from ..proxy import ProxyEngine
+from .. import tracing
+from .throughput import wait_ready
+
+# Name of the engine class in the `simphony.engine` entry point
+ENGINE = 'SyntheticEngine'
+
+# Name of the dataset every job is submitted with
+DATASET = 'data'
+
+CONTAINER_TYPES = ('lattice', 'particles', 'mesh')
+
+
+def make_dataset(container_type, size):
+    """Return a dataset of about the given number of items with a velocity"""
+    if container_type == 'lattice':
+        # Close to a square, like the 2D lattices of the LB engines
+        width = int(math.sqrt(size))
+        lattice = make_cubic_lattice(DATASET, 1.0,
+                                     (width, max(size // width, 1), 1))
+        nodes = []
+        for node in lattice.iter_nodes():
+            node.data = DataContainer({CUBA.VELOCITY: (0.0, 0.0, 0.0)})
+            nodes.append(node)
+        lattice.update_nodes(nodes)
+        return lattice
+    elif container_type == 'particles':
+        particles = Particles(DATASET)
+        particles.add_particles(
+            Particle(coordinates=(float(i), 0.0, 0.0),
+                     data=DataContainer({CUBA.VELOCITY: (0.0, 0.0, 0.0)}))
+            for i in range(size))
+        return particles
+    elif container_type == 'mesh':
+        mesh = Mesh(DATASET)
+        mesh.add_points(
+            Point(coordinates=(float(i), 0.0, 0.0),
+                  data=DataContainer({CUBA.VELOCITY: (0.0, 0.0, 0.0)}))
+            for i in range(size))
+        return mesh
+    raise ValueError('Container type %s is not supported.' % container_type)
+
+
+def _process_cpu(pid):
+    """Return the CPU seconds a process has used so far, or None"""
+    try:
+        with open('/proc/%s/stat' % pid) as f:
+            # Skip the command name, it may contain spaces
+            fields = f.read().rsplit(')', 1)[1].split()
+    except IOError:
+        return None
+    # utime and stime are the 14th and 15th fields of the stat line
+    return (int(fields[11]) + int(fields[12])) / \
+        float(os.sysconf('SC_CLK_TCK'))
+
+
+def run_job(dataset, port, steps):
+    """Run a single job and return its latency, trace and server stats"""
+    cm = DataContainer()
+    cm[CUBA.NUMBER_OF_TIME_STEPS] = steps
+    engine = ProxyEngine(CUDS(cm=cm), ENGINE, '127.0.0.1', port=port,
+                         pub_port=port + 1, poll_interval=0.01,
+                         propagate_trace=True)
+    engine.add_dataset(dataset)
+    start = time.time()
+    engine.run()
+    engine.get_dataset(DATASET)
+    latency = time.time() - start
+    stats = engine.get_stats()
+    engine.delete()
+    return latency, engine.trace, stats
+
+
+def measure(server_pid, port, container_type, size, steps, repeat):
+    """Return the result line of a container type and dataset size"""
+    dataset = make_dataset(container_type, size)
+    latencies, traces, stats = [], [], []
+    cpu = _process_cpu(server_pid)
+    for _ in range(repeat):
+        latency, trace, job_stats = run_job(dataset, port, steps)
+        latencies.append(latency)
+        traces.append(trace)
+        stats.append(job_stats)
+    if cpu is not None:
+        cpu = (_process_cpu(server_pid) - cpu) / repeat
+
+    phases = tracing.summarize(traces)
+    moved = sum(s['bytes_in'] + s['bytes_out'] for s in stats) / repeat
+    transfer = sum(phases[name]['mean'] for name in ('upload', 'fetch')
+                   if name in phases)
+    latencies.sort()
+    return {'benchmark': 'e2e',
+            'container': container_type,
+            'size': size,
+            'steps': steps,
+            'jobs': repeat,
+            'latency_mean': sum(latencies) / len(latencies),
+            'latency_p50': latencies[len(latencies) // 2],
+            'latency_max': latencies[-1],
+            'phases': dict((name, values['mean'])
+                           for name, values in phases.iteritems()),
+            'bytes': moved,
+            'transfer_mb_per_second': moved / transfer / 2 ** 20
+            if transfer else None,
+            'server_cpu': cpu,
+            'wrapper_cpu': sum(s['cpu_time'] for s in stats) / repeat,
+            'server_serialization': sum(s['serialization_time']
+                                        for s in stats) / repeat}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Measure end-to-end job costs on a loopback server.')
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[1000, 10000, 100000],
+                        help='dataset items to measure, e.g. up to 10000000')
+    parser.add_argument('--types', nargs='+', choices=CONTAINER_TYPES,
+                        default=list(CONTAINER_TYPES),
+                        help='container types to measure')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='jobs per container type and size')
+    parser.add_argument('--steps', type=int, default=10,
+                        help='time steps of every job')
+    parser.add_argument('--item-time', type=float, default=1e-8,
+                        help='CPU seconds per item and time step')
+    parser.add_argument('--output-nodes', type=int, default=0,
+                        help='nodes of the lattice written by every run')
+    parser.add_argument('--port', type=int, default=8130,
+                        help='API port of the benchmarked server')
+    args = parser.parse_args(argv)
+
+    env = dict(os.environ,
+               SIMPHONY_SYNTHETIC_ITEM_TIME=repr(args.item_time),
+               SIMPHONY_SYNTHETIC_OUTPUT_NODES=str(args.output_nodes))
+    server = subprocess.Popen([sys.executable, '-m', 'simphony_network.server',
+                               '--ip', '127.0.0.1',
+                               '--api-port', str(args.port),
+                               '--pub-port', str(args.port + 1),
+                               '--metrics-port', str(args.port + 2)],
+                              env=env)
+    try:
+        if not wait_ready('tcp://127.0.0.1:%s' % args.port):
+            raise RuntimeError('Server did not start.')
+        for container_type in args.types:
+            for size in args.sizes:
+                result = measure(server.pid, args.port, container_type, size,
+                                 args.steps, args.repeat)
+                result['item_time'] = args.item_time
+                result['output_nodes'] = args.output_nodes
+                print json.dumps(result, sort_keys=True)
+                sys.stdout.flush()
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == '__main__':
+    main()
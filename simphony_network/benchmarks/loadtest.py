@@ -0,0 +1,328 @@
+"""
+This module is part of simphony-network package.
+
+Load test of a SimPhoNy server with many concurrent clients.
+
+A local server is started, then client processes run many simulated
+clients, one connection each. Every simulated client submits jobs at
+random intervals, at a given mean rate, whether or not its previous jobs
+are finished. By default a job creates a wrapper of the synthetic engine,
+runs it, polls its state until it is finished, fetches its dataset and
+deletes it. With `--mix` jobs are drawn from a weighted mix of that
+lifecycle and single read calls on a wrapper every simulated client keeps.
+
+The load is raised step by step. For every rate a JSON line reports the
+achieved throughput over the measured wall time, including the grace
+period jobs took to finish, the p50, p99 and p999 latency of every method,
+and the rates of errors, call timeouts and heartbeat timeouts, i.e. clients
+which lost the connection. The last line tells the saturation throughput:
+the highest throughput reached and the first rate the server could not
+keep up with, i.e. which left more than a tenth of the jobs unfinished.
+
+Usage::
+
+    python -m simphony_network.benchmarks.loadtest --rates 10 50 100 200
+    python -m simphony_network.benchmarks.loadtest \
+        --mix lifecycle=1 get_wrapper_state=8 get_dataset=1
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import subprocess
+import multiprocessing
+
+from .throughput import wait_ready
+from .e2e import ENGINE, DATASET
+
+# Methods of a job, in the order they are called
+METHODS = ('create_wrapper', 'run_wrapper', 'get_wrapper_state',
+           'get_dataset', 'delete_wrapper')
+
+# Single calls a job of the mix may be, with the arguments they are given
+# after the id of the kept wrapper
+CALLS = {'get_wrapper_state': (),
+         'get_dataset': (DATASET,),
+         'get_wrapper_stats': ()}
+
+# Job of the mix running the whole lifecycle of a wrapper
+LIFECYCLE = 'lifecycle'
+
+
+def parse_mix(items):
+    """Return the weight of every job of the given `name=weight` items"""
+    mix = {}
+    for item in items:
+        name, _, weight = item.partition('=')
+        if name != LIFECYCLE and name not in CALLS:
+            raise ValueError('Unknown job %s, choose from %s.'
+                             % (name, ', '.join((LIFECYCLE,) +
+                                                tuple(sorted(CALLS)))))
+        mix[name] = float(weight or 1)
+        if mix[name] < 0:
+            raise ValueError('Negative weight of %s.' % name)
+    if not sum(mix.values()):
+        raise ValueError('The mix has no weight.')
+    return mix
+
+
+def _choose(mix):
+    """Return a job of the mix, drawn by weight"""
+    point = random.uniform(0, sum(mix.values()))
+    for name, weight in sorted(mix.items()):
+        point -= weight
+        if point <= 0 and weight:
+            return name
+    return name
+
+
+def percentile(values, q):
+    """Return the q-th percentile of sorted values, or None if empty"""
+    if not values:
+        return None
+    return values[min(int(len(values) * q / 100.0), len(values) - 1)]
+
+
+def _submission(size, steps):
+    """Return the pickled CUDS of every job"""
+    from simphony.core.cuba import CUBA
+    from simphony.core.data_container import DataContainer
+    from simphony.cuds.lattice import make_cubic_lattice
+    from cloud.serialization import cloudpickle as pickle
+    from ..model import CUDS
+
+    cm = DataContainer()
+    cm[CUBA.NUMBER_OF_TIME_STEPS] = steps
+    cuds = CUDS(cm=cm)
+    cuds.SD[DATASET] = make_cubic_lattice(DATASET, 1.0, (size, 1, 1))
+    return pickle.dumps(cuds)
+
+
+def _client(args):
+    """Run simulated clients for the duration, return what they saw"""
+    (endpoint, clients, rate, duration, grace, poll_interval, size, steps,
+     call_timeout, heartbeat, mix) = args
+    import gevent
+    import zerorpc
+    from ..constants import FINISHED_STATES
+
+    cuds = _submission(size, steps)
+    latencies = dict((method, []) for method in METHODS + tuple(CALLS))
+    counts = {'jobs': 0, 'finished': 0, 'calls': 0, 'errors': 0,
+              'timeouts': 0, 'heartbeat_timeouts': 0}
+
+    def call(client, method, *args):
+        start = time.time()
+        try:
+            result = client(method, *args)
+        except zerorpc.LostRemote:
+            counts['heartbeat_timeouts'] += 1
+            raise
+        except zerorpc.TimeoutExpired:
+            counts['timeouts'] += 1
+            raise
+        except Exception:
+            counts['errors'] += 1
+            raise
+        latencies[method].append(time.time() - start)
+        counts['calls'] += 1
+        return result
+
+    def job(client, name, kept_id):
+        counts['jobs'] += 1
+        try:
+            if name != LIFECYCLE:
+                call(client, name, kept_id, *CALLS[name])
+                counts['finished'] += 1
+                return
+            wrapper_id = call(client, 'create_wrapper', ENGINE, cuds)
+            call(client, 'run_wrapper', wrapper_id, None)
+            while call(client, 'get_wrapper_state',
+                       wrapper_id) not in FINISHED_STATES:
+                gevent.sleep(poll_interval)
+            call(client, 'get_dataset', wrapper_id, DATASET)
+            call(client, 'delete_wrapper', wrapper_id)
+        except Exception:
+            # Counted by call
+            return
+        counts['finished'] += 1
+
+    def connect():
+        """Connect a client and run the wrapper its single calls go to"""
+        client = zerorpc.Client(endpoint, timeout=call_timeout,
+                                heartbeat=heartbeat)
+        if not set(mix) - set([LIFECYCLE]):
+            return client, None
+        wrapper_id = client('create_wrapper', ENGINE, cuds)
+        client('run_wrapper', wrapper_id, None)
+        while client('get_wrapper_state', wrapper_id) not in FINISHED_STATES:
+            gevent.sleep(poll_interval)
+        return client, wrapper_id
+
+    def simulated_client(client, kept_id, jobs):
+        deadline = time.time() + duration
+        while True:
+            gevent.sleep(random.expovariate(rate))
+            if time.time() >= deadline:
+                break
+            jobs.append(gevent.spawn(job, client, _choose(mix), kept_id))
+
+    # Connecting is not measured
+    connections = [g.value for g in gevent.joinall(
+        [gevent.spawn(connect) for _ in range(clients)], raise_error=True)]
+    jobs = []
+    start = time.time()
+    gevent.joinall([gevent.spawn(simulated_client, client, kept_id, jobs)
+                    for client, kept_id in connections])
+    # Jobs which are not done within the grace period count as unfinished
+    gevent.joinall(jobs, timeout=grace)
+    gevent.killall(jobs)
+    elapsed = time.time() - start
+    for client, kept_id in connections:
+        if kept_id is not None:
+            client('delete_wrapper', kept_id)
+    return latencies, counts, elapsed
+
+
+def measure(port, processes, clients, rate, duration, grace, poll_interval,
+            size, steps, call_timeout, heartbeat, mix=None):
+    """Return the result line of the given total job rate.
+
+    Throughputs are taken over the wall time of the slowest client process,
+    from the first submission until its last job finished or the grace
+    period ended.
+    """
+    mix = mix or {LIFECYCLE: 1.0}
+    endpoint = 'tcp://127.0.0.1:%s' % port
+    total_clients = processes * clients
+    pool = multiprocessing.Pool(processes)
+    try:
+        results = pool.map(_client, [(endpoint, clients,
+                                      float(rate) / total_clients, duration,
+                                      grace, poll_interval, size, steps,
+                                      call_timeout, heartbeat,
+                                      mix)] * processes)
+    finally:
+        pool.terminate()
+
+    latencies = dict((method, []) for method in METHODS + tuple(CALLS))
+    counts = {}
+    wall_time = max(elapsed for _, _, elapsed in results)
+    for process_latencies, process_counts, _ in results:
+        for method, values in process_latencies.iteritems():
+            latencies[method].extend(values)
+        for name, value in process_counts.iteritems():
+            counts[name] = counts.get(name, 0) + value
+
+    failed = counts['errors'] + counts['timeouts'] + \
+        counts['heartbeat_timeouts']
+    attempted = counts['calls'] + failed
+    result = {'benchmark': 'loadtest',
+              'clients': total_clients,
+              'target_jobs_per_second': rate,
+              'mix': mix,
+              'wall_time': wall_time,
+              'jobs': counts['jobs'],
+              'finished_jobs': counts['finished'],
+              'jobs_per_second': float(counts['finished']) / wall_time,
+              'calls_per_second': float(counts['calls']) / wall_time,
+              'error_rate': float(counts['errors']) / attempted
+              if attempted else 0.0,
+              'timeout_rate': float(counts['timeouts']) / attempted
+              if attempted else 0.0,
+              'heartbeat_timeout_rate':
+              float(counts['heartbeat_timeouts']) / attempted
+              if attempted else 0.0,
+              'latency': {}}
+    for method in METHODS + tuple(sorted(CALLS)) + ('all',):
+        if method == 'all':
+            values = sorted(sum(latencies.values(), []))
+        else:
+            values = sorted(latencies[method])
+        result['latency'][method] = {'count': len(values),
+                                     'p50': percentile(values, 50),
+                                     'p99': percentile(values, 99),
+                                     'p999': percentile(values, 99.9)}
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Load test a server with many concurrent clients.')
+    parser.add_argument('--rates', type=float, nargs='+',
+                        default=[10, 50, 100, 200, 400],
+                        help='total jobs per second to submit, in steps')
+    parser.add_argument('--processes', type=int,
+                        default=multiprocessing.cpu_count(),
+                        help='number of client processes')
+    parser.add_argument('--clients', type=int, default=50,
+                        help='simulated clients per client process')
+    parser.add_argument('--duration', type=float, default=20,
+                        help='seconds to submit jobs at every rate')
+    parser.add_argument('--grace', type=float, default=10,
+                        help='seconds to wait for submitted jobs to finish')
+    parser.add_argument('--mix', nargs='+', default=[LIFECYCLE],
+                        metavar='JOB=WEIGHT',
+                        help='weighted mix of jobs, %s or single %s calls'
+                        % (LIFECYCLE, ', '.join(sorted(CALLS))))
+    parser.add_argument('--poll-interval', type=float, default=0.1,
+                        help='seconds between state polls of a job')
+    parser.add_argument('--size', type=int, default=1000,
+                        help='lattice nodes of every job')
+    parser.add_argument('--steps', type=int, default=10,
+                        help='time steps of every job')
+    parser.add_argument('--item-time', type=float, default=1e-7,
+                        help='CPU seconds per node and time step')
+    parser.add_argument('--call-timeout', type=float, default=30,
+                        help='seconds to wait for the answer to a call')
+    parser.add_argument('--heartbeat', type=float, default=5,
+                        help='seconds between heartbeats of every client')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='worker processes of the server')
+    parser.add_argument('--port', type=int, default=8140,
+                        help='API port of the tested server')
+    args = parser.parse_args(argv)
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+
+    env = dict(os.environ, SIMPHONY_SYNTHETIC_ITEM_TIME=repr(args.item_time))
+    server = subprocess.Popen([sys.executable, '-m', 'simphony_network.server',
+                               '--ip', '127.0.0.1',
+                               '--api-port', str(args.port),
+                               '--pub-port', str(args.port + 1),
+                               '--metrics-port', str(args.port + 2),
+                               '--workers', str(args.workers)],
+                              env=env)
+    saturation = {'benchmark': 'loadtest_saturation',
+                  'max_jobs_per_second': 0.0,
+                  'saturated_at': None}
+    try:
+        if not wait_ready('tcp://127.0.0.1:%s' % args.port):
+            raise RuntimeError('Server did not start.')
+        for rate in args.rates:
+            result = measure(args.port, args.processes, args.clients, rate,
+                             args.duration, args.grace, args.poll_interval,
+                             args.size, args.steps, args.call_timeout,
+                             args.heartbeat, mix)
+            result['workers'] = args.workers
+            print json.dumps(result, sort_keys=True)
+            sys.stdout.flush()
+            saturation['max_jobs_per_second'] = max(
+                saturation['max_jobs_per_second'], result['jobs_per_second'])
+            # Leaving more than a tenth of the jobs unfinished counts as
+            # saturated
+            if saturation['saturated_at'] is None and \
+                    result['finished_jobs'] < 0.9 * result['jobs']:
+                saturation['saturated_at'] = rate
+    finally:
+        server.terminate()
+        server.wait()
+    print json.dumps(saturation, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+This module is part of simphony-network package.
+
+Aggregate throughput of concurrent runs with and without CPU placement.
+
+A local server with one worker per concurrent job is started twice, once
+letting the runs move freely between cores and sockets and once pinning
+every run to CPUs of its own. Rounds of concurrent lattice jobs are run on
+each and the jobs finished per second are reported. Memory bound engines,
+e.g. the lattice-Boltzmann ones, gain the most on multi-socket nodes.
+
+Usage::
+
+    python -m simphony_network.benchmarks.placement --engine JYUEngine \
+        --jobs 8 --cores 2
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+import gevent
+from simphony.core.cuba import CUBA
+from simphony.core.data_container import DataContainer
+
+from ..model import CUDS
+from ..proxy import ProxyEngine
+from ..server import LocalFarm
+from .e2e import ENGINE, make_dataset
+
+
+def measure(endpoint, engine_type, jobs, rounds, size, steps, cores):
+    """Return the jobs finished per second by rounds of concurrent jobs"""
+    cm = DataContainer()
+    cm[CUBA.NUMBER_OF_TIME_STEPS] = steps
+    dataset = make_dataset('lattice', size)
+    start = time.time()
+    for _ in range(rounds):
+        engines = []
+        for _ in range(jobs):
+            engine = ProxyEngine(CUDS(cm=cm), engine_type, poll_interval=0.01,
+                                 **endpoint)
+            engine.add_dataset(dataset)
+            engines.append(engine)
+        results = [engine.run(async=True, cores=cores) for engine in engines]
+        gevent.joinall(results, raise_error=True)
+        for engine in engines:
+            engine.delete()
+    return float(jobs * rounds) / (time.time() - start)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Measure concurrent runs with and without CPU placement.')
+    parser.add_argument('--engine', default=ENGINE,
+                        help='engine type of the jobs')
+    parser.add_argument('--jobs', type=int, default=4,
+                        help='concurrent jobs, one worker process each')
+    parser.add_argument('--cores', type=int, default=1,
+                        help='CPUs every placed job is pinned to')
+    parser.add_argument('--rounds', type=int, default=3,
+                        help='rounds of concurrent jobs to measure')
+    parser.add_argument('--size', type=int, default=100000,
+                        help='lattice nodes of every job')
+    parser.add_argument('--steps', type=int, default=100,
+                        help='time steps of every job')
+    parser.add_argument('--item-time', type=float, default=1e-8,
+                        help='CPU seconds per node and time step of the '
+                             'synthetic engine')
+    parser.add_argument('--port', type=int, default=8150,
+                        help='API port of the benchmarked server')
+    args = parser.parse_args(argv)
+
+    os.environ['SIMPHONY_SYNTHETIC_ITEM_TIME'] = repr(args.item_time)
+    for placed in (False, True):
+        options = ['--cpu-placement'] if placed else []
+        with LocalFarm(1, base_port=args.port, workers=args.jobs,
+                       options=options) as farm:
+            jobs_per_second = measure(farm.endpoints[0], args.engine,
+                                      args.jobs, args.rounds, args.size,
+                                      args.steps, args.cores)
+        print json.dumps({'benchmark': 'placement',
+                          'engine': args.engine,
+                          'placement': placed,
+                          'jobs': args.jobs,
+                          'cores': args.cores if placed else None,
+                          'size': args.size,
+                          'steps': args.steps,
+                          'jobs_per_second': jobs_per_second},
+                         sort_keys=True)
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
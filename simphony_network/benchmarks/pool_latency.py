@@ -0,0 +1,90 @@
+"""
+This module is part of simphony-network package.
+
+Latency of short jobs with and without the warm wrapper pool.
+
+Every job creates a wrapper of an engine with an expensive constructor,
+runs a few steps and deletes the wrapper, all on an in-process manager.
+Without the pool every job pays for the construction; with `WRAPPER_POOL`
+the instances are built ahead of time and recycled through `reset`.
+
+Usage::
+
+    python -m simphony_network.benchmarks.pool_latency --init-time 0.2
+"""
+import json
+import time
+import argparse
+
+import gevent
+from simphony.core.cuba import CUBA
+from simphony.core.data_container import DataContainer
+from cloud.serialization import cloudpickle as pickle
+
+from ..constants import FINISHED_STATES
+from ..manager import SimphonyManager
+from ..model import CUDS
+from .synthetic import SyntheticEngine
+
+
+def _cuds(steps):
+    cm = DataContainer()
+    cm[CUBA.NUMBER_OF_TIME_STEPS] = steps
+    return CUDS(cm=cm)
+
+
+def measure(engine, pool_size, jobs, steps, cache_path=None):
+    """Return the seconds every job took from creation to deletion"""
+    manager = SimphonyManager({'ENGINE_CACHE': cache_path,
+                               'WRAPPER_POOL': {engine.__name__: pool_size}
+                               if pool_size else {}})
+    manager._registry.register(engine.__name__, engine)
+    manager.start()
+    # Let the pool fill before the first job
+    while manager._pool.sizes().get(engine.__name__, 0) < pool_size:
+        gevent.sleep(0.01)
+
+    cuds = pickle.dumps(_cuds(steps))
+    latencies = []
+    for _ in range(jobs):
+        start = time.time()
+        wrapper_id = manager.create_wrapper(engine.__name__, cuds)
+        manager.run_wrapper(wrapper_id)
+        while manager.get_wrapper_state(wrapper_id) not in FINISHED_STATES:
+            gevent.sleep(0)
+        manager.delete_wrapper(wrapper_id)
+        latencies.append(time.time() - start)
+    return latencies
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Compare the latency of short jobs with and without '
+                    'the warm wrapper pool.')
+    parser.add_argument('--init-time', type=float, default=0.2,
+                        help='seconds the engine constructor takes')
+    parser.add_argument('--pool-size', type=int, default=2,
+                        help='pooled instances of the engine')
+    parser.add_argument('--jobs', type=int, default=20,
+                        help='number of jobs to run one after another')
+    parser.add_argument('--steps', type=int, default=10,
+                        help='time steps of every job')
+    args = parser.parse_args(argv)
+
+    class SlowInitEngine(SyntheticEngine):
+        init_time = args.init_time
+
+    for pool_size in (0, args.pool_size):
+        latencies = sorted(measure(SlowInitEngine, pool_size,
+                                   args.jobs, args.steps))
+        print json.dumps({'benchmark': 'pool_latency',
+                          'pool_size': pool_size,
+                          'init_time': args.init_time,
+                          'jobs': args.jobs,
+                          'mean': sum(latencies) / len(latencies),
+                          'p50': latencies[len(latencies) // 2],
+                          'max': latencies[-1]})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+This module is part of simphony-network package.
+
+A synthetic modeling engine for the benchmarks. It does no physics, but
+burns CPU for a configurable time where real engines do expensive work.
+
+The engine is registered in the `simphony.engine` entry point, hence a
+server can run it like any other engine. As the server constructs engines
+without arguments, the engine is configured through the environment of
+the server process:
+
+- `SIMPHONY_SYNTHETIC_ITEM_TIME`: CPU seconds per dataset item, i.e.
+  lattice node, particle or mesh point, and time step
+- `SIMPHONY_SYNTHETIC_OUTPUT_NODES`: nodes of an `output` lattice every
+  run writes, no output lattice by default
+"""
+import os
+import time
+
+from simphony.core.cuba import CUBA
+from simphony.core.data_container import DataContainer
+from simphony.cuds.abc_modeling_engine import ABCModelingEngine
+from simphony.cuds.lattice import make_cubic_lattice
+
+from ..datasets import iter_items
+
+# Name of the lattice written by every run
+OUTPUT = 'output'
+
+
+def busy_wait(seconds):
+    """Keep the CPU busy for the given seconds, like a real computation"""
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        pass
+
+
+class SyntheticEngine(ABCModelingEngine):
+    """Engine whose construction costs `init_time` seconds of CPU.
+
+    Datasets are kept as they are given. Running advances the time step
+    counter, keeps the CPU busy for `item_time` seconds per dataset item
+    and time step and writes an `output` lattice of `output_nodes` nodes.
+    """
+    # Seconds spent in the constructor, e.g. allocating solvers
+    init_time = 0.0
+
+    # Seconds spent per dataset item and time step
+    item_time = float(os.environ.get('SIMPHONY_SYNTHETIC_ITEM_TIME', 0))
+
+    # Nodes of the lattice written by every run
+    output_nodes = int(os.environ.get('SIMPHONY_SYNTHETIC_OUTPUT_NODES', 0))
+
+    def __init__(self):
+        busy_wait(self.init_time)
+        self.reset()
+
+    def reset(self):
+        """Bring the engine back to its freshly constructed state"""
+        self.BC = DataContainer()
+        self.CM = DataContainer()
+        self.SP = DataContainer()
+        self._datasets = {}
+        # Number of items per dataset
+        self._items = {}
+        self.steps = 0
+
+    def run(self):
+        steps = self.CM.get(CUBA.NUMBER_OF_TIME_STEPS, 0)
+        if self.item_time:
+            busy_wait(self.item_time * sum(self._items.values()) * steps)
+        if self.output_nodes and OUTPUT not in self._datasets:
+            self._datasets[OUTPUT] = make_cubic_lattice(
+                OUTPUT, 1.0, (self.output_nodes, 1, 1))
+        self.steps += steps
+
+    def add_dataset(self, container):
+        if container.name in self._datasets:
+            raise ValueError('Dataset %s already exists.' % container.name)
+        self._datasets[container.name] = container
+        self._items[container.name] = sum(1 for _ in iter_items(container))
+
+    def get_dataset(self, name):
+        return self._datasets[name]
+
+    def remove_dataset(self, name):
+        del self._datasets[name]
+        self._items.pop(name, None)
+
+    def iter_datasets(self, names=None):
+        if names is None:
+            names = self._datasets.keys()
+        for name in names:
+            yield self._datasets[name]
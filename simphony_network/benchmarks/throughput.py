@@ -0,0 +1,118 @@
+"""
+This module is part of simphony-network package.
+
+Throughput of a SimPhoNy server as a function of its worker processes.
+
+For every requested worker count a local server is started, then several
+client processes flood it with serialization-heavy `echo` calls for a fixed
+duration. The number of answered requests per second is reported.
+
+Usage::
+
+    python -m simphony_network.benchmarks.throughput --workers 1 2 4 8
+"""
+import sys
+import json
+import time
+import argparse
+import subprocess
+import multiprocessing
+
+
+def _payload(size):
+    """Return a message which is expensive to (de)serialize"""
+    return [{'index': i, 'value': float(i), 'name': 'node-%s' % i}
+            for i in range(size)]
+
+
+def wait_ready(endpoint, timeout=30):
+    """Wait until the server at the given endpoint answers"""
+    import zerorpc
+    client = zerorpc.Client(endpoint, timeout=1)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            client.echo('ping')
+            return True
+        except zerorpc.TimeoutExpired:
+            pass
+    return False
+
+
+def _client(args):
+    """Call echo from several greenlets until the duration is over"""
+    endpoint, greenlets, duration, size = args
+    import gevent
+    import zerorpc
+
+    payload = _payload(size)
+    counts = []
+
+    def loop():
+        client = zerorpc.Client(endpoint)
+        done = 0
+        deadline = time.time() + duration
+        while time.time() < deadline:
+            client.echo(payload)
+            done += 1
+        counts.append(done)
+
+    gevent.joinall([gevent.spawn(loop) for _ in range(greenlets)])
+    return sum(counts)
+
+
+def measure(workers, port, clients, greenlets, duration, size):
+    """Return requests per second of a server with the given workers"""
+    endpoint = 'tcp://127.0.0.1:%s' % port
+    server = subprocess.Popen([sys.executable, '-m', 'simphony_network.server',
+                               '--ip', '127.0.0.1',
+                               '--api-port', str(port),
+                               '--pub-port', str(port + 1),
+                               '--workers', str(workers)])
+    pool = multiprocessing.Pool(clients)
+    try:
+        if not pool.apply(wait_ready, (endpoint,)):
+            raise RuntimeError('Server with %s workers did not start.' % workers)
+        start = time.time()
+        total = sum(pool.map(_client, [(endpoint, greenlets, duration, size)]
+                             * clients))
+        elapsed = time.time() - start
+    finally:
+        pool.terminate()
+        server.terminate()
+        server.wait()
+    return {'benchmark': 'throughput',
+            'workers': workers,
+            'clients': clients * greenlets,
+            'payload_items': size,
+            'requests': total,
+            'requests_per_second': total / elapsed}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Measure server throughput per number of workers.')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4],
+                        help='worker counts to measure')
+    parser.add_argument('--port', type=int, default=8120,
+                        help='API port of the benchmarked server')
+    parser.add_argument('--clients', type=int,
+                        default=multiprocessing.cpu_count(),
+                        help='number of client processes')
+    parser.add_argument('--greenlets', type=int, default=8,
+                        help='concurrent calls per client process')
+    parser.add_argument('--duration', type=float, default=10,
+                        help='seconds to measure every worker count')
+    parser.add_argument('--payload', type=int, default=1000,
+                        help='number of items in every message')
+    args = parser.parse_args(argv)
+
+    for workers in args.workers:
+        result = measure(workers, args.port, args.clients, args.greenlets,
+                         args.duration, args.payload)
+        print json.dumps(result)
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
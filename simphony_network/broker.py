@@ -0,0 +1,273 @@
+"""
+This module is part of simphony-network package.
+
+`WorkerBroker` spreads the API traffic of a SimPhoNy server over several
+pre-forked worker processes.
+
+Clients talk to the ROUTER socket of the broker as if it was a single
+zerorpc server. Every zerorpc call is a channel of events; the broker
+assigns each new channel to one worker and sends all the later events of
+that channel (heartbeats, stream flow control) to the same worker. Wrappers
+live in the memory of the worker which created them, hence the broker keeps
+the registry of wrapper and pipeline ids and their workers: any call whose
+first argument is a known id is routed to its owner, until it is deleted.
+
+Other calls go to the worker running the fewest wrappers, then to the one
+with the fewest open channels. A worker running an engine does not answer
+until the engine yields, however idle its channels look. The broker tells
+which wrappers run from the answers to `run_wrapper` and from the state
+events the workers publish.
+
+The broker also forwards the events published by the workers to the
+subscribers of the server through a XSUB/XPUB pair. It subscribes to all
+of them itself to follow the states of the wrappers.
+
+Channels whose client vanished are never closed by the worker. Clients
+send heartbeats on their open channels, hence channels without events
+from their client for `channel_timeout` seconds are dropped.
+"""
+import time
+import logging
+from collections import Counter
+
+import zmq.green as zmq
+import msgpack
+
+from . import constants
+
+# Events closing a channel
+FINAL_EVENTS = ('OK', 'ERR', 'STREAM_DONE')
+
+# Calls whose answer changes the registry or the running wrappers
+TRACKED_CALLS = ('create_wrapper', 'create_pipeline', 'run_wrapper',
+                 'delete_wrapper', 'delete_pipeline')
+
+
+def _peek(blob, arguments=1):
+    """Unpack the header, the name and the first arguments of an event.
+
+    Only the needed part of the event is unpacked, large payloads in the
+    remaining arguments are skipped.
+    """
+    unpacker = msgpack.Unpacker()
+    unpacker.feed(blob)
+    unpacker.read_array_header()
+    header = unpacker.unpack()
+    name = unpacker.unpack()
+    args = []
+    try:
+        count = unpacker.read_array_header()
+    except Exception:
+        # Arguments are not a list, e.g. a single streamed item
+        return header, name, args
+    for _ in range(min(count, arguments)):
+        args.append(unpacker.unpack())
+    return header, name, args
+
+
+def _created_ids(result):
+    """Return the ids in the answer of create_wrapper or create_pipeline"""
+    if isinstance(result, dict):
+        return [result['pipeline_id']] + result['wrappers'].values()
+    return [result]
+
+
+class WorkerBroker(object):
+    """Route zerorpc traffic between clients and worker processes.
+
+    Parameters
+    ----------
+    frontend: str
+        endpoint the clients connect to
+    workers: list of str
+        API endpoints of the workers
+    pub_frontend: str, optional
+        endpoint the subscribers connect to
+    pub_backend: str, optional
+        endpoint the publishers of the workers connect to
+    channel_timeout: float
+        seconds without events of a client after which its channels are
+        dropped
+    """
+    def __init__(self, frontend, workers, pub_frontend=None, pub_backend=None,
+                 channel_timeout=60):
+        self.logger = logging.getLogger('simphony')
+        self._context = zmq.Context()
+
+        self._frontend = self._context.socket(zmq.ROUTER)
+        self._frontend.bind(frontend)
+
+        self._workers = []
+        for endpoint in workers:
+            socket = self._context.socket(zmq.DEALER)
+            socket.connect(endpoint)
+            self._workers.append(socket)
+
+        # Open channels of every worker
+        self._load = [0] * len(self._workers)
+        # Worker to start looking for the least loaded one from
+        self._turn = 0
+        # Channel id to the worker serving it
+        self._channels = {}
+        # Channel id to the time of the last event of its client
+        self._last_seen = {}
+        self._channel_timeout = channel_timeout
+        # Channels of tracked calls to the method and its first argument
+        self._calls = {}
+        # Wrapper and pipeline ids to the worker owning them
+        self.registry = {}
+        # Pipeline id to the wrapper ids of its stages
+        self._pipelines = {}
+        # Running wrapper ids to their worker
+        self._running = {}
+        # Wrappers being started, False once their run finished already
+        self._starting = {}
+
+        self._xpub = self._xsub = None
+        if pub_frontend and pub_backend:
+            self._xpub = self._context.socket(zmq.XPUB)
+            self._xpub.bind(pub_frontend)
+            self._xsub = self._context.socket(zmq.XSUB)
+            self._xsub.bind(pub_backend)
+            # Subscribe to the events of all wrappers
+            self._xsub.send('\x01')
+
+    def _choose_worker(self, name, args):
+        """Pick the worker for a new channel"""
+        if args and isinstance(args[0], basestring) and \
+                args[0] in self.registry:
+            return self.registry[args[0]]
+        # Least loaded worker, ties are broken round-robin
+        running = Counter(self._running.itervalues())
+        count = len(self._workers)
+        start, self._turn = self._turn, (self._turn + 1) % count
+        return min([(start + i) % count for i in range(count)],
+                   key=lambda worker: (running[worker], self._load[worker]))
+
+    def _from_client(self, frames):
+        """Forward a message of a client to its worker"""
+        header, name, args = _peek(frames[-1])
+        channel = header.get('response_to')
+        if channel is None:
+            # A new call
+            channel = header['message_id']
+            worker = self._choose_worker(name, args)
+            self._channels[channel] = worker
+            self._load[worker] += 1
+            if name in TRACKED_CALLS:
+                target = args[0] if args else None
+                self._calls[channel] = (name, target)
+                if name == 'run_wrapper':
+                    self._starting[target] = True
+        elif channel in self._channels:
+            worker = self._channels[channel]
+        else:
+            # Events of already closed channels are dropped
+            return
+        self._last_seen[channel] = time.time()
+        self._workers[worker].send_multipart(frames)
+
+    def _from_worker(self, worker, frames):
+        """Forward a message of a worker to its client"""
+        header, name, args = _peek(frames[-1])
+        channel = header.get('response_to')
+        if name in FINAL_EVENTS and channel in self._channels:
+            self._close(channel)
+            if channel in self._calls:
+                self._answered(worker, self._calls.pop(channel),
+                               args[0] if name == 'OK' else None,
+                               name == 'OK')
+        self._frontend.send_multipart(frames)
+
+    def _close(self, channel):
+        """Forget a channel and release the load of its worker"""
+        worker = self._channels.pop(channel)
+        del self._last_seen[channel]
+        self._load[worker] -= 1
+
+    def _answered(self, worker, call, result, ok):
+        """Update the registry and the running wrappers after a call"""
+        name, target = call
+        if name == 'run_wrapper':
+            # Unless the run already finished before the answer
+            if self._starting.pop(target, False) and ok and \
+                    self._xsub is not None:
+                self._running[target] = worker
+        elif not ok:
+            return
+        elif name in ('create_wrapper', 'create_pipeline'):
+            for created in _created_ids(result):
+                self.registry[created] = worker
+            if isinstance(result, dict):
+                self._pipelines[result['pipeline_id']] = \
+                    result['wrappers'].values()
+        elif name == 'delete_wrapper':
+            self._forget(target)
+        elif name == 'delete_pipeline':
+            for wrapper_id in self._pipelines.pop(target, ()):
+                self._forget(wrapper_id)
+            self._forget(target)
+
+    def _forget(self, deleted):
+        """Drop a deleted wrapper or pipeline"""
+        self.registry.pop(deleted, None)
+        self._running.pop(deleted, None)
+
+    def _from_publisher(self, frames):
+        """Follow the states of the wrappers and forward their events"""
+        topic = frames[0]
+        if topic in self.registry:
+            for packed in frames[1:]:
+                event = msgpack.unpackb(packed)
+                if event.get('event') != \
+                        constants.WRAPPER_STATE_CHANGE_TOPIC:
+                    continue
+                if event['state'] == constants.WrapperState.running.value:
+                    self._running[topic] = self.registry[topic]
+                elif event['state'] in constants.FINISHED_STATES:
+                    self._running.pop(topic, None)
+                    if topic in self._starting:
+                        self._starting[topic] = False
+        self._xpub.send_multipart(frames)
+
+    def _drop_stale(self):
+        """Drop the channels whose client sent nothing for too long"""
+        expired = time.time() - self._channel_timeout
+        for channel, seen in self._last_seen.items():
+            if seen < expired:
+                self.logger.debug('Dropping channel %r of a vanished client.'
+                                  % channel)
+                self._close(channel)
+                call = self._calls.pop(channel, None)
+                if call and call[0] == 'run_wrapper':
+                    self._starting.pop(call[1], None)
+
+    def run(self):
+        """Route messages. Will run for ever."""
+        poller = zmq.Poller()
+        poller.register(self._frontend, zmq.POLLIN)
+        for socket in self._workers:
+            poller.register(socket, zmq.POLLIN)
+        if self._xpub is not None:
+            poller.register(self._xpub, zmq.POLLIN)
+            poller.register(self._xsub, zmq.POLLIN)
+
+        sweep = time.time() + self._channel_timeout / 2.0
+        while True:
+            for socket, _ in poller.poll(self._channel_timeout * 500):
+                if socket is self._frontend:
+                    self._from_client(socket.recv_multipart())
+                elif socket is self._xsub:
+                    self._from_publisher(socket.recv_multipart())
+                elif socket is self._xpub:
+                    # Subscriptions travel upstream to the workers, except
+                    # unsubscribing from all, which the broker needs
+                    frames = socket.recv_multipart()
+                    if frames != ['\x00']:
+                        self._xsub.send_multipart(frames)
+                else:
+                    self._from_worker(self._workers.index(socket),
+                                      socket.recv_multipart())
+            if time.time() > sweep:
+                self._drop_stale()
+                sweep = time.time() + self._channel_timeout / 2.0
@@ -0,0 +1,238 @@
+"""
+This module is part of simphony-network package.
+
+Checkpoints of wrappers and the persisted registry of a manager.
+
+Every wrapper has a directory below the checkpoint root. The CUDS a
+wrapper was created with is kept there as it was received, hence a wrapper
+can always be restarted from scratch. Its record in the registry of the
+manager is kept there too, hence a change of a wrapper only rewrites its
+own record. Checkpoints taken later store the
+BC, CM and SP containers pickled, and every lattice as one `.npy` file
+per attribute. Other datasets, whose topology is not captured by arrays,
+are pickled as a whole. Arrays are memory mapped when read back, so only
+the datasets and attributes which are actually used get loaded.
+
+A checkpoint is written to a new directory and becomes the latest one by
+atomically replacing the `latest` file, a crash while writing leaves the
+previous checkpoint intact.
+"""
+import os
+import json
+import errno
+import shutil
+import urllib
+
+import numpy as np
+from simphony.core.cuba import CUBA
+from simphony.cuds.lattice import ABCLattice
+from cloud.serialization import cloudpickle as pickle
+
+from .datasets import dataset_arrays, lattice_from_arrays
+from .serialization import loads_blob
+from .geometry import materialize
+
+# File names in the directory of a wrapper
+INITIAL_CUDS = 'cuds.pickle'
+LATEST = 'latest'
+META = 'meta.pickle'
+RECORD = 'record.json'
+
+
+def _makedirs(path):
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+
+def _write_atomic(path, data):
+    """Replace the content of a file, readers see the old or the new one"""
+    temp = '%s.tmp' % path
+    with open(temp, 'wb') as f:
+        f.write(data)
+    os.rename(temp, path)
+
+
+def _read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+class CheckpointStore(object):
+    """Checkpoints of wrappers below a root directory.
+
+    Parameters
+    ----------
+    root: str
+        directory to keep the checkpoints and the registry in
+    """
+    def __init__(self, root):
+        self.root = root
+        _makedirs(root)
+
+    def _path(self, wrapper_id, *parts):
+        return os.path.join(self.root, wrapper_id, *parts)
+
+    def _latest(self, wrapper_id):
+        """Return the directory of the latest checkpoint, or None"""
+        path = self._path(wrapper_id, LATEST)
+        if not os.path.exists(path):
+            return None
+        return self._path(wrapper_id, _read(path).strip())
+
+    def load_registry(self):
+        """Return the persisted registry, wrapper id to its description"""
+        registry = {}
+        for wrapper_id in os.listdir(self.root):
+            path = self._path(wrapper_id, RECORD)
+            if os.path.exists(path):
+                registry[wrapper_id] = json.loads(_read(path))
+        return registry
+
+    def save_record(self, wrapper_id, record):
+        """Persist the record of a wrapper, a JSON serializable dict"""
+        _makedirs(self._path(wrapper_id))
+        _write_atomic(self._path(wrapper_id, RECORD), json.dumps(record))
+
+    def save_initial(self, wrapper_id, pickled_cuds):
+        """Keep the pickled CUDS a wrapper was created with.
+
+        Also accepts a message of `serialization.dumps` joined into a string.
+        """
+        _makedirs(self._path(wrapper_id))
+        _write_atomic(self._path(wrapper_id, INITIAL_CUDS), pickled_cuds)
+
+    def save(self, wrapper_id, wrapper, step, total_steps):
+        """Checkpoint the current state of a wrapper.
+
+        Parameters
+        ----------
+        wrapper_id: str
+            uuid of the wrapper
+        wrapper: ABCModelingEngine
+            the engine to checkpoint
+        step: int
+            time steps of the current run which are done
+        total_steps: int
+            time steps of the current run
+
+        Returns
+        -------
+        str
+            directory of the new checkpoint
+        """
+        previous = self._latest(wrapper_id)
+        name = 'checkpoint-%s' % step
+        path = self._path(wrapper_id, name)
+        if path == previous:
+            name = '%s-%s' % (name, os.urandom(4).encode('hex'))
+            path = self._path(wrapper_id, name)
+        _makedirs(path)
+
+        datasets = {}
+        for dataset in wrapper.iter_datasets():
+            directory = urllib.quote(dataset.name, safe='')
+            dataset_path = os.path.join(path, directory)
+            os.mkdir(dataset_path)
+            if isinstance(dataset, ABCLattice):
+                arrays, keys, masks = dataset_arrays(dataset)
+                for attribute, array in arrays.iteritems():
+                    np.save(os.path.join(dataset_path, attribute + '.npy'),
+                            array)
+                for attribute, mask in masks.iteritems():
+                    np.save(os.path.join(dataset_path,
+                                         attribute + '.mask.npy'), mask)
+                datasets[dataset.name] = {
+                    'directory': directory,
+                    'keys': keys,
+                    'masks': list(masks),
+                    'lattice': (dataset.type, dataset.base_vect,
+                                dataset.size, dataset.origin)}
+            else:
+                with open(os.path.join(dataset_path, 'dataset.pickle'),
+                          'wb') as f:
+                    f.write(pickle.dumps(dataset))
+                datasets[dataset.name] = {'directory': directory}
+
+        meta = {'step': step,
+                'total_steps': total_steps,
+                'BC': wrapper.BC,
+                'CM': wrapper.CM,
+                'SP': wrapper.SP,
+                'datasets': datasets}
+        with open(os.path.join(path, META), 'wb') as f:
+            f.write(pickle.dumps(meta))
+
+        _write_atomic(self._path(wrapper_id, LATEST), name)
+        if previous is not None:
+            shutil.rmtree(previous, ignore_errors=True)
+        return path
+
+    def _meta(self, wrapper_id):
+        latest = self._latest(wrapper_id)
+        if latest is None:
+            return None, None
+        return latest, pickle.loads(_read(os.path.join(latest, META)))
+
+    def exists(self, wrapper_id):
+        """Tell whether a wrapper can be restored"""
+        return os.path.exists(self._path(wrapper_id, INITIAL_CUDS)) or \
+            self._latest(wrapper_id) is not None
+
+    def load_dataset(self, wrapper_id, name):
+        """Rebuild a single dataset of the latest checkpoint"""
+        latest, meta = self._meta(wrapper_id)
+        if meta is None:
+            # Never checkpointed, the dataset is as it was created
+            return materialize(loads_blob(
+                _read(self._path(wrapper_id, INITIAL_CUDS))).SD[name])
+        if name not in meta['datasets']:
+            raise KeyError('Dataset %s is not checkpointed.' % name)
+        return self._load_dataset(latest, name, meta['datasets'][name])
+
+    def _load_dataset(self, latest, name, description):
+        path = os.path.join(latest, description['directory'])
+        if 'lattice' not in description:
+            return pickle.loads(_read(os.path.join(path, 'dataset.pickle')))
+
+        keys = description['keys']
+        arrays = dict((attribute, np.load(os.path.join(path,
+                                                       attribute + '.npy'),
+                                          mmap_mode='r'))
+                      for attribute in keys)
+        masks = dict((attribute, np.load(os.path.join(path,
+                                                      attribute + '.mask.npy')))
+                     for attribute in description['masks'])
+        return lattice_from_arrays(name, description['lattice'], arrays, keys,
+                                   masks)
+
+    def restore(self, wrapper_id, wrapper):
+        """Bring a new engine instance to the state of the latest checkpoint.
+
+        Returns
+        -------
+        tuple
+            time steps done and total time steps of the checkpointed run,
+            both None when restored from the initial CUDS
+        """
+        latest, meta = self._meta(wrapper_id)
+        if meta is None:
+            cuds = loads_blob(_read(self._path(wrapper_id, INITIAL_CUDS)))
+            wrapper.BC, wrapper.CM, wrapper.SP = cuds.BC, cuds.CM, cuds.SP
+            for dataset in cuds.SD.itervalues():
+                wrapper.add_dataset(materialize(dataset))
+            return None, None
+
+        wrapper.BC, wrapper.CM, wrapper.SP = meta['BC'], meta['CM'], meta['SP']
+        if meta['total_steps'] is not None:
+            # Checkpoints within a run see the time steps of a single chunk
+            wrapper.CM[CUBA.NUMBER_OF_TIME_STEPS] = meta['total_steps']
+        for name, description in meta['datasets'].iteritems():
+            wrapper.add_dataset(self._load_dataset(latest, name, description))
+        return meta['step'], meta['total_steps']
+
+    def remove(self, wrapper_id):
+        """Drop all the checkpoints of a wrapper"""
+        shutil.rmtree(self._path(wrapper_id), ignore_errors=True)
@@ -3,14 +3,69 @@ This module is part of simphony-network package.
 
 Here are the constants that are being used in this package.
 """
+import os
+import logging
+import tempfile
+
 from enum import Enum
 
 # Wrapper state changes
 WRAPPER_STATE_CHANGE_TOPIC = 10014
 
+# Wrapper progress, e.g. number of time steps done
+WRAPPER_PROGRESS_TOPIC = 10015
+
 # Shout over the network
 PUBLISH_SIGNAL = 'publish'
 
+# Default configuration of a SimPhoNy application. User given
+# configuration is applied on top of these values.
+DEFAULT_CONFIG = {
+    'API_PORT': 8020,
+    'PUB_PORT': 8021,
+    'SERVER_IP': '0.0.0.0',
+    'LOG_LEVEL': logging.DEBUG,
+    # Number of worker processes serving the API
+    'WORKERS': 1,
+    # File caching the index of installed engines, no caching if None
+    'ENGINE_CACHE': os.path.join(os.path.expanduser('~'), '.cache',
+                                 'simphony-network', 'engines.json'),
+    # Root directory of the on-disk trajectory stores
+    'TRAJECTORY_DIR': os.path.join(tempfile.gettempdir(),
+                                   'simphony', 'trajectories'),
+    # Number of frames kept in each trajectory chunk file
+    'TRAJECTORY_CHUNK_FRAMES': 64,
+    # Directory to keep checkpoints and the wrapper registry in, wrappers
+    # do not survive restarts if not given
+    'CHECKPOINT_DIR': None,
+    # Engine type to the number of pre-constructed instances to keep ready
+    'WRAPPER_POOL': {},
+    # Local HTTP port serving the metrics, workers use the following ports.
+    # Metrics are not served over HTTP if None. Pick it outside the API and
+    # PUB ports of the servers of the node, which come in consecutive pairs.
+    'METRICS_IP': '127.0.0.1',
+    'METRICS_PORT': None,
+    # Pin every run to CPUs of its own, on a single NUMA node if possible
+    'CPU_PLACEMENT': False,
+    # Endpoint to report to once the server is ready or failed to start,
+    # and the id to report with, the host name by default
+    'READY_ENDPOINT': None,
+    'READY_ID': None,
+    # Number of chunks runs with a timeout but no chunk_steps are split
+    # into, the deadline is checked in between
+    'TIMEOUT_CHUNKS': 100,
+    # Seconds a dataset transfer between servers may take
+    'TRANSFER_TIMEOUT': 600,
+    # Seconds to collect published events before sending them in a batch
+    'PUB_BATCH_WINDOW': 0.05,
+    # Maximum number of messages queued for every subscriber
+    'PUB_HWM': 1000,
+}
+
+# Published events of these types are conflated, only the latest queued
+# one of every topic is sent.
+CONFLATED_EVENTS = (WRAPPER_PROGRESS_TOPIC,)
+
 
 # An enum to represent different states of a wrapper object
 class WrapperState(Enum):
@@ -22,3 +77,14 @@ class WrapperState(Enum):
     done = 'done'
     # `run` method call is failed
     failed = 'failed'
+    # Run is stopped by `cancel_wrapper`
+    cancelled = 'cancelled'
+    # Run is stopped as it passed its deadline
+    timed_out = 'timed_out'
+
+
+# States in which a wrapper will not change anymore
+FINISHED_STATES = (WrapperState.done.value,
+                   WrapperState.failed.value,
+                   WrapperState.cancelled.value,
+                   WrapperState.timed_out.value)
@@ -0,0 +1,150 @@
+"""
+This module is part of simphony-network package.
+
+Helpers to look at CUDS datasets (lattices, meshes and particle containers)
+as a set of flat numpy arrays, one array per CUBA attribute. Items are
+visited in the iteration order of the dataset, i.e. `iter_nodes` for
+lattices, `iter_particles` for particles and `iter_points` for meshes.
+"""
+import numpy as np
+
+from simphony.core.data_container import DataContainer
+from simphony.cuds.lattice import ABCLattice, Lattice
+from simphony.cuds.mesh import ABCMesh
+from simphony.cuds.particles import ABCParticles
+
+# Name of the pseudo attribute holding item coordinates of particles
+# and mesh points. It is lower case to never clash with a CUBA name.
+COORDINATES = 'coordinates'
+
+
+def iter_items(dataset):
+    """Iterate over the items of the given dataset.
+
+    Parameters
+    ----------
+    dataset: ABCLattice, ABCMesh or ABCParticles
+        the dataset to iterate over
+
+    Yields
+    ------
+    LatticeNode, Point or Particle
+    """
+    if isinstance(dataset, ABCLattice):
+        return dataset.iter_nodes()
+    elif isinstance(dataset, ABCParticles):
+        return dataset.iter_particles()
+    elif isinstance(dataset, ABCMesh):
+        return dataset.iter_points()
+    raise TypeError('Dataset type %s is not supported.' % type(dataset))
+
+
+def attribute_name(key):
+    """Return the name of the given CUBA key."""
+    return getattr(key, 'name', str(key))
+
+
+def dataset_arrays(dataset):
+    """Return the data of all items of a dataset as numpy arrays.
+
+    Parameters
+    ----------
+    dataset: ABCLattice, ABCMesh or ABCParticles
+        the dataset to convert
+
+    Returns
+    -------
+    arrays: dict
+        attribute name to an array whose first axis runs over the items
+    keys: dict
+        attribute name to the original CUBA key
+    masks: dict
+        attribute name to a boolean array telling which items carry the
+        attribute. Only attributes missing on some items are included.
+    """
+    items = list(iter_items(dataset))
+    count = len(items)
+    values = {}
+    keys = {}
+    coordinates = []
+    for position, item in enumerate(items):
+        for key, value in item.data.iteritems():
+            name = attribute_name(key)
+            keys[name] = key
+            values.setdefault(name, []).append((position, value))
+        if hasattr(item, 'coordinates'):
+            coordinates.append(item.coordinates)
+
+    arrays = {}
+    masks = {}
+    for name, pairs in values.iteritems():
+        stacked = np.asarray([value for _, value in pairs])
+        if len(pairs) == count:
+            arrays[name] = stacked
+            continue
+        # Attribute is missing on some items, pad them with zeros
+        positions = [position for position, _ in pairs]
+        array = np.zeros((count,) + stacked.shape[1:], dtype=stacked.dtype)
+        array[positions] = stacked
+        mask = np.zeros(count, dtype=bool)
+        mask[positions] = True
+        arrays[name] = array
+        masks[name] = mask
+
+    if coordinates and len(coordinates) == count:
+        arrays[COORDINATES] = np.asarray(coordinates, dtype=np.float64)
+
+    return arrays, keys, masks
+
+
+def _columns(arrays, keys, masks):
+    """Return the key, the per node values and the mask of every attribute.
+
+    Arrays are converted to lists at once, which is much faster than
+    indexing them node by node.
+    """
+    columns = []
+    for name, array in arrays.iteritems():
+        if array.ndim == 1:
+            values = array.tolist()
+        else:
+            # Rows of a copy, not of memory mapped files
+            values = list(np.array(array))
+        mask = masks[name].tolist() if name in masks else None
+        columns.append((keys[name], values, mask))
+    return columns
+
+
+def lattice_from_arrays(name, description, arrays, keys, masks):
+    """Build a lattice from arrays, the inverse of `dataset_arrays`.
+
+    SimPhoNy lattices keep a data container per node and have no way to
+    set an attribute of all nodes at once, hence the data is still set
+    node by node in Python. Only the conversion of the arrays is done in
+    bulk.
+
+    Parameters
+    ----------
+    name: str
+        name of the lattice
+    description: tuple
+        type, base vectors, size and origin of the lattice
+    arrays, keys, masks: dict
+        as returned by `dataset_arrays`
+
+    Returns
+    -------
+    Lattice
+    """
+    lattice = Lattice(name, *description)
+    columns = _columns(arrays, keys, masks)
+    nodes = []
+    for position, node in enumerate(lattice.iter_nodes()):
+        data = DataContainer()
+        for key, values, mask in columns:
+            if mask is None or mask[position]:
+                data[key] = values[position]
+        node.data = data
+        nodes.append(node)
+    lattice.update_nodes(nodes)
+    return lattice
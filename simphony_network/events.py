@@ -0,0 +1,81 @@
+"""
+This module is part of simphony-network package.
+
+Client side of the SimPhoNy publisher channel. `EventSubscriber` connects
+to the PUB socket of a running `SimphonyApplication` and receives the events
+of the topics it subscribed to, e.g. the progress of a remote wrapper.
+"""
+from collections import deque
+
+import gevent
+import zmq.green as zmq
+import msgpack
+# Monkey patching msgpack to support numpy arrays
+import msgpack_numpy as mn
+mn.patch()
+
+
+class EventSubscriber(object):
+    """Subscriber to the events published by a SimPhoNy server.
+
+    Parameters
+    ----------
+    host: str
+        the host running the SimPhoNy server
+    port: int
+        the publisher port of the server
+    topics: sequence of str
+        topics to subscribe to, e.g. wrapper ids
+    """
+    def __init__(self, host, port=8021, topics=()):
+        self._endpoint = "tcp://{host}:{port}".format(host=host, port=port)
+        self._socket = zmq.Context.instance().socket(zmq.SUB)
+        self._socket.connect(self._endpoint)
+        # Events received in a batch but not returned yet
+        self._received = deque()
+        for topic in topics:
+            self.subscribe(topic)
+
+    def subscribe(self, topic):
+        """Receive the events of the given topic.
+
+        Topics are matched as prefixes on the server side, hence events of
+        other wrappers never reach this subscriber.
+        """
+        self._socket.setsockopt(zmq.SUBSCRIBE, str(topic))
+
+    def unsubscribe(self, topic):
+        """Stop receiving the events of the given topic"""
+        self._socket.setsockopt(zmq.UNSUBSCRIBE, str(topic))
+
+    def recv(self, timeout=None):
+        """Receive the next event.
+
+        Parameters
+        ----------
+        timeout: float, optional
+            seconds to wait for an event, for ever by default
+
+        Returns
+        -------
+        tuple
+            (topic, event) or None if the timeout expired
+        """
+        if not self._received:
+            with gevent.Timeout(timeout, False):
+                # Every message is a batch of events of a single topic
+                frames = self._socket.recv_multipart()
+                topic = frames[0]
+                self._received.extend((topic, msgpack.unpackb(packed))
+                                      for packed in frames[1:])
+        if not self._received:
+            return None
+        return self._received.popleft()
+
+    def __iter__(self):
+        while True:
+            yield self.recv()
+
+    def close(self):
+        """Close the underlying socket"""
+        self._socket.close(linger=0)
@@ -33,7 +33,8 @@ def deploy():
 
 
 @task
-def start():
+def start(options=''):
     with cd('~/.virtualenvs/simphony'):
         with prefix('. ./bin/activate'):
-            run('simphony')
+            # The host name tells the servers apart in their ready reports
+            run('simphony %s --ready-id %s' % (options, env.host))
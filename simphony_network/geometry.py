@@ -0,0 +1,176 @@
+"""
+This module is part of simphony-network package.
+
+Compact descriptions of regular lattices, built on the server.
+
+Building a lattice node by node on the client and sending every node costs
+time proportional to its size. A `LatticeDescriptor` only holds the
+parameters of the lattice and a few rules assigning CUBA values to regions
+of it. It is added to a CUDS or an engine in place of the lattice, and the
+server builds the lattice with numpy when the wrapper is created, hence
+the upload costs the same whatever the size of the lattice. Only masks
+grow with it, they are packed to a bit per node. The server still sets
+the data of every node in Python, see `lattice_from_arrays`.
+"""
+import numpy as np
+
+from .datasets import attribute_name, lattice_from_arrays
+
+
+def _stop(last):
+    """Return the slice stop of an inclusive last index"""
+    if last is None or last == -1:
+        return None
+    return last + 1
+
+
+class LatticeDescriptor(object):
+    """Rules building a lattice with orthogonal base vectors.
+
+    Rules are applied in the order they are added, later ones overwrite the
+    values assigned by earlier ones. Nodes are numbered as by `iter_nodes`
+    of the lattice, i.e. the last index runs fastest.
+
+    Parameters
+    ----------
+    name: str
+        name of the lattice
+    size: tuple of int
+        number of nodes along every axis
+    spacing: float or tuple of float
+        distance between the nodes, along every axis if a tuple
+    origin: tuple of float
+        coordinates of the first node
+    lattice_type: str, optional
+        type of the lattice, `Cubic` if the spacing is equal along every
+        axis and `OrthoRhombic` otherwise by default
+    """
+    def __init__(self, name, size, spacing=1.0, origin=(0, 0, 0),
+                 lattice_type=None):
+        self.name = name
+        self.size = tuple(int(n) for n in size)
+        if np.isscalar(spacing):
+            spacing = (spacing,) * len(self.size)
+        self.base_vect = tuple(float(h) for h in spacing)
+        self.origin = tuple(float(x) for x in origin)
+        equal = len(set(self.base_vect)) == 1
+        if lattice_type is None:
+            lattice_type = 'Cubic' if equal else 'OrthoRhombic'
+        elif lattice_type in ('Cubic', 'Square') and not equal:
+            raise ValueError('%s lattice with unequal spacing %s.'
+                             % (lattice_type, self.base_vect))
+        self.type = lattice_type
+        self.rules = []
+
+    def assign(self, key, value, lower=None, upper=None, mask=None,
+               where=None):
+        """Assign a CUBA value to a region of the lattice.
+
+        The region is the intersection of the given conditions, the whole
+        lattice if none is given.
+
+        Parameters
+        ----------
+        key: CUBA
+            attribute to assign, e.g. `CUBA.MATERIAL_ID`
+        value: object
+            scalar or vector value of every node in the region
+        lower, upper: tuple, optional
+            first and last node index of a box, inclusive, along every
+            axis. None is unbounded, negative indices count from the end.
+        mask: array of bool, optional
+            nodes to assign, of the lattice size. Kept packed to a bit per
+            node.
+        where: tuple, optional
+            a key and a value, only nodes whose attribute was assigned that
+            value by an earlier rule
+
+        Returns
+        -------
+        LatticeDescriptor
+            itself, to chain rules
+        """
+        if mask is not None:
+            mask = np.asarray(mask, dtype=bool)
+            if mask.shape != self.size:
+                raise ValueError('Mask of shape %s does not match lattice '
+                                 'size %s.' % (mask.shape, self.size))
+            mask = np.packbits(mask.ravel())
+        if where is not None and attribute_name(where[0]) not in \
+                [attribute_name(rule['key']) for rule in self.rules]:
+            raise ValueError('No rule assigns %s before.'
+                             % attribute_name(where[0]))
+        for bounds in (lower, upper):
+            if bounds is not None and len(bounds) != len(self.size):
+                raise ValueError('Bounds %s do not match lattice size %s.'
+                                 % (bounds, self.size))
+        self.rules.append({'key': key,
+                           'value': value,
+                           'lower': lower,
+                           'upper': upper,
+                           'mask': mask,
+                           'where': where})
+        return self
+
+    def _region(self, rule, arrays, masks):
+        """Return which nodes a rule applies to, in node order"""
+        region = np.ones(self.size, dtype=bool)
+        if rule['lower'] is not None or rule['upper'] is not None:
+            lower = rule['lower'] or (None,) * len(self.size)
+            upper = rule['upper'] or (None,) * len(self.size)
+            box = np.zeros(self.size, dtype=bool)
+            box[tuple(slice(first, _stop(last))
+                      for first, last in zip(lower, upper))] = True
+            region &= box
+        region = region.ravel()
+        if rule['mask'] is not None:
+            region &= np.unpackbits(rule['mask'])[:len(region)].astype(bool)
+        if rule['where'] is not None:
+            key, value = rule['where']
+            name = attribute_name(key)
+            equal = arrays[name] == np.asarray(value)
+            if equal.ndim > 1:
+                # Vector attributes match on all components
+                equal = equal.reshape(len(equal), -1).all(axis=1)
+            region &= equal & masks[name]
+        return region
+
+    def materialize(self):
+        """Build the lattice by applying the rules.
+
+        Returns
+        -------
+        Lattice
+        """
+        count = int(np.prod(self.size))
+        arrays, keys, masks = {}, {}, {}
+        for rule in self.rules:
+            region = self._region(rule, arrays, masks)
+            name = attribute_name(rule['key'])
+            value = np.asarray(rule['value'])
+            keys[name] = rule['key']
+            if name not in arrays:
+                arrays[name] = np.zeros((count,) + value.shape,
+                                        dtype=value.dtype)
+                masks[name] = np.zeros(count, dtype=bool)
+            elif np.result_type(arrays[name], value) != arrays[name].dtype:
+                # e.g. a float assigned where integers were before
+                arrays[name] = arrays[name].astype(
+                    np.result_type(arrays[name], value))
+            arrays[name][region] = value
+            masks[name] |= region
+        # Only attributes missing on some nodes need a mask
+        masks = dict((name, mask) for name, mask in masks.iteritems()
+                     if not mask.all())
+        return lattice_from_arrays(self.name,
+                                   (self.type, self.base_vect, self.size,
+                                    self.origin),
+                                   arrays, keys, masks)
+
+
+def materialize(dataset):
+    """Return the dataset a descriptor describes, other datasets as they
+    are"""
+    if isinstance(dataset, LatticeDescriptor):
+        return dataset.materialize()
+    return dataset
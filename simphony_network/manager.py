@@ -4,51 +4,190 @@ This module is part of simphony-network package.
 Manager is responsible to handle incoming commands. Moreover,
 manager has to keep the state of existing wrappers.
 """
+import gc
+import copy
+import os
+import sys
+import time
+import resource
+import shutil
 import uuid
+import urllib
 import logging
-import pkg_resources
-import inspect
+from fractions import gcd
+from contextlib import contextmanager
 
 import gevent
-from simphony.cuds.abc_modeling_engine import ABCModelingEngine
+from blinker import signal
+from simphony.core.cuba import CUBA
 from cloud.serialization import cloudpickle as pickle
 
-from .constants import WrapperState
+from . import constants
+from . import serialization
+from . import placement
+from . import memory
+from .constants import WrapperState, DEFAULT_CONFIG
+from .datasets import dataset_arrays
+from .trajectory import TrajectoryStore
+from .registry import EngineRegistry
+from .warmpool import EnginePool
+from .checkpoint import CheckpointStore
+from .tracing import current_trace_id
+from .pipeline import Pipeline, STAGE_SKIPPED
+from .geometry import materialize
+from .pool import get_client
+
+
+def _new_stats():
+    """Return the resource accounting of a new wrapper"""
+    return {'created': time.time(),
+            # Seconds the engine spent running, wall clock and CPU
+            'run_time': 0.0,
+            'cpu_time': 0.0,
+            # Peak resident memory of the process while the engine ran
+            'max_rss': 0,
+            # Payload received with the CUDS and sent with the results
+            'bytes_in': 0,
+            'bytes_out': 0,
+            # Seconds spent pickling and unpickling CUDS and datasets
+            'serialization_time': 0.0,
+            # CPUs the latest run was pinned to, if placed
+            'cpus': None}
+
+
+def _max_rss():
+    """Return the peak resident memory of this process in bytes"""
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, OS X bytes
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+def _cpu_time():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+@contextmanager
+def _accounting(stats, cpus=None):
+    """Add the wall clock and CPU time of a block to the given stats.
+
+    Engines do not yield while running, hence the CPU time of the whole
+    process during the block belongs to the engine. If CPUs are given, the
+    block runs pinned to them.
+
+    Affinities belong to the OS thread, which all runs of a process share,
+    hence the thread is pinned anew for every chunk. This only places the
+    runs of different processes, i.e. of the workers of a server, apart:
+    runs within a process never run at once, the thread pools of OpenMP
+    engines keep the affinity they were started with, and memory touched
+    first in an earlier chunk stays on the node it was allocated on.
+    """
+    previous = placement.set_affinity(cpus) if cpus else None
+    start, cpu = time.time(), _cpu_time()
+    try:
+        yield
+    finally:
+        if previous:
+            placement.set_affinity(previous)
+        stats['run_time'] += time.time() - start
+        stats['cpu_time'] += _cpu_time() - cpu
+        stats['max_rss'] = max(stats['max_rss'], _max_rss())
 
 
 class SimphonyManager(object):
     """Middleware between public API and SimPhoNy framework"""
     def __init__(self, config):
-        self.config = config
+        self.config = dict(DEFAULT_CONFIG)
+        self.config.update(config or {})
         self.logger = logging.getLogger('simphony')
 
         # A dictionary store to keep created wrappers
         self._wrappers = {}
 
-        # This dictionary keeps results of aforementioned query. Name
-        # of wrapper class would be the key and the type (class) would
-        # be the value.
-        self._wrapper_mapping = {}
-
-        # Find any subclass of ABCModelingEngine which is loaded into
-        # `simphony.engine` entry point
-        self._find_wrappers()
-        logging.debug('Loaded SimPhoNy engines: %s' % self._wrapper_mapping)
-
-    def _find_wrappers(self):
-        """Find all the loaded wrappers in SimPhoNy entry point"""
-        # Load all entry points
-        for ep in pkg_resources.iter_entry_points(group="simphony.engine"):
-            # Load the modules
-            module = ep.load()
-            # Iterate over the module contents
-            for k, v in module.__dict__.iteritems():
-                # If the item is an Engine class add it to the mapping
-                if inspect.isclass(v) and issubclass(v, ABCModelingEngine):# \
-                        #and v not in (ABCModelingEngine, ProxyEngine):
-                    # Add the type to the mapping dictionary
-                    self._wrapper_mapping[k] = v
-        self.logger.info('%s wrappers loaded from simphony.engine entry points.' % len(self._wrapper_mapping))
+        # Pipelines of wrappers run within this server
+        self._pipelines = {}
+
+        # Index of the engines in `simphony.engine` entry point. Name of
+        # the wrapper class is the key, engine modules are only imported
+        # once a wrapper of them is created.
+        start = time.time()
+        self._registry = EngineRegistry(self.config['ENGINE_CACHE'])
+        self._registry.load()
+        self.logger.info('Engine registry loaded in %.3f s.' % (time.time() - start))
+        logging.debug('Indexed SimPhoNy engines: %s' % self._registry.names())
+
+        # Pre-constructed instances of the engines configured in WRAPPER_POOL
+        self._pool = EnginePool(self._registry, self.config['WRAPPER_POOL'])
+
+        # CPU sets of the runs, runs may use every CPU if None
+        self._placer = placement.CpuPlacer() \
+            if self.config['CPU_PLACEMENT'] else None
+
+        # Checkpoints and the persisted registry of the wrappers
+        self._checkpoints = None
+        if self.config['CHECKPOINT_DIR']:
+            self._checkpoints = CheckpointStore(self.config['CHECKPOINT_DIR'])
+            self._load_registry()
+
+    def start(self):
+        """Start background work, called once the process serves requests."""
+        self._pool.start()
+        # Resume the runs interrupted by the last shutdown
+        for wrapper_id, entry in self._wrappers.items():
+            if entry['state'] == WrapperState.running.value:
+                entry['greenlet'] = gevent.spawn(self._resume, wrapper_id)
+
+    def restrict_placement(self, index, count):
+        """Hand out only the share of the CPUs of the index-th of count
+        worker processes, so the runs of different workers do not share
+        CPUs either.
+        """
+        if self._placer is not None:
+            self._placer = self._placer.split(index, count)
+
+    def _resume(self, wrapper_id):
+        """Continue an interrupted run from the latest checkpoint"""
+        entry = self._wrappers[wrapper_id]
+        self._get_wrapper(wrapper_id)
+        self.logger.info('Resuming wrapper %s from step %s.'
+                         % (wrapper_id, entry['step']))
+        self._run(wrapper_id, entry['options'] or {}, entry['step'])
+
+    def _load_registry(self):
+        """Reload the wrappers known before the last shutdown.
+
+        Only the registry is read, the engines are restored from their
+        checkpoints once they are used.
+        """
+        start = time.time()
+        for wrapper_id, description in \
+                self._checkpoints.load_registry().iteritems():
+            wrapper_id = str(wrapper_id)
+            if not self._checkpoints.exists(wrapper_id):
+                continue
+            self._wrappers[wrapper_id] = {'wrapper': None,
+                                          'type': description['type'],
+                                          'state': description['state'],
+                                          'step': description['step'] or 0,
+                                          'options': description['options'],
+                                          'stats': description.get('stats') or
+                                          _new_stats(),
+                                          'trajectories': {}}
+        self.logger.info('%s wrappers reloaded in %.3f s.'
+                         % (len(self._wrappers), time.time() - start))
+
+    def _save_record(self, wrapper_id):
+        """Persist the registry record of a wrapper, if checkpointing is
+        enabled"""
+        if self._checkpoints is None:
+            return
+        entry = self._wrappers[wrapper_id]
+        self._checkpoints.save_record(wrapper_id,
+                                      {'type': entry['type'],
+                                       'state': entry['state'],
+                                       'step': entry.get('step'),
+                                       'options': entry.get('options'),
+                                       'stats': entry['stats']})
 
     def create_wrapper(self, wrapper_type,
                        cuds,
@@ -61,7 +200,8 @@ class SimphonyManager(object):
             one of the existing wrappers in simphony.engine
 
         cuds: CUDSModel
-            contains the following attributes
+            pickled, or a message of `serialization.dumps`. Contains the
+            following attributes
                 BC: DataContainer
                     boundary conditions
 
@@ -72,7 +212,8 @@ class SimphonyManager(object):
                     computational_methods
 
                 SD: dict
-                    contains CUDS datasets e.g. 'lattice', 'mesh' and 'particle'
+                    contains CUDS datasets e.g. 'lattice', 'mesh' and
+                    'particle', or a `LatticeDescriptor` of a lattice
 
         Returns
         -------
@@ -80,18 +221,33 @@ class SimphonyManager(object):
             a uuid string identifying the wrapper
         """
         # Check if wrapper is recognized
-        if wrapper_type not in self._wrapper_mapping:
+        if wrapper_type not in self._registry:
             self.logger.error('Wrapper %s is not registered.' % wrapper_type)
             raise Exception('Wrapper %s is not registered.' % wrapper_type)
 
         # Create a new uuid
         wrapper_id = uuid.uuid4()
+        created = time.time()
 
-        # Instantiate the wrapper
-        wrapper = self._wrapper_mapping[wrapper_type]()
+        # Take a ready instance from the pool or instantiate the wrapper
+        wrapper = self._pool.acquire(wrapper_type)
+        if wrapper is None:
+            wrapper = self._registry.get(wrapper_type)()
 
         # Unpickle cuds
-        cuds = pickle.loads(cuds)
+        stats = _new_stats()
+        start = time.time()
+        if isinstance(cuds, (list, tuple)):
+            # Large arrays came as frames of their own
+            stats['bytes_in'] += serialization.nbytes(cuds)
+            cuds_blob = serialization.join(cuds) \
+                if self._checkpoints is not None else None
+            cuds = serialization.loads(cuds)
+        else:
+            stats['bytes_in'] += len(cuds)
+            cuds_blob = cuds
+            cuds = pickle.loads(cuds)
+        stats['serialization_time'] += time.time() - start
 
         # Assign model data to the wrapper
         wrapper.BC = cuds.BC  # boundary_conditions
@@ -101,12 +257,24 @@ class SimphonyManager(object):
         # Report back
         self.logger.debug('Model data assigned to the wrapper %s' % wrapper_id)
 
-        # Add initial state data
+        # Add initial state data, lattices given by a descriptor are built
+        # here
         for ds in cuds.SD.itervalues():
-            wrapper.add_dataset(ds)
+            wrapper.add_dataset(materialize(ds))
 
         # Keep the reference to the wrapper
-        self._wrappers[str(wrapper_id)] = {'wrapper': wrapper}
+        self._wrappers[str(wrapper_id)] = {'wrapper': wrapper,
+                                           'type': wrapper_type,
+                                           'state': WrapperState.init.value,
+                                           'stats': stats,
+                                           'trace_id': current_trace_id(),
+                                           'spans': [],
+                                           'trajectories': {}}
+        self._span(str(wrapper_id), 'create', created, time.time())
+        if self._checkpoints is not None:
+            # The CUDS as it was received is enough to start over
+            self._checkpoints.save_initial(str(wrapper_id), cuds_blob)
+            self._save_record(str(wrapper_id))
 
         # Report back
         self.logger.info('Wrapper %s created for %s engine.' % (wrapper_id, wrapper_type))
@@ -115,9 +283,78 @@ class SimphonyManager(object):
         return str(wrapper_id)
 
     def _get_wrapper(self, wrapper_id):
-        return self._wrappers[wrapper_id]['wrapper']
+        """Return the engine of a wrapper, restoring it if needed"""
+        entry = self._wrappers[wrapper_id]
+        if entry['wrapper'] is None:
+            self._check_restorable(wrapper_id)
+            start = time.time()
+            wrapper = self._registry.get(entry['type'])()
+            step, _ = self._checkpoints.restore(wrapper_id, wrapper)
+            entry['wrapper'] = wrapper
+            entry['step'] = step or 0
+            self.logger.info('Wrapper %s restored at step %s in %.3f s.'
+                             % (wrapper_id, step, time.time() - start))
+        return entry['wrapper']
+
+    def _check_restorable(self, wrapper_id):
+        """Complain if the released engine of a wrapper can not be restored"""
+        if self._checkpoints is None or \
+                not self._checkpoints.exists(wrapper_id):
+            raise Exception('Wrapper[%s] is %s, its engine is released.'
+                            % (wrapper_id, self._wrappers[wrapper_id]['state']))
+
+    def checkpoint_wrapper(self, wrapper_id):
+        """Checkpoint the current state of the given wrapper.
 
-    def run_wrapper(self, wrapper_id):
+        Parameters
+        ----------
+        wrapper_id: str
+            uuid of the wrapper
+
+        Returns
+        -------
+        int
+            time steps of the current run which are done
+        """
+        if self._checkpoints is None:
+            raise Exception('Checkpoints are disabled, set CHECKPOINT_DIR.')
+        entry = self._wrappers[wrapper_id]
+        wrapper = self._get_wrapper(wrapper_id)
+        step = entry.get('step')
+        self._checkpoints.save(wrapper_id, wrapper, step,
+                               entry.get('total_steps'))
+        self._save_record(wrapper_id)
+        self.logger.debug('Checkpointed wrapper %s at step %s.'
+                          % (wrapper_id, step))
+        return step
+
+    def delete_wrapper(self, wrapper_id):
+        """Delete the given wrapper and its recorded trajectories.
+
+        The engine instance goes back to the pool if its type is pooled.
+
+        Parameters
+        ----------
+        wrapper_id: str
+            uuid of the wrapper
+        """
+        if wrapper_id not in self._wrappers:
+            raise Exception('Wrapper[%s] does not exist.' % wrapper_id)
+        entry = self._wrappers[wrapper_id]
+        if entry['state'] == WrapperState.running.value:
+            raise Exception('Wrapper[%s] is running.' % wrapper_id)
+
+        del self._wrappers[wrapper_id]
+        shutil.rmtree(os.path.join(self.config['TRAJECTORY_DIR'], wrapper_id),
+                      ignore_errors=True)
+        if self._checkpoints is not None:
+            self._checkpoints.remove(wrapper_id)
+        if entry['wrapper'] is not None and \
+                self._pool.release(entry['type'], entry['wrapper']):
+            self.logger.debug('Wrapper %s returned to the pool.' % wrapper_id)
+        self.logger.info('Wrapper %s deleted.' % wrapper_id)
+
+    def run_wrapper(self, wrapper_id, options=None):
         """Run the modeling engine recognized by the given id.
 
         Run the modeling engine using the configured settings (e.g. CM, BC,
@@ -128,12 +365,468 @@ class SimphonyManager(object):
         ----------
         wrapper_: str
             the modeling engine's id
+        options: dict, optional
+            run options, the following keys are recognized
+                record_every: int
+                    record a trajectory frame every given number of steps
+                record_datasets: list
+                    names of the datasets to record, all by default
+                progress_every: int
+                    publish a progress event every given number of steps
+                checkpoint_every: int
+                    checkpoint the wrapper every given number of steps and
+                    at the end of the run, needs CHECKPOINT_DIR
+                timeout: float
+                    seconds after which the run is stopped, between chunks
+                    of at most 1/TIMEOUT_CHUNKS of the steps
+                chunk_steps: int
+                    run at most the given number of steps at once, runs
+                    are only stopped in between
+                cores: int
+                    number of CPUs the run is pinned to, 1 by default.
+                    Runs wait until as many CPUs are free. Only honoured
+                    with CPU_PLACEMENT.
         """
-        wrapper = self._get_wrapper(wrapper_id)
-        g = gevent.spawn(wrapper.run)
-        self._wrappers[wrapper_id]['greenlet'] = g
+        options = options or {}
+        entry = self._wrappers[wrapper_id]
+        if self._placer is not None and \
+                not 0 < options.get('cores', 1) <= len(self._placer.cpus):
+            raise ValueError('Cannot run on %s of %s CPUs.'
+                             % (options['cores'], len(self._placer.cpus)))
+        entry['options'] = options
+        entry['submitted'] = time.time()
+        g = gevent.spawn(self._run, wrapper_id, options)
+        entry['greenlet'] = g
         gevent.sleep(0)
-        #self._wrappers[wrapper_id]['state'] = WrapperState.running.value
+
+    def _run(self, wrapper_id, options, start_step=0):
+        """Run the wrapper, optionally in chunks of time steps.
+
+        Engines run all of the NUMBER_OF_TIME_STEPS given in their CM on every
+        `run` call and continue from their current state. To record frames,
+        report progress or checkpoint in between, the run is split into
+        chunks by temporarily lowering NUMBER_OF_TIME_STEPS. Runs resumed
+        from a checkpoint start at `start_step`.
+
+        Engines do not yield while running, hence cancellations and
+        deadlines take effect between chunks. Runs with a timeout are split
+        into TIMEOUT_CHUNKS chunks if no smaller ones are asked for. With
+        CPU_PLACEMENT runs wait
+        for CPUs of their own first, they stay in the `init` state and can
+        be cancelled meanwhile.
+        """
+        entry = self._wrappers[wrapper_id]
+        wrapper = self._get_wrapper(wrapper_id)
+        record_every = options.get('record_every')
+        progress_every = options.get('progress_every')
+        checkpoint_every = options.get('checkpoint_every') \
+            if self._checkpoints is not None else None
+        chunk_steps = reduce(gcd, (record_every or 0, progress_every or 0,
+                                   checkpoint_every or 0,
+                                   options.get('chunk_steps') or 0))
+        entry['step'] = start_step
+        entry['total_steps'] = wrapper.CM[CUBA.NUMBER_OF_TIME_STEPS]
+        cpus = started = None
+        # A timeout of None never expires, it counts from the start of the
+        # run and not while it is queued
+        timeout = options.get('timeout')
+        if timeout and not chunk_steps:
+            chunk_steps = max(1, (entry['total_steps'] - start_step) //
+                              self.config['TIMEOUT_CHUNKS'])
+        deadline = gevent.Timeout(timeout)
+        try:
+            if self._placer is not None:
+                # Queued runs are cancelled while they wait here
+                cpus = self._placer.acquire(options.get('cores', 1))
+            entry['stats']['cpus'] = cpus
+            started = time.time()
+            if 'submitted' in entry:
+                self._span(wrapper_id, 'queue', entry.pop('submitted'),
+                           started)
+            self._set_state(wrapper_id, WrapperState.running.value)
+            deadline.start()
+            expires = time.time() + timeout if timeout else None
+            if not chunk_steps:
+                with _accounting(entry['stats'], cpus):
+                    wrapper.run()
+            else:
+                total = entry['total_steps']
+                start = time.time()
+                for step in self._iter_chunks(wrapper, chunk_steps,
+                                              entry['stats'], start_step,
+                                              cpus):
+                    entry['step'] = step
+                    if record_every and (step % record_every == 0 or
+                                         step == total):
+                        self._record_frames(wrapper_id,
+                                            step,
+                                            options.get('record_datasets'))
+                    if progress_every and (step % progress_every == 0 or
+                                           step == total):
+                        self._publish_progress(wrapper_id, step, total,
+                                               time.time() - start)
+                    if checkpoint_every and (step % checkpoint_every == 0 or
+                                             step == total):
+                        self.checkpoint_wrapper(wrapper_id)
+                    # The timer may not fire while chunks keep the loop busy
+                    if expires and time.time() > expires:
+                        raise deadline
+                    # Let other greenlets serve requests in between. Unlike
+                    # sleep(0), idle also lets pending timers and sockets in.
+                    gevent.idle()
+        except gevent.Timeout as e:
+            if e is not deadline:
+                raise
+            self._stop(wrapper_id, WrapperState.timed_out.value)
+            return
+        except gevent.GreenletExit:
+            self._stop(wrapper_id, WrapperState.cancelled.value)
+            return
+        except Exception:
+            self._set_state(wrapper_id, WrapperState.failed.value)
+            self.logger.exception('Wrapper %s failed.' % wrapper_id)
+            raise
+        finally:
+            deadline.cancel()
+            if cpus:
+                self._placer.release(cpus)
+            if started is not None:
+                self._span(wrapper_id, 'run', started, time.time())
+        entry['step'] = entry['total_steps'] = None
+        self._set_state(wrapper_id, WrapperState.done.value)
+
+    def _span(self, wrapper_id, name, start, end):
+        """Record a span of a traced wrapper"""
+        entry = self._wrappers[wrapper_id]
+        if entry.get('trace_id'):
+            entry.setdefault('spans', []).append({'name': name,
+                                                  'start': start,
+                                                  'end': end})
+
+    def get_wrapper_trace(self, wrapper_id):
+        """Return the spans recorded for the given wrapper.
+
+        Spans are only recorded for wrappers created by a traced call.
+
+        Parameters
+        ----------
+        wrapper_id: str
+            uuid of the wrapper
+
+        Returns
+        -------
+        dict
+            `trace_id` and the `spans` with their `name`, `start` and `end`
+            time on the server clock
+        """
+        entry = self._wrappers[wrapper_id]
+        return {'trace_id': entry.get('trace_id'),
+                'spans': list(entry.get('spans', []))}
+
+    def _stop(self, wrapper_id, state):
+        """Drop the engine of a stopped run to free its memory"""
+        entry = self._wrappers[wrapper_id]
+        # The engine may be in the middle of a chunk, it is not reusable
+        entry['wrapper'] = None
+        entry['trajectories'].clear()
+        entry['greenlet'] = None
+        gc.collect()
+        self._set_state(wrapper_id, state)
+        self.logger.info('Wrapper %s stopped at step %s, it is %s.'
+                         % (wrapper_id, entry['step'], state))
+
+    def cancel_wrapper(self, wrapper_id):
+        """Stop the run of the given wrapper and free its engine.
+
+        Runs are stopped between two chunks of time steps, see the
+        `chunk_steps` option of `run_wrapper`, queued runs right away.
+
+        Parameters
+        ----------
+        wrapper_id: str
+            uuid of the wrapper
+
+        Returns
+        -------
+        str
+            state of the wrapper, `cancelled` unless it was not running
+        """
+        entry = self._wrappers[wrapper_id]
+        greenlet = entry.get('greenlet')
+        if greenlet and not greenlet.dead:
+            # Runs still waiting for CPUs are stopped too. Wait until the
+            # run is stopped.
+            greenlet.kill()
+        return entry['state']
+
+    def create_pipeline(self, stages):
+        """Create the wrappers of a pipeline and run it.
+
+        Stages run as soon as the stages they take inputs from are done,
+        their input datasets are passed on in memory. Stages of failed
+        stages are skipped.
+
+        Parameters
+        ----------
+        stages: list of dict
+            name, type, cuds and optionally inputs and run options of every
+            stage, see `Pipeline`
+
+        Returns
+        -------
+        dict
+            `pipeline_id` and the `wrappers` of the stages, stage name to
+            wrapper id
+        """
+        pipeline = Pipeline(stages)
+        wrappers = {}
+        try:
+            for name in pipeline.order:
+                stage = pipeline.stages[name]
+                wrappers[name] = self.create_wrapper(stage['type'],
+                                                     stage['cuds'])
+        except Exception:
+            for wrapper_id in wrappers.itervalues():
+                self.delete_wrapper(wrapper_id)
+            raise
+
+        pipeline_id = str(uuid.uuid4())
+        self._pipelines[pipeline_id] = {'pipeline': pipeline,
+                                        'wrappers': wrappers,
+                                        'skipped': set(),
+                                        'state': WrapperState.running.value}
+        greenlets = {}
+        for name in pipeline.order:
+            greenlets[name] = gevent.spawn(
+                self._run_stage, pipeline_id, name,
+                [greenlets[source] for source in pipeline.upstream(name)])
+        gevent.spawn(self._finish_pipeline, pipeline_id, greenlets.values())
+        self.logger.info('Pipeline %s created with stages %s.'
+                         % (pipeline_id, ', '.join(pipeline.order)))
+        return {'pipeline_id': pipeline_id, 'wrappers': dict(wrappers)}
+
+    def _run_stage(self, pipeline_id, name, upstream):
+        """Run a stage once its upstream stages are done.
+
+        Returns
+        -------
+        bool
+            True if the wrapper of the stage is done
+        """
+        gevent.joinall(upstream)
+        entry = self._pipelines[pipeline_id]
+        if not all(greenlet.value for greenlet in upstream):
+            entry['skipped'].add(name)
+            return False
+
+        stage = entry['pipeline'].stages[name]
+        wrapper_id = entry['wrappers'][name]
+        try:
+            wrapper = self._get_wrapper(wrapper_id)
+            for source, dataset_name in stage['inputs']:
+                source_wrapper = self._get_wrapper(entry['wrappers'][source])
+                # Engines may keep what is added to them, copy so stages do
+                # not share datasets
+                wrapper.add_dataset(copy.deepcopy(
+                    source_wrapper.get_dataset(dataset_name)))
+        except Exception:
+            self.logger.exception('Passing the inputs of stage %s of pipeline '
+                                  '%s failed.' % (name, pipeline_id))
+            if wrapper_id in self._wrappers:
+                self._set_state(wrapper_id, WrapperState.failed.value)
+            return False
+
+        self.run_wrapper(wrapper_id, stage['options'])
+        self._wrappers[wrapper_id]['greenlet'].join()
+        return self._wrappers[wrapper_id]['state'] == WrapperState.done.value
+
+    def _finish_pipeline(self, pipeline_id, greenlets):
+        """Set the state of a pipeline once all its stages are finished"""
+        gevent.joinall(greenlets)
+        entry = self._pipelines[pipeline_id]
+        if all(greenlet.value for greenlet in greenlets):
+            entry['state'] = WrapperState.done.value
+        else:
+            entry['state'] = WrapperState.failed.value
+        self.logger.info('Pipeline %s is %s.' % (pipeline_id, entry['state']))
+
+    def get_pipeline_state(self, pipeline_id):
+        """Return the state of a pipeline and of its stages.
+
+        Parameters
+        ----------
+        pipeline_id: str
+            uuid of the pipeline
+
+        Returns
+        -------
+        dict
+            `state` of the pipeline, `running`, `done` or `failed`, and the
+            `stages`, stage name to its `wrapper_id` and `state`. Stages
+            whose upstream stages failed are `skipped`.
+        """
+        if pipeline_id not in self._pipelines:
+            raise KeyError('Pipeline[%s] does not exist.' % pipeline_id)
+
+        entry = self._pipelines[pipeline_id]
+        stages = {}
+        for name, wrapper_id in entry['wrappers'].iteritems():
+            if name in entry['skipped']:
+                state = STAGE_SKIPPED
+            elif wrapper_id in self._wrappers:
+                state = self._wrappers[wrapper_id]['state']
+            else:
+                state = None
+            stages[name] = {'wrapper_id': wrapper_id, 'state': state}
+        return {'state': entry['state'], 'stages': stages}
+
+    def delete_pipeline(self, pipeline_id):
+        """Delete a finished pipeline and the wrappers of its stages.
+
+        Parameters
+        ----------
+        pipeline_id: str
+            uuid of the pipeline
+        """
+        if pipeline_id not in self._pipelines:
+            raise KeyError('Pipeline[%s] does not exist.' % pipeline_id)
+        entry = self._pipelines[pipeline_id]
+        if entry['state'] == WrapperState.running.value:
+            raise Exception('Pipeline[%s] is running.' % pipeline_id)
+
+        del self._pipelines[pipeline_id]
+        for wrapper_id in entry['wrappers'].itervalues():
+            if wrapper_id in self._wrappers:
+                self.delete_wrapper(wrapper_id)
+        self.logger.info('Pipeline %s deleted.' % pipeline_id)
+
+    def _publish(self, wrapper_id, event, **kwargs):
+        """Publish an event about the given wrapper.
+
+        The wrapper id is used as the topic, hence subscribers can filter
+        events of the wrappers they are interested in.
+        """
+        signal(constants.PUBLISH_SIGNAL).send(self,
+                                              topic=wrapper_id,
+                                              event=event,
+                                              wrapper_id=wrapper_id,
+                                              **kwargs)
+
+    def _set_state(self, wrapper_id, state):
+        """Change the state of a wrapper and let the subscribers know"""
+        self._wrappers[wrapper_id]['state'] = state
+        self._save_record(wrapper_id)
+        self._publish(wrapper_id,
+                      constants.WRAPPER_STATE_CHANGE_TOPIC,
+                      state=state,
+                      stats=self._wrappers[wrapper_id]['stats'])
+
+    def _publish_progress(self, wrapper_id, step, total, elapsed):
+        """Publish the progress of a running wrapper"""
+        self._publish(wrapper_id,
+                      constants.WRAPPER_PROGRESS_TOPIC,
+                      state=self._wrappers[wrapper_id]['state'],
+                      step=step,
+                      total_steps=total,
+                      elapsed=elapsed,
+                      throughput=step / elapsed if elapsed else 0.0)
+
+    def _iter_chunks(self, wrapper, chunk_steps, stats, done=0, cpus=None):
+        """Run the wrapper in chunks of at most `chunk_steps` time steps.
+
+        The resources used by the engine are added to the given stats. If
+        CPUs are given, the engine is pinned to them while it runs.
+
+        Yields
+        ------
+        int
+            number of steps done so far
+        """
+        total = wrapper.CM[CUBA.NUMBER_OF_TIME_STEPS]
+        try:
+            while done < total:
+                steps = min(chunk_steps, total - done)
+                wrapper.CM[CUBA.NUMBER_OF_TIME_STEPS] = steps
+                with _accounting(stats, cpus):
+                    wrapper.run()
+                done += steps
+                yield done
+        finally:
+            wrapper.CM[CUBA.NUMBER_OF_TIME_STEPS] = total
+
+    def _get_trajectory(self, wrapper_id, name, create=False):
+        """Return the trajectory store of the given dataset."""
+        trajectories = self._wrappers[wrapper_id]['trajectories']
+        if name not in trajectories:
+            path = os.path.join(self.config['TRAJECTORY_DIR'],
+                                wrapper_id,
+                                urllib.quote(name, safe=''))
+            # Trajectories recorded before a restart are reopened from disk
+            if not create and not os.path.exists(path):
+                raise Exception('Dataset %s of wrapper %s has no trajectory.'
+                                % (name, wrapper_id))
+            trajectories[name] = TrajectoryStore(
+                path, self.config['TRAJECTORY_CHUNK_FRAMES'])
+        return trajectories[name]
+
+    def _record_frames(self, wrapper_id, step, names=None):
+        """Append the current state of the datasets to their trajectories"""
+        wrapper = self._get_wrapper(wrapper_id)
+        if names is None:
+            names = [ds.name for ds in wrapper.iter_datasets()]
+        for name in names:
+            arrays, _, _ = dataset_arrays(wrapper.get_dataset(name))
+            self._get_trajectory(wrapper_id, name, create=True).append(step,
+                                                                       arrays)
+        self.logger.debug('Recorded step %s of wrapper %s.' % (step, wrapper_id))
+
+    def get_trajectory_info(self, wrapper_id, name):
+        """Describe the recorded trajectory of a dataset.
+
+        Parameters
+        ----------
+        wrapper_id: str
+            the modeling engine's id
+        name: str
+            name of the dataset
+
+        Returns
+        -------
+        dict
+            number of frames, their time steps and the recorded attributes
+        """
+        store = self._get_trajectory(wrapper_id, name)
+        return {'frames': len(store),
+                'steps': store.steps,
+                'attributes': store.attributes}
+
+    def iter_trajectory(self, wrapper_id, name, start=0, stop=None,
+                        attributes=None):
+        """Iterate over recorded frames of a dataset.
+
+        Parameters
+        ----------
+        wrapper_id: str
+            the modeling engine's id
+        name: str
+            name of the dataset
+        start: int
+            first frame to return
+        stop: int, optional
+            frame to stop before
+        attributes: list of str, optional
+            names of the attributes to return, all of them by default
+
+        Yields
+        ------
+        dict
+            frame number, time step and attribute arrays of the frame
+        """
+        store = self._get_trajectory(wrapper_id, name)
+        stats = self._wrappers[wrapper_id]['stats']
+        for frame, step, arrays in store.iter_frames(start, stop, attributes):
+            stats['bytes_out'] += sum(a.nbytes for a in arrays.itervalues())
+            yield {'frame': frame, 'step': step, 'data': arrays}
 
     def add_dataset(self, wrapper_id, dataset):
         """Add a dataset to the correspoinding modeling engine
@@ -142,12 +835,77 @@ class SimphonyManager(object):
         ----------
         id: str
             the modeling engine's id
-        dataset : ABCLattice, ABCMesh or ABCParticles
-            dataset to be added.
+        dataset : ABCLattice, ABCMesh, ABCParticles or LatticeDescriptor
+            dataset to be added, pickled or a message of
+            `serialization.dumps`
         """
-        raise NotImplementedError()
+        entry = self._wrappers[wrapper_id]
+        if entry['state'] == WrapperState.running.value:
+            raise Exception('Wrapper[%s] is running.' % wrapper_id)
+
+        start = time.time()
+        if isinstance(dataset, (list, tuple)):
+            entry['stats']['bytes_in'] += serialization.nbytes(dataset)
+            dataset = serialization.loads(dataset)
+        else:
+            entry['stats']['bytes_in'] += len(dataset)
+            dataset = pickle.loads(dataset)
+        entry['stats']['serialization_time'] += time.time() - start
+        self._get_wrapper(wrapper_id).add_dataset(materialize(dataset))
+        if self._checkpoints is not None:
+            # The dataset is not part of the CUDS the wrapper started from
+            self.checkpoint_wrapper(wrapper_id)
+        self.logger.info('Dataset %s added to wrapper %s.'
+                         % (dataset.name, wrapper_id))
 
-    def get_dataset(self, wrapper_id, name):
+    def pull_dataset(self, wrapper_id, endpoint, source_wrapper_id, name):
+        """Fetch a dataset of a wrapper on another server and add it.
+
+        The data goes directly from server to server, large arrays in
+        frames of their own.
+
+        Parameters
+        ----------
+        wrapper_id: str
+            uuid of the wrapper to add the dataset to
+        endpoint: str
+            API endpoint of the other server, e.g. 'tcp://pc-116:8020'
+        source_wrapper_id: str
+            uuid of the wrapper on the other server
+        name: str
+            name of the dataset
+        """
+        if self._wrappers[wrapper_id]['state'] == WrapperState.running.value:
+            raise Exception('Wrapper[%s] is running.' % wrapper_id)
+
+        start = time.time()
+        message = get_client(endpoint)('get_dataset', source_wrapper_id, name,
+                                       True,
+                                       timeout=self.config['TRANSFER_TIMEOUT'])
+        self._span(wrapper_id, 'pull', start, time.time())
+        self.add_dataset(wrapper_id, message)
+
+    def push_dataset(self, wrapper_id, name, endpoint, target_wrapper_id):
+        """Send a dataset to a wrapper on another server.
+
+        Parameters
+        ----------
+        wrapper_id: str
+            uuid of the wrapper owning the dataset
+        name: str
+            name of the dataset
+        endpoint: str
+            API endpoint of the other server, e.g. 'tcp://pc-116:8020'
+        target_wrapper_id: str
+            uuid of the wrapper on the other server to add the dataset to
+        """
+        message = self.get_dataset(wrapper_id, name, True)
+        start = time.time()
+        get_client(endpoint)('add_dataset', target_wrapper_id, message,
+                             timeout=self.config['TRANSFER_TIMEOUT'])
+        self._span(wrapper_id, 'push', start, time.time())
+
+    def get_dataset(self, wrapper_id, name, out_of_band=False):
         """Get a dataset from the correspoinding modeling engine
 
         Parameters
@@ -156,20 +914,32 @@ class SimphonyManager(object):
             the modeling engine's id
         name: str
             name of the dataset
+        out_of_band: bool
+            return a message of `serialization.dumps` instead of a pickle
 
         Returns
         -------
         ABCMesh or ABCLattice or ABCParticles
+            pickled, or as a message
         """
-        wrapper = self._get_wrapper(wrapper_id)
-        dataset = wrapper.get_dataset(name)
-        logging.debug('going to pickle dataset %s before sending %s' % (name, dataset))
-        for node in dataset.iter_nodes():
-            print 'Node index: %s' % str(node.index)
-            print 'Node data: %s' % node.data
-        import pdb
-        #pdb.set_trace()
-        return pickle.dumps(dataset)
+        if self._wrappers[wrapper_id]['wrapper'] is None:
+            # Restored wrapper, only the requested dataset is loaded
+            self._check_restorable(wrapper_id)
+            dataset = self._checkpoints.load_dataset(wrapper_id, name)
+        else:
+            dataset = self._get_wrapper(wrapper_id).get_dataset(name)
+        logging.debug('going to pickle dataset %s before sending' % name)
+        start = time.time()
+        if out_of_band:
+            pickled = serialization.dumps(dataset)
+        else:
+            pickled = pickle.dumps(dataset)
+        stats = self._wrappers[wrapper_id]['stats']
+        stats['serialization_time'] += time.time() - start
+        self._span(wrapper_id, 'dataset_pickle', start, time.time())
+        stats['bytes_out'] += serialization.nbytes(pickled) \
+            if out_of_band else len(pickled)
+        return pickled
 
     def remove_dataset(self, wrapper_id, name):
         """Remove a dataset from the correspoinding modeling engine
@@ -183,6 +953,68 @@ class SimphonyManager(object):
         """
         raise NotImplementedError()
 
+    def get_wrapper_stats(self, wrapper_id):
+        """Return the resources used by the given wrapper so far.
+
+        `cpu_time` and `max_rss` are measured for the whole server process,
+        not per wrapper. `cpu_time` is the CPU time the process used while
+        the engine ran, including the threads of anything else running
+        then. `max_rss` is the peak of the process since it started, see
+        `get_wrapper_memory` for the memory of the wrapper itself.
+
+        Parameters
+        ----------
+        wrapper_id: str
+            uuid of the wrapper
+
+        Returns
+        -------
+        dict
+            `run_time` and `cpu_time` of the engine in seconds, `max_rss`
+            peak resident memory of the server process while the engine
+            ran in bytes, `bytes_in` and `bytes_out` of CUDS and results
+            transferred, `serialization_time` in seconds, and the `cpus`
+            the latest run was pinned to
+        """
+        if wrapper_id not in self._wrappers:
+            raise KeyError('Wrapper[%s] does not exist.' % wrapper_id)
+
+        return dict(self._wrappers[wrapper_id]['stats'])
+
+    def get_wrapper_memory(self, wrapper_id):
+        """Estimate the memory held by the given wrapper.
+
+        Sizes are found by walking the objects the engine and its datasets
+        refer to, counting the data of every array once. Engines which are
+        not loaded, e.g. after a restart, hold no memory and are not
+        loaded to find out.
+
+        Parameters
+        ----------
+        wrapper_id: str
+            uuid of the wrapper
+
+        Returns
+        -------
+        dict
+            bytes of every dataset as `datasets`, of the buffered frames of
+            its `trajectories`, and the `total` of the engine, its datasets
+            included. Memory shared by several datasets counts for each.
+        """
+        if wrapper_id not in self._wrappers:
+            raise KeyError('Wrapper[%s] does not exist.' % wrapper_id)
+
+        entry = self._wrappers[wrapper_id]
+        wrapper = entry['wrapper']
+        datasets = {}
+        if wrapper is not None:
+            for dataset in wrapper.iter_datasets():
+                datasets[dataset.name] = memory.deep_size(dataset)
+        return {'datasets': datasets,
+                'trajectories': memory.deep_size(entry['trajectories']),
+                'total': memory.deep_size(wrapper)
+                if wrapper is not None else 0}
+
     def get_wrapper_state(self, wrapper_id):
         """ Get the current state of the given wrapper.
 
@@ -197,14 +1029,6 @@ class SimphonyManager(object):
             state of the wrapper according to the WrapperState enum.
         """
         if wrapper_id not in self._wrappers:
-            raise Exception('Wrapper[%s] does not exist.' % wrapper_id)
+            raise KeyError('Wrapper[%s] does not exist.' % wrapper_id)
 
-        # Return proper state based on the greenlet state
-        if not self._wrappers[wrapper_id]['greenlet'].ready():
-            return WrapperState.init.value
-        elif self._wrappers[wrapper_id]['greenlet'].exception:
-            return WrapperState.failed.value
-        elif self._wrappers[wrapper_id]['greenlet'].successful():
-            return WrapperState.done.value
-        else:
-            return WrapperState.running.value
+        return self._wrappers[wrapper_id]['state']
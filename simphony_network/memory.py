@@ -0,0 +1,223 @@
+"""
+This module is part of simphony-network package.
+
+On-demand memory profiling of a running server.
+
+Python 2 has no `tracemalloc`, hence allocations are not traced as they
+happen. Instead a snapshot is a census of the live objects: the number and
+the estimated bytes of the objects of every type, found through the
+garbage collector. Diffing two snapshots tells which types grew, e.g.
+leaked wrappers, cached pickles or the arrays of an engine. Strings and
+arrays are not tracked by the garbage collector, they are found as the
+referents of the tracked objects.
+
+A census walks every object of the process and blocks the server while it
+runs, which takes about a second per few million objects.
+"""
+import gc
+import sys
+import time
+import types
+import resource
+from collections import OrderedDict
+
+import numpy as np
+
+# Objects a footprint does not follow, they belong to the whole process
+_SHARED_TYPES = (type, types.ClassType, types.ModuleType, types.FunctionType,
+                 types.BuiltinFunctionType, types.MethodType, types.CodeType,
+                 types.FrameType)
+
+
+def rss():
+    """Return the resident memory of this process in bytes"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except IOError:
+        # Peak instead of current, Linux reports KiB, OS X bytes
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+def _type_name(obj):
+    cls = type(obj)
+    if cls is types.InstanceType:
+        # Instances of old-style classes share a single type
+        cls = obj.__class__
+    return '%s.%s' % (cls.__module__, cls.__name__)
+
+
+def census():
+    """Return the count and bytes of the live objects of every type.
+
+    Returns
+    -------
+    dict
+        qualified type name to a `[count, bytes]` pair
+    """
+    counts = {}
+    seen = set()
+
+    def add(obj):
+        if id(obj) in seen:
+            return
+        seen.add(id(obj))
+        entry = counts.setdefault(_type_name(obj), [0, 0])
+        entry[0] += 1
+        # The size of an array includes its data, unless it is a view
+        entry[1] += sys.getsizeof(obj)
+
+    gc.collect()
+    tracked = gc.get_objects()
+    seen.add(id(tracked))
+    for obj in tracked:
+        add(obj)
+        for referent in gc.get_referents(obj):
+            if not gc.is_tracked(referent):
+                add(referent)
+                # The base of a view is not a referent of it
+                while isinstance(referent, np.ndarray) and \
+                        referent.base is not None:
+                    referent = referent.base
+                    add(referent)
+    return counts
+
+
+def deep_size(obj):
+    """Estimate the bytes held by an object and everything it refers to.
+
+    The data of an array is counted once, however many views share it.
+    Modules, classes and functions are not followed, as they are shared by
+    the whole process.
+    """
+    total = 0
+    seen = set()
+    pending = [obj]
+    while pending:
+        obj = pending.pop()
+        if id(obj) in seen or isinstance(obj, _SHARED_TYPES):
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, np.ndarray) and obj.base is not None:
+            pending.append(obj.base)
+        pending.extend(gc.get_referents(obj))
+    return total
+
+
+def _top(counts, limit):
+    return [{'type': name, 'count': count, 'bytes': size}
+            for name, (count, size) in
+            sorted(counts.iteritems(), key=lambda item: -item[1][1])[:limit]]
+
+
+class MemoryProfiler(object):
+    """Snapshots of the live objects of a process, see `census`.
+
+    Profiling is started with a baseline snapshot, which later snapshots
+    are compared to by default. Nothing is recorded in between, hence a
+    started profiler costs nothing but the memory of its snapshots.
+    """
+    def __init__(self):
+        self._snapshots = OrderedDict()
+        self._next_id = 0
+
+    @property
+    def started(self):
+        return bool(self._snapshots)
+
+    def _summary(self, snapshot_id, counts):
+        return {'snapshot_id': snapshot_id,
+                'rss': rss(),
+                'objects': sum(count for count, _ in counts.itervalues()),
+                'bytes': sum(size for _, size in counts.itervalues())}
+
+    def start(self):
+        """Drop earlier snapshots and take the baseline one.
+
+        Returns
+        -------
+        dict
+            `snapshot_id` of the baseline, `rss` of the process, and the
+            number of live `objects` and their `bytes`
+        """
+        self._snapshots.clear()
+        return self.snapshot()
+
+    def stop(self):
+        """Drop all snapshots"""
+        self._snapshots.clear()
+
+    def snapshot(self):
+        """Take a snapshot, returns its summary like `start`"""
+        snapshot_id = self._next_id
+        self._next_id += 1
+        counts = census()
+        self._snapshots[snapshot_id] = (time.time(), counts)
+        return self._summary(snapshot_id, counts)
+
+    def top(self, limit=10):
+        """Return the types of the live objects holding the most bytes.
+
+        Returns
+        -------
+        list of dict
+            `type`, `count` and `bytes` of every type, largest first
+        """
+        return _top(census(), limit)
+
+    def diff(self, old_id=None, new_id=None, limit=10):
+        """Compare two snapshots.
+
+        Parameters
+        ----------
+        old_id: int, optional
+            snapshot to compare to, the baseline by default
+        new_id: int, optional
+            snapshot to compare, the live objects by default
+        limit: int
+            number of types to return
+
+        Returns
+        -------
+        dict
+            `seconds` between the snapshots, `rss` of the process, and the
+            `types` which changed most in bytes. Every type has its `count`
+            and `bytes` in the new snapshot and their change as
+            `count_diff` and `bytes_diff`.
+
+        Raises
+        ------
+        KeyError
+            if profiling is not started or a snapshot does not exist
+        """
+        if not self.started:
+            raise KeyError('Memory profiling is not started.')
+        if old_id is None:
+            old_id = next(iter(self._snapshots))
+        if old_id not in self._snapshots or \
+                new_id is not None and new_id not in self._snapshots:
+            raise KeyError('Snapshot %s does not exist.'
+                           % (new_id if old_id in self._snapshots
+                              else old_id))
+        old_time, old = self._snapshots[old_id]
+        if new_id is None:
+            new_time, new = time.time(), census()
+        else:
+            new_time, new = self._snapshots[new_id]
+
+        changes = []
+        for name in set(old).union(new):
+            count, size = new.get(name, (0, 0))
+            old_count, old_size = old.get(name, (0, 0))
+            if (count, size) != (old_count, old_size):
+                changes.append({'type': name,
+                                'count': count,
+                                'bytes': size,
+                                'count_diff': count - old_count,
+                                'bytes_diff': size - old_size})
+        changes.sort(key=lambda change: -abs(change['bytes_diff']))
+        return {'seconds': new_time - old_time,
+                'rss': rss(),
+                'types': changes[:limit]}
@@ -0,0 +1,296 @@
+"""
+This module is part of simphony-network package.
+
+Server metrics in the Prometheus text exposition format.
+
+`RPCMetrics` instruments the methods of `SimphonyAPI` with call counts,
+calls in flight, latency and payload size histograms. `HubMonitor` samples
+how late the gevent hub wakes up a sleeping greenlet; long lags mean that
+something, e.g. a CPU-bound engine or a huge pickle, keeps the event loop
+from serving requests. The metrics are served over HTTP by
+`serve_metrics` and returned by the `get_metrics` RPC.
+"""
+import time
+import logging
+import functools
+
+import gevent
+from gevent.pywsgi import WSGIServer
+import numpy as np
+import zerorpc
+
+# Upper bounds of the buckets of latency histograms, in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Upper bounds of the buckets of payload size histograms, 1KiB to 1GiB
+SIZE_BUCKETS = tuple(1024 * 4 ** i for i in range(11))
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _format_labels(names, values, extra=()):
+    pairs = zip(names, values) + list(extra)
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, str(value).replace('"', '\\"'))
+                             for name, value in pairs)
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class _Metric(object):
+    """Values of a metric, one per combination of label values"""
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+
+    def _header(self):
+        return ['# HELP %s %s' % (self.name, self.help),
+                '# TYPE %s %s' % (self.name, self.kind)]
+
+    def render(self):
+        lines = self._header()
+        for values, value in sorted(self._values.iteritems()):
+            lines.append('%s%s %s' % (self.name,
+                                      _format_labels(self.labels, values),
+                                      _format_value(value)))
+        return lines
+
+
+class Counter(_Metric):
+    """A value which only goes up, e.g. the number of calls"""
+    kind = 'counter'
+
+    def inc(self, labels=(), amount=1):
+        labels = tuple(labels)
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(Counter):
+    """A value which goes up and down, e.g. the calls in flight"""
+    kind = 'gauge'
+
+    def dec(self, labels=(), amount=1):
+        self.inc(labels, -amount)
+
+    def set(self, labels=(), value=0):
+        self._values[tuple(labels)] = value
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets"""
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super(Histogram, self).__init__(name, help, labels)
+        self.buckets = tuple(buckets) + (float('inf'),)
+
+    def observe(self, labels=(), value=0):
+        labels = tuple(labels)
+        if labels not in self._values:
+            self._values[labels] = [[0] * len(self.buckets), 0.0, 0]
+        counts, _, _ = entry = self._values[labels]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        entry[1] += value
+        entry[2] += 1
+
+    def render(self):
+        lines = self._header()
+        for values, (counts, total, count) in sorted(self._values.iteritems()):
+            cumulative = 0
+            for bound, bucket in zip(self.buckets, counts):
+                cumulative += bucket
+                lines.append('%s_bucket%s %s' % (
+                    self.name,
+                    _format_labels(self.labels, values,
+                                   [('le', _format_value(bound))]),
+                    cumulative))
+            labels = _format_labels(self.labels, values)
+            lines.append('%s_sum%s %s' % (self.name, labels,
+                                          _format_value(total)))
+            lines.append('%s_count%s %s' % (self.name, labels, count))
+        return lines
+
+
+class MetricsRegistry(object):
+    """The metrics of a server process"""
+    def __init__(self):
+        self._metrics = []
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=()):
+        return self._add(Gauge(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def render(self):
+        """Return all the metrics in the Prometheus text format"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+def payload_size(value):
+    """Estimate the bytes of a payload from the strings and arrays in it"""
+    if value is None:
+        return 0
+    if isinstance(value, basestring):
+        return len(value)
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sum(payload_size(k) + payload_size(v)
+                   for k, v in value.iteritems())
+    if isinstance(value, (list, tuple)):
+        return sum(payload_size(item) for item in value)
+    # Numbers and the like
+    return 8
+
+
+class RPCMetrics(object):
+    """Metrics of the calls to the methods of an API object.
+
+    Parameters
+    ----------
+    registry: MetricsRegistry
+        registry to add the metrics to
+    """
+    def __init__(self, registry):
+        self.calls = registry.counter(
+            'simphony_rpc_calls_total',
+            'Finished RPC calls', ('method', 'status'))
+        self.in_flight = registry.gauge(
+            'simphony_rpc_in_flight',
+            'RPC calls being served', ('method',))
+        self.latency = registry.histogram(
+            'simphony_rpc_latency_seconds',
+            'Seconds from receiving an RPC call until its last reply',
+            ('method',))
+        self.request_bytes = registry.histogram(
+            'simphony_rpc_request_bytes',
+            'Estimated size of the RPC arguments', ('method',), SIZE_BUCKETS)
+        self.response_bytes = registry.histogram(
+            'simphony_rpc_response_bytes',
+            'Estimated size of the RPC results', ('method',), SIZE_BUCKETS)
+
+    def _start(self, name, args):
+        self.in_flight.inc((name,))
+        self.request_bytes.observe((name,), payload_size(args))
+        return time.time()
+
+    def _finish(self, name, start, status, size):
+        self.in_flight.dec((name,))
+        self.calls.inc((name, status))
+        self.latency.observe((name,), time.time() - start)
+        self.response_bytes.observe((name,), size)
+
+    def _wrap(self, name, method):
+        @functools.wraps(method)
+        def call(*args):
+            start = self._start(name, args)
+            status, size = 'error', 0
+            try:
+                result = method(*args)
+                status, size = 'ok', payload_size(result)
+                return result
+            finally:
+                self._finish(name, start, status, size)
+        return call
+
+    def _wrap_stream(self, name, method):
+        @functools.wraps(method)
+        def call(*args):
+            start = self._start(name, args)
+            status, size = 'error', 0
+            try:
+                for item in method(*args):
+                    size += payload_size(item)
+                    yield item
+                status = 'ok'
+            finally:
+                # Also runs when the client goes away mid-stream
+                self._finish(name, start, status, size)
+        return call
+
+    def instrument(self, api):
+        """Return the public methods of an API object, instrumented.
+
+        The returned dictionary can be served by a `zerorpc.Server`.
+        """
+        methods = {}
+        for name in dir(api):
+            method = getattr(api, name)
+            if name.startswith('_') or not callable(method):
+                continue
+            if isinstance(method, zerorpc.stream):
+                methods[name] = zerorpc.stream(self._wrap_stream(name,
+                                                                 method))
+            else:
+                methods[name] = self._wrap(name, method)
+        return methods
+
+
+class HubMonitor(object):
+    """Measure how long the gevent hub is kept from switching greenlets.
+
+    Parameters
+    ----------
+    registry: MetricsRegistry
+        registry to add the metrics to
+    interval: float
+        seconds between samples
+    """
+    def __init__(self, registry, interval=0.1):
+        self.interval = interval
+        self.lag = registry.histogram(
+            'simphony_hub_lag_seconds',
+            'Seconds a sleeping greenlet was woken up late')
+        self.blocked = registry.counter(
+            'simphony_hub_blocked_seconds_total',
+            'Seconds the hub was blocked for longer than the sample interval')
+
+    def run(self):
+        """Sample the lag of the hub. Will run for ever."""
+        while True:
+            start = time.time()
+            gevent.sleep(self.interval)
+            lag = max(time.time() - start - self.interval, 0.0)
+            self.lag.observe((), lag)
+            if lag > self.interval:
+                self.blocked.inc((), lag)
+
+
+def serve_metrics(registry, ip, port):
+    """Serve the metrics over HTTP at /metrics. Will run for ever."""
+    def application(environ, start_response):
+        if environ['PATH_INFO'] != '/metrics':
+            start_response('404 Not Found', [('Content-Type', 'text/plain')])
+            return ['Not found, see /metrics\n']
+        body = registry.render()
+        start_response('200 OK', [('Content-Type', CONTENT_TYPE),
+                                  ('Content-Length', str(len(body)))])
+        return [body]
+
+    logging.getLogger('simphony').info('Serving metrics at http://%s:%s/metrics'
+                                       % (ip, port))
+    WSGIServer((ip, port), application, log=None).serve_forever()
@@ -0,0 +1,87 @@
+"""
+This module is part of simphony-network package.
+
+Pipelines of engines, e.g. of a multi-scale workflow, run within a server.
+
+A pipeline is a DAG of stages. Every stage creates a wrapper from its own
+CUDS, and may take datasets of the wrappers of earlier stages as inputs.
+The manager runs a stage once all the stages it takes inputs from are
+done, and hands their datasets over in memory, without serializing them
+or sending them through the client.
+"""
+from collections import OrderedDict
+
+# State of the stages which did not run as an upstream stage failed
+STAGE_SKIPPED = 'skipped'
+
+
+class Pipeline(object):
+    """Validated description of a pipeline.
+
+    Parameters
+    ----------
+    stages: list of dict
+        every stage is a dictionary of
+            name: str
+                unique name of the stage
+            type: str
+                engine type of the wrapper
+            cuds: str or list
+                the CUDS of the wrapper, as accepted by `create_wrapper`
+            inputs: list, optional
+                pairs of a stage name and the name of one of its datasets,
+                which is added to the wrapper before it runs
+            options: dict, optional
+                run options of the wrapper, see `run_wrapper`
+
+    Raises
+    ------
+    ValueError
+        if a stage is malformed or the stages do not form a DAG
+    """
+    def __init__(self, stages):
+        self.stages = OrderedDict()
+        for stage in stages:
+            name = stage.get('name')
+            if not name or 'type' not in stage or 'cuds' not in stage:
+                raise ValueError('Stage %s needs a name, a type and a cuds.'
+                                 % name)
+            if name in self.stages:
+                raise ValueError('Stage %s is given twice.' % name)
+            self.stages[name] = {'type': stage['type'],
+                                 'cuds': stage['cuds'],
+                                 'inputs': [tuple(pair) for pair in
+                                            stage.get('inputs') or ()],
+                                 'options': stage.get('options') or {}}
+        if not self.stages:
+            raise ValueError('A pipeline needs at least one stage.')
+
+        for name, stage in self.stages.iteritems():
+            for source, _ in stage['inputs']:
+                if source not in self.stages:
+                    raise ValueError('Stage %s takes inputs of unknown stage '
+                                     '%s.' % (name, source))
+        self.order = self._sort()
+
+    def upstream(self, name):
+        """Return the names of the stages a stage takes inputs from"""
+        return sorted(set(source for source, _ in
+                          self.stages[name]['inputs']))
+
+    def _sort(self):
+        """Return the stage names in topological order"""
+        order = []
+        pending = OrderedDict((name, set(self.upstream(name)))
+                              for name in self.stages)
+        while pending:
+            ready = [name for name, upstream in pending.iteritems()
+                     if not upstream]
+            if not ready:
+                raise ValueError('Stages %s form a cycle.'
+                                 % ', '.join(pending))
+            for name in ready:
+                del pending[name]
+                for upstream in pending.itervalues():
+                    upstream.discard(name)
+            order.extend(ready)
+        return order
@@ -0,0 +1,193 @@
+"""
+This module is part of simphony-network package.
+
+Placement of engine runs on the CPUs of a node.
+
+Concurrent runs which are free to move between cores and sockets evict
+each other's caches and lose the bandwidth of their local memory. A
+`CpuPlacer` hands out disjoint CPU sets to the runs of a process and keeps
+every set on a single NUMA node where possible. The engine is pinned to its
+set while it runs.
+
+Affinities are per OS thread. The runs of a process take turns on its
+single thread, hence placement keeps apart the runs of different worker
+processes only, each worker placing its runs on its own share of the CPUs.
+
+Affinities are set with `sched_setaffinity` through the C library, which
+is Linux only. Elsewhere CPU sets are still handed out, but not enforced.
+"""
+import os
+import re
+import ctypes
+import ctypes.util
+import multiprocessing
+from collections import OrderedDict
+
+from gevent.event import Event
+
+# Directory the kernel describes the NUMA nodes in
+NODE_DIR = '/sys/devices/system/node'
+
+# Number of CPUs a cpu_set_t of the C library holds
+CPU_SETSIZE = 1024
+
+_libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+
+_Word = ctypes.c_ulong
+_CpuSet = _Word * (CPU_SETSIZE // (8 * ctypes.sizeof(_Word)))
+_WORD_BITS = 8 * ctypes.sizeof(_Word)
+
+
+def supported():
+    """Tell whether affinities can be set on this platform"""
+    return hasattr(_libc, 'sched_setaffinity')
+
+
+def _check(result):
+    if result != 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno))
+
+
+def get_affinity():
+    """Return the CPUs the calling thread may run on"""
+    if not supported():
+        return range(multiprocessing.cpu_count())
+    mask = _CpuSet()
+    _check(_libc.sched_getaffinity(0, ctypes.sizeof(mask), ctypes.byref(mask)))
+    return [cpu for cpu in range(CPU_SETSIZE)
+            if mask[cpu // _WORD_BITS] >> (cpu % _WORD_BITS) & 1]
+
+
+def set_affinity(cpus):
+    """Pin the calling thread to the given CPUs.
+
+    Threads it starts afterwards, e.g. the OpenMP threads of an engine,
+    inherit the affinity.
+
+    Returns
+    -------
+    list
+        the CPUs the thread could run on before, or None if affinities are
+        not supported
+    """
+    if not supported():
+        return None
+    previous = get_affinity()
+    mask = _CpuSet()
+    for cpu in cpus:
+        mask[cpu // _WORD_BITS] |= 1 << (cpu % _WORD_BITS)
+    _check(_libc.sched_setaffinity(0, ctypes.sizeof(mask), ctypes.byref(mask)))
+    return previous
+
+
+def parse_cpulist(text):
+    """Return the CPUs of a kernel CPU list, e.g. `0-3,8`"""
+    cpus = []
+    for part in text.strip().split(','):
+        if not part:
+            continue
+        first, _, last = part.partition('-')
+        cpus.extend(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def numa_nodes(root=NODE_DIR):
+    """Return the CPUs of every NUMA node, empty if they are not known"""
+    nodes = OrderedDict()
+    try:
+        names = os.listdir(root)
+    except OSError:
+        return nodes
+    for name in sorted(names):
+        match = re.match(r'node(\d+)$', name)
+        if match:
+            with open(os.path.join(root, name, 'cpulist')) as f:
+                nodes[int(match.group(1))] = parse_cpulist(f.read())
+    return OrderedDict(sorted(nodes.items()))
+
+
+class CpuPlacer(object):
+    """Hands out disjoint CPU sets to the concurrent runs of a process.
+
+    Parameters
+    ----------
+    cpus: list, optional
+        CPUs to hand out, those the process may run on by default
+    nodes: dict, optional
+        NUMA node to its CPUs, read from the kernel by default
+    """
+    def __init__(self, cpus=None, nodes=None):
+        self.cpus = sorted(get_affinity() if cpus is None else cpus)
+        if nodes is None:
+            nodes = numa_nodes()
+        allowed = set(self.cpus)
+        # Only the allowed CPUs of every node, in node order
+        self.nodes = [sorted(allowed.intersection(node_cpus))
+                      for node_cpus in nodes.itervalues()]
+        self.nodes = [node for node in self.nodes if node]
+        unknown = allowed.difference(*self.nodes)
+        if unknown:
+            self.nodes.append(sorted(unknown))
+        self._free = set(self.cpus)
+        self._released = Event()
+
+    def split(self, index, count):
+        """Return the placer of the index-th of count processes sharing
+        these CPUs, e.g. of the workers of a server.
+
+        CPUs are split in node order, hence the share of a process spans
+        as few nodes as possible.
+        """
+        ordered = sum(self.nodes, [])
+        share = ordered[len(ordered) * index // count:
+                        len(ordered) * (index + 1) // count]
+        if not share:
+            # More processes than CPUs, some have to share
+            share = [ordered[index % len(ordered)]]
+        return CpuPlacer(share, OrderedDict(enumerate(self.nodes)))
+
+    def free(self):
+        """Return the number of CPUs not handed out"""
+        return len(self._free)
+
+    def _pick(self, cores):
+        free = [[cpu for cpu in node if cpu in self._free]
+                for node in self.nodes]
+        fitting = [node for node in free if len(node) >= cores]
+        if fitting:
+            # The fullest node which fits, to keep room for larger runs
+            return min(fitting, key=len)[:cores]
+        if sum(len(node) for node in free) < cores:
+            return None
+        # Span the nodes with the most free CPUs
+        picked = []
+        for node in sorted(free, key=len, reverse=True):
+            picked.extend(node[:cores - len(picked)])
+            if len(picked) == cores:
+                return picked
+
+    def acquire(self, cores):
+        """Hand out the given number of CPUs, wait until they are free.
+
+        Raises
+        ------
+        ValueError
+            if the placer does not have that many CPUs
+        """
+        if not 0 < cores <= len(self.cpus):
+            raise ValueError('Cannot place a run on %s of %s CPUs.'
+                             % (cores, len(self.cpus)))
+        while True:
+            cpus = self._pick(cores)
+            if cpus:
+                self._free.difference_update(cpus)
+                return cpus
+            self._released.wait()
+
+    def release(self, cpus):
+        """Take back the CPUs of a finished run"""
+        self._free.update(cpus)
+        # Wake up every waiting run, each checks whether it fits now
+        released, self._released = self._released, Event()
+        released.set()
@@ -0,0 +1,225 @@
+"""
+This module is part of simphony-network package.
+
+A process-wide pool of zerorpc clients, keyed by endpoint.
+
+Every `zerorpc.Client` owns a socket and runs heartbeats. Instead of every
+`ProxyEngine` opening its own, all engines talking to the same endpoint
+share one pooled client, which multiplexes their calls. The number of calls
+in flight per endpoint is bounded, and clients which stay idle for a while
+are closed; they reconnect transparently on their next use.
+
+Pooled clients also track the liveness of their server: a call which
+times out or loses the heartbeats of the server marks it as down, any
+answer marks it as alive again.
+"""
+import time
+import types
+import logging
+
+import gevent
+from gevent.lock import BoundedSemaphore
+import zerorpc
+
+
+class _Stream(object):
+    """Iterator over the answer of a streaming method.
+
+    The client counts the stream as in flight until it is exhausted or
+    closed, hence it is not closed for being idle in the middle of it.
+    """
+    def __init__(self, client, items):
+        self._client = client
+        self._items = items
+        self._open = True
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        try:
+            item = next(self._items)
+        except BaseException:
+            self.close()
+            raise
+        self._client._last_used = time.time()
+        return item
+
+    def close(self):
+        """Stop the stream and release the client"""
+        if self._open:
+            self._open = False
+            self._items.close()
+            self._client._in_flight -= 1
+            self._client._last_used = time.time()
+
+    def __del__(self):
+        self.close()
+
+
+class PooledClient(object):
+    """A shared zerorpc client with bounded concurrency.
+
+    Remote methods are called as attributes, like on a `zerorpc.Client`.
+
+    Parameters
+    ----------
+    endpoint: str
+        endpoint of the server, e.g. 'tcp://localhost:8020'
+    max_concurrency: int
+        maximum number of calls in flight, further calls wait
+    client_options: dict, optional
+        keyword arguments of `zerorpc.Client`, e.g. `heartbeat`
+    """
+    def __init__(self, endpoint, max_concurrency=100, client_options=None):
+        self._endpoint = endpoint
+        self._client_options = client_options or {}
+        self._client = None
+        self._semaphore = BoundedSemaphore(max_concurrency)
+        self._in_flight = 0
+        self._last_used = time.time()
+        # Time the server stopped answering, None while it is alive
+        self._down_since = None
+
+    @property
+    def endpoint(self):
+        """Endpoint of the server"""
+        return self._endpoint
+
+    @property
+    def in_flight(self):
+        """Number of calls waiting for their answer"""
+        return self._in_flight
+
+    @property
+    def alive(self):
+        """False if the last call to the server got no answer"""
+        return self._down_since is None
+
+    @property
+    def down_since(self):
+        """Time the server stopped answering, None while it is alive"""
+        return self._down_since
+
+    def idle_for(self):
+        """Seconds since the last call finished, zero while calls are in flight"""
+        if self._in_flight:
+            return 0
+        return time.time() - self._last_used
+
+    def _connect(self):
+        """Return the underlying client, connecting if needed"""
+        if self._client is None:
+            self._client = zerorpc.Client(self._endpoint,
+                                          **self._client_options)
+            logging.debug('Connected pooled client to %s' % self._endpoint)
+        return self._client
+
+    def __call__(self, method, *args, **kwargs):
+        """Call the given remote method.
+
+        Streaming methods only occupy a slot while the stream is opened,
+        but count as in flight until the stream is exhausted or closed.
+        """
+        with self._semaphore:
+            self._in_flight += 1
+            streaming = False
+            try:
+                result = self._connect()(method, *args, **kwargs)
+                if isinstance(result, types.GeneratorType):
+                    result = _Stream(self, result)
+                    streaming = True
+            except (zerorpc.LostRemote, zerorpc.TimeoutExpired):
+                if self._down_since is None:
+                    self._down_since = time.time()
+                    logging.warning('Server at %s is not answering.'
+                                    % self._endpoint)
+                raise
+            except zerorpc.RemoteError:
+                # The server answered, with an error
+                self._down_since = None
+                raise
+            finally:
+                if not streaming:
+                    self._in_flight -= 1
+                self._last_used = time.time()
+            self._down_since = None
+            return result
+
+    def ping(self, timeout=2):
+        """Tell whether the server answers within the given seconds"""
+        try:
+            self('echo', 'ping', timeout=timeout)
+        except (zerorpc.LostRemote, zerorpc.TimeoutExpired):
+            return False
+        return True
+
+    def __getattr__(self, method):
+        if method.startswith('_'):
+            # e.g. looked up by copy or pickle, never a remote method
+            raise AttributeError(method)
+        return lambda *args, **kwargs: self(method, *args, **kwargs)
+
+    def close(self):
+        """Close the underlying client, it is reopened on the next call"""
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+            logging.debug('Closed pooled client to %s' % self._endpoint)
+
+
+class ClientPool(object):
+    """Pool of shared clients, one per endpoint.
+
+    Parameters
+    ----------
+    max_concurrency: int
+        maximum number of calls in flight per endpoint
+    idle_timeout: float
+        seconds after which idle clients are closed, never if None
+    client_options: dict, optional
+        keyword arguments of `zerorpc.Client`, e.g. `heartbeat`
+    """
+    def __init__(self, max_concurrency=100, idle_timeout=60,
+                 client_options=None):
+        self.max_concurrency = max_concurrency
+        self.idle_timeout = idle_timeout
+        self.client_options = client_options or {}
+        self._clients = {}
+        self._reaper = None
+
+    def get(self, endpoint):
+        """Return the shared client of the given endpoint"""
+        if endpoint not in self._clients:
+            self._clients[endpoint] = PooledClient(endpoint,
+                                                   self.max_concurrency,
+                                                   self.client_options)
+        if self.idle_timeout and self._reaper is None:
+            self._reaper = gevent.spawn(self._reap)
+        return self._clients[endpoint]
+
+    def _reap(self):
+        """Close clients which were idle for longer than the timeout"""
+        while True:
+            gevent.sleep(self.idle_timeout / 2.0)
+            for client in self._clients.values():
+                if client.idle_for() > self.idle_timeout:
+                    client.close()
+
+    def close(self):
+        """Close all the clients of the pool"""
+        if self._reaper is not None:
+            self._reaper.kill()
+            self._reaper = None
+        for client in self._clients.values():
+            client.close()
+        self._clients.clear()
+
+
+# The pool shared by the whole process
+default_pool = ClientPool()
+
+
+def get_client(endpoint):
+    """Return the shared client of the given endpoint from the default pool"""
+    return default_pool.get(endpoint)
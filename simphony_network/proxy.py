@@ -8,18 +8,246 @@ this class to take advantage of SimPhoNy network layer.
 """
 #import pickle
 import logging
-import time
+from contextlib import contextmanager
 
+import gevent
+from gevent import socket
+from gevent.event import AsyncResult
+from gevent.queue import Queue, Empty
+import zerorpc
 import msgpack_numpy as mn
 mn.patch()
-import zerorpc
 from simphony.cuds.abc_modeling_engine import ABCModelingEngine
 from simphony.cuds.particles import ABCParticles
 from simphony.cuds.mesh import ABCMesh
 from simphony.cuds.lattice import ABCLattice
-from cloud.serialization import cloudpickle as pickle
 
-from .constants import WrapperState
+from . import constants
+from .events import EventSubscriber
+from .pool import get_client
+from . import tracing
+from . import serialization
+from .geometry import LatticeDescriptor
+
+
+def _finished(event):
+    """Tell whether an event tells that the wrapper is finished"""
+    return event['event'] == constants.WRAPPER_STATE_CHANGE_TOPIC and \
+        event['state'] in constants.FINISHED_STATES
+
+
+class HostLost(Exception):
+    """The remote host of a wrapper stopped answering."""
+
+
+class RunFailed(Exception):
+    """A remote run finished in another state than `done`.
+
+    Attributes
+    ----------
+    wrapper_id: str
+        id of the remote wrapper
+    state: str
+        its final state, e.g. `failed`, `timed_out` or `cancelled`
+    """
+    def __init__(self, wrapper_id, state):
+        super(RunFailed, self).__init__('Remote wrapper %s is %s.'
+                                        % (wrapper_id, state))
+        self.wrapper_id = wrapper_id
+        self.state = state
+
+
+class GatherTimeout(Exception):
+    """Some results of `gather` were not ready in time.
+
+    Attributes
+    ----------
+    pending: list of AsyncResult
+        the results which were not ready, they can still be waited for
+    """
+    def __init__(self, message, pending):
+        super(GatherTimeout, self).__init__(message)
+        self.pending = pending
+
+
+def run_all(engines, **kwargs):
+    """Run all the given engines concurrently.
+
+    Parameters
+    ----------
+    engines: sequence of ProxyEngine
+        engines to run
+    kwargs:
+        passed to `ProxyEngine.run`
+
+    Returns
+    -------
+    list of AsyncResult
+        one result per engine, in the same order
+    """
+    return [engine.run(async=True, **kwargs) for engine in engines]
+
+
+def gather(results, timeout=None):
+    """Wait for all the given results and return their values.
+
+    Parameters
+    ----------
+    results: sequence of AsyncResult
+        e.g. as returned by `run_all`
+    timeout: float, optional
+        seconds to wait at most
+
+    Returns
+    -------
+    list
+        values of the results, in the same order
+
+    Raises
+    ------
+    RunFailed
+        if a remote run did not finish `done`, the first one in order.
+        Other exceptions of the results, e.g. `HostLost`, are raised alike.
+    GatherTimeout
+        if some results are not ready after the timeout
+    """
+    gevent.wait(results, timeout=timeout)
+    pending = [result for result in results if not result.ready()]
+    if pending:
+        raise GatherTimeout('%s of %s results are not ready after %s s.'
+                            % (len(pending), len(results), timeout), pending)
+    return [result.get(block=False) for result in results]
+
+
+def as_completed(results, timeout=None):
+    """Iterate over the given results in the order they are finished.
+
+    Parameters
+    ----------
+    results: sequence of AsyncResult
+        e.g. as returned by `run_all`
+    timeout: float, optional
+        seconds to wait at most, results which are not ready by then are
+        not yielded
+
+    Yields
+    ------
+    AsyncResult
+    """
+    for result in gevent.iwait(results, timeout=timeout):
+        yield result
+
+
+class ProxyPipeline(object):
+    """A pipeline of engines run within a single remote host.
+
+    Datasets flow from stage to stage on the remote host, the client only
+    submits the stages and fetches the results it needs::
+
+        pipeline = ProxyPipeline('pc-115')
+        pipeline.add_stage('coarse', 'JYUEngine', coarse_cuds)
+        pipeline.add_stage('fine', 'LammpsEngine', fine_cuds,
+                           inputs=[('coarse', 'lattice1')])
+        pipeline.run()
+        result = pipeline.get_dataset('fine', 'particles')
+
+    Args:
+        host: str
+            the host to run the pipeline there
+        port: int
+            port the server listens at
+        poll_interval: float
+            seconds between polls of the remote state while waiting
+    """
+
+    def __init__(self, host, port=8020, poll_interval=2):
+        self._host = host
+        self._port = port
+        self._poll_interval = poll_interval
+        self._remote = get_client("tcp://{host}:{port}".format(host=host,
+                                                               port=port))
+        self._stages = []
+        self._pipeline_id = None
+        self._wrappers = {}
+
+    def add_stage(self, name, engine_type, cuds, inputs=(), **options):
+        """Add a stage to the pipeline.
+
+        Parameters
+        ----------
+        name: str
+            unique name of the stage
+        engine_type: str
+            name of the engine to run the stage
+        cuds: CUDS
+            the model data of the stage
+        inputs: list of tuple
+            pairs of an earlier stage and the name of one of its datasets,
+            which are added to the engine of this stage before it runs
+        options:
+            run options of the stage, as accepted by `ProxyEngine.run`
+        """
+        if self._pipeline_id is not None:
+            raise Exception('Can not change the pipeline after running it.')
+
+        self._stages.append({'name': name,
+                             'type': engine_type,
+                             'cuds': serialization.dumps(cuds),
+                             'inputs': [list(pair) for pair in inputs],
+                             'options': options})
+
+    def run(self, async=False):
+        """Run the pipeline on the remote host.
+
+        Returns
+        -------
+        dict or AsyncResult
+            the final state of the pipeline and its stages, see
+            `get_state`. For non-blocking calls an `AsyncResult` which gets
+            the state once the pipeline is finished.
+        """
+        created = self._remote.create_pipeline(self._stages)
+        self._pipeline_id = created['pipeline_id']
+        self._wrappers = created['wrappers']
+        logging.info('Pipeline %s created.' % self._pipeline_id)
+
+        result = AsyncResult()
+        gevent.spawn(self._wait).link(result)
+        if async:
+            return result
+        return result.get()
+
+    def _wait(self):
+        """Poll the remote state until the pipeline is finished"""
+        while True:
+            state = self.get_state()
+            if state['state'] in constants.FINISHED_STATES:
+                return state
+            gevent.sleep(self._poll_interval)
+
+    def get_state(self):
+        """Return the state of the pipeline and, per stage, its wrapper id
+        and state"""
+        if self._pipeline_id is None:
+            raise Exception('Pipeline is not running yet. Did you run it?')
+
+        return self._remote.get_pipeline_state(self._pipeline_id)
+
+    def get_dataset(self, stage, name):
+        """Fetch a dataset of the engine of a stage"""
+        if self._pipeline_id is None:
+            raise Exception('Pipeline is not running yet. Did you run it?')
+
+        return serialization.loads(
+            self._remote.get_dataset(self._wrappers[stage], name, True))
+
+    def delete(self):
+        """Delete the pipeline and the wrappers of its stages"""
+        if self._pipeline_id is None:
+            raise Exception('Pipeline is not running yet. Did you run it?')
+
+        self._remote.delete_pipeline(self._pipeline_id)
+        self._pipeline_id = None
 
 
 class ProxyEngine(ABCModelingEngine):
@@ -34,9 +262,29 @@ class ProxyEngine(ABCModelingEngine):
             the host to run the simulation there
         port: int
             port for the server to listen at
+        pub_port: int
+            port the server publishes its events at
+        poll_interval: float
+            seconds between polls of the remote state while waiting
+        fallback_hosts: list of str
+            hosts to resubmit the job to if the current host is lost. The
+            run on the lost host is cancelled if it answers again, which
+            takes effect between chunks only, see `chunk_steps` of `run`.
+        max_retries: int
+            number of times the job is resubmitted at most
+        liveness_timeout: float
+            seconds to wait for the answer to a state poll. A host which
+            does not answer in time is only lost if it does not accept
+            connections either, engines running without chunks keep the
+            host from answering.
+        propagate_trace: bool
+            pass the trace id to the remote host, which then records its
+            own spans of the job
     """
 
-    def __init__(self, cuds, engine_type, host, port=8020):
+    def __init__(self, cuds, engine_type, host, port=8020, pub_port=8021,
+                 poll_interval=2, fallback_hosts=(), max_retries=2,
+                 liveness_timeout=10, propagate_trace=False):
         # The CUDS object contains all the data regarding the model
         self._cuds = cuds
 
@@ -49,10 +297,22 @@ class ProxyEngine(ABCModelingEngine):
         # The remote port to connect to
         self._port = port
 
-        # Create the proxy to the remote host.
-        self._remote = \
-            zerorpc.Client("tcp://{host}:{port}".format(host=self._host,
-                                                        port=self._port))
+        # The remote port to receive events from
+        self._pub_port = pub_port
+
+        # Seconds to wait between polls of the remote state
+        self._poll_interval = poll_interval
+
+        # Hosts to run the job on, the first one is tried first
+        self._hosts = [host] + [h for h in fallback_hosts if h != host]
+
+        # Resubmissions after losing a host
+        self._max_retries = max_retries
+        self._liveness_timeout = liveness_timeout
+
+        # Get the proxy to the remote host from the process-wide pool, it is
+        # shared with other engines talking to the same host.
+        self._remote = self._get_remote(host)
         # Tell what we just did
         logging.info('Created zerorpc proxy to remote host at %s:%s' % (host, port))
 
@@ -62,6 +322,28 @@ class ProxyEngine(ABCModelingEngine):
         # Keep the id of the remote wrapper internally.
         self._wrapper_id = None
 
+        # Subscriber to the events of the remote wrapper, created on demand
+        self._subscriber = None
+
+        # Functions to be called upon every progress event
+        self._progress_callbacks = []
+
+        # Queues of the running `iter_progress` calls
+        self._progress_queues = []
+
+        # Greenlet passing the events to the callbacks and queues, the only
+        # reader of the subscriber
+        self._dispatcher = None
+
+        # Datasets of other engines to add, see `pull_dataset`
+        self._pulls = []
+
+        # Phase timings of the last job, see `get_trace_summary`
+        self.trace = tracing.Trace()
+        self._propagate_trace = propagate_trace
+        if propagate_trace:
+            tracing.install()
+
     @property
     def BC(self):
         """A proxy for remote BC"""
@@ -110,45 +392,254 @@ class ProxyEngine(ABCModelingEngine):
         """
         raise NotImplementedError('Changing CM is not allowed after initializing the proxy.')
 
-    def run(self, async=False):
+    def run(self, async=False, record_every=None, record_datasets=None,
+            progress_every=None, checkpoint_every=None, timeout=None,
+            chunk_steps=None, cores=None):
         """Run the wrapper on the remote host.
 
         Parameters
         ----------
         async: bool
             non-blocking call if set to True
-        """
-        # Extract wrapper's name out of its type information
-        wrapper_name = self._engine_type
+        record_every: int, optional
+            record a trajectory frame every given number of time steps
+        record_datasets: list of str, optional
+            names of the datasets to record, all datasets by default
+        progress_every: int, optional
+            publish a progress event every given number of time steps
+        checkpoint_every: int, optional
+            checkpoint the remote wrapper every given number of time steps,
+            if the remote host keeps checkpoints
+        timeout: float, optional
+            seconds after which the remote run is stopped as `timed_out`
+        chunk_steps: int, optional
+            run at most the given number of time steps at once, remote runs
+            are only cancelled or timed out in between
+        cores: int, optional
+            number of CPUs to pin the remote run to, if the remote host
+            places runs on CPUs
 
-        logging.debug('going to pickle')
-        pickled_cuds = pickle.dumps(self._cuds)
-
-        # First create the wrapper along with passing model data
-        self._wrapper_id = self._remote.create_wrapper(wrapper_name,
-                                                       pickled_cuds)
-        logging.debug('Got the id: %s' % self._wrapper_id)
-        logging.info('Wrapper %s created.' % self._wrapper_id)
+        Returns
+        -------
+        str or AsyncResult
+            the id of the remote wrapper. For non-blocking calls an
+            `AsyncResult` which gets the id once the remote run is finished.
 
-        # Now issue the run command
-        self._remote.run_wrapper(self._wrapper_id)
+        Raises
+        ------
+        RunFailed
+            if the remote run finished `failed`, `timed_out` or
+            `cancelled`. Non-blocking calls raise it on `get`.
+        """
+        options = {}
+        if record_every:
+            options['record_every'] = record_every
+            options['record_datasets'] = record_datasets
+        if progress_every:
+            options['progress_every'] = progress_every
+        if checkpoint_every:
+            options['checkpoint_every'] = checkpoint_every
+        if timeout:
+            options['timeout'] = timeout
+        if chunk_steps:
+            options['chunk_steps'] = chunk_steps
+        if cores:
+            options['cores'] = cores
+
+        # Submitting and waiting happens in its own greenlet, hence many
+        # engines can run concurrently from a single thread.
+        result = AsyncResult()
+        gevent.spawn(self._run_with_retries, options).link(result)
+
+        if async:
+            return result
+        return result.get()
+
+    def _get_remote(self, host):
+        """Return the pooled client of the given host"""
+        return get_client("tcp://{host}:{port}".format(host=host,
+                                                       port=self._port))
+
+    def _run_with_retries(self, options):
+        """Run the job, resubmitting it to another host if its host is lost"""
+        retries = 0
+        while True:
+            try:
+                return self._run(options)
+            except HostLost as e:
+                if retries >= self._max_retries:
+                    raise
+                retries += 1
+                logging.warning('%s Resubmitting, attempt %s of %s.'
+                                % (e, retries, self._max_retries))
+                self._failover()
+
+    def _reachable(self):
+        """Tell whether the host accepts connections.
+
+        A host whose event loop is blocked by a running engine answers no
+        calls and sends no heartbeats, but its kernel still accepts
+        connections. A crashed server refuses them, a lost machine lets
+        them time out.
+        """
+        try:
+            socket.create_connection((self._host, self._port),
+                                     self._liveness_timeout).close()
+        except (socket.error, socket.timeout):
+            return False
+        return True
+
+    def _abandon(self):
+        """Stop and delete the wrapper on the lost host, if it answers"""
+        if self._wrapper_id is None:
+            return
+        for method in ('cancel_wrapper', 'delete_wrapper'):
+            try:
+                self._remote(method, self._wrapper_id,
+                             timeout=self._liveness_timeout)
+            except Exception as e:
+                logging.warning('Could not %s %s on %s: %s'
+                                % (method, self._wrapper_id, self._host, e))
+                return
+
+    def _failover(self):
+        """Switch to the next host which answers"""
+        # Events of the old host are of no use anymore
+        if self._dispatcher is not None:
+            self._dispatcher.kill()
+            self._dispatcher = None
+        if self._subscriber is not None:
+            self._subscriber.close()
+            self._subscriber = None
+        # The old run must not go on next to the resubmitted one
+        self._abandon()
+        self._wrapper_id = None
+        self._last_state = None
 
-        # If call is blocking, wait untill the wrapper finishes
+        start = self._hosts.index(self._host)
+        for i in range(1, len(self._hosts) + 1):
+            host = self._hosts[(start + i) % len(self._hosts)]
+            remote = self._get_remote(host)
+            if remote.ping(self._liveness_timeout):
+                self._host, self._remote = host, remote
+                logging.info('Switched to remote host %s:%s' % (host, self._port))
+                return
+        raise HostLost('None of the hosts %s is answering.' % self._hosts)
+
+    def _call(self, method, *args, **kwargs):
+        """Call the remote host, raising HostLost if it does not answer"""
+        try:
+            return self._remote(method, *args, **kwargs)
+        except (zerorpc.LostRemote, zerorpc.TimeoutExpired):
+            raise HostLost('Lost remote host %s:%s.' % (self._host, self._port))
+        except zerorpc.RemoteError as e:
+            if e.name == 'KeyError' and self._wrapper_id is not None:
+                # The host was restarted and forgot the wrapper
+                raise HostLost('Remote host %s:%s lost wrapper %s.'
+                               % (self._host, self._port, self._wrapper_id))
+            raise
+
+    def _poll_state(self):
+        """Return the state of the remote wrapper, None if the host is busy.
 
-        if not async:
-            while True:
-                # Check for wrapper's status
-                state = self.get_state()
-                logging.debug('Current state is %s' % state)
+        Raises
+        ------
+        HostLost
+            if the host neither answers nor accepts connections
+        """
+        try:
+            return self._remote('get_wrapper_state', self._wrapper_id,
+                                timeout=self._liveness_timeout)
+        except (zerorpc.LostRemote, zerorpc.TimeoutExpired):
+            if self._reachable():
+                return None
+            raise HostLost('Lost remote host %s:%s.'
+                           % (self._host, self._port))
+        except zerorpc.RemoteError as e:
+            if e.name == 'KeyError':
+                # The host was restarted and forgot the wrapper
+                raise HostLost('Remote host %s:%s lost wrapper %s.'
+                               % (self._host, self._port, self._wrapper_id))
+            raise
+
+    def _submission(self):
+        """Return the CUDS to submit the job with, large arrays out of band"""
+        return serialization.dumps(self._cuds)
+
+    @contextmanager
+    def _traced(self):
+        """Pass the trace id along the remote calls, if propagating"""
+        if not self._propagate_trace:
+            yield
+            return
+        with tracing.traced(self.trace.trace_id):
+            yield
+
+    def _run(self, options):
+        """Create and run the remote wrapper and wait until it finishes"""
+        # Extract wrapper's name out of its type information
+        wrapper_name = self._engine_type
 
-                # If it is not running anymore break the loop
-                if state != WrapperState.running.value:
-                    break
+        # Every submission gets a trace of its own
+        self.trace = trace = tracing.Trace()
 
-                # Wait and try again
-                time.sleep(2)
+        logging.debug('going to pickle')
+        with trace.span('pickle'):
+            pickled_cuds = self._submission()
+        self._wrapper_id = None
 
-        # Return the id, just for fun
+        with self._traced():
+            # First create the wrapper along with passing model data
+            with trace.span('create'):
+                self._wrapper_id = self._call('create_wrapper', wrapper_name,
+                                              pickled_cuds)
+            logging.debug('Got the id: %s' % self._wrapper_id)
+            logging.info('Wrapper %s created.' % self._wrapper_id)
+
+            # Datasets of other engines go from host to host
+            for source, name in self._pulls:
+                if source._wrapper_id is None:
+                    raise Exception('Engine to pull dataset %s from did not '
+                                    'run.' % name)
+                with trace.span('pull'):
+                    self._call('pull_dataset', self._wrapper_id,
+                               'tcp://%s:%s' % (source._host, source._port),
+                               source._wrapper_id, name,
+                               timeout=constants.DEFAULT_CONFIG[
+                                   'TRANSFER_TIMEOUT'])
+
+            # Subscribe before running, not to miss the first events
+            if self._progress_callbacks or self._progress_queues:
+                self._start_dispatcher()
+
+            with trace.span('wait'):
+                # Now issue the run command
+                self._call('run_wrapper', self._wrapper_id, options)
+
+                # Wait untill the wrapper finishes
+                while True:
+                    # Check for wrapper's status, a host which does not
+                    # answer is lost only if it is not reachable either
+                    state = self._poll_state()
+                    if state is None:
+                        logging.debug('Host %s is busy.' % self._host)
+                    else:
+                        self._last_state = state
+                        logging.debug('Current state is %s' % state)
+
+                    # If it is not running anymore break the loop
+                    if state in constants.FINISHED_STATES:
+                        break
+
+                    # Wait and try again, other greenlets run meanwhile
+                    gevent.sleep(self._poll_interval)
+
+            if self._propagate_trace:
+                trace.server_spans = self._call('get_wrapper_trace',
+                                                self._wrapper_id)['spans']
+
+        if self._last_state != constants.WrapperState.done.value:
+            raise RunFailed(self._wrapper_id, self._last_state)
         return self._wrapper_id
 
     def add_dataset(self, container):
@@ -156,8 +647,9 @@ class ProxyEngine(ABCModelingEngine):
 
         Parameters
         ----------
-        container: {ABCMesh, ABCParticles, ABCLattice}
-            The CUDS container to add to the engine.
+        container: {ABCMesh, ABCParticles, ABCLattice, LatticeDescriptor}
+            The CUDS container to add to the engine. Lattices given by a
+            descriptor are built by the remote host.
 
         Raises
         ------
@@ -175,7 +667,8 @@ class ProxyEngine(ABCModelingEngine):
         if self._wrapper_id is not None:
             raise Exception('Can not change state data after running the wrapper.')
 
-        if not isinstance(container, (ABCMesh, ABCLattice, ABCParticles)):
+        if not isinstance(container, (ABCMesh, ABCLattice, ABCParticles,
+                                      LatticeDescriptor)):
             raise TypeError('Container type %s is not supported.' % type(container))
 
         if container.name in self._cuds.SD:
@@ -185,6 +678,28 @@ class ProxyEngine(ABCModelingEngine):
         self._cuds.SD[container.name] = container
         logging.debug('Dataset [%s] added to the CUDS.' % self._cuds.SD)
 
+    def pull_dataset(self, source, name):
+        """Add a dataset of another engine, without fetching it.
+
+        Once this engine runs, its remote host fetches the dataset directly
+        from the remote host of the other engine. The hosts have to reach
+        each other by the host names the engines were given.
+
+        Parameters
+        ----------
+        source: ProxyEngine
+            engine which has run and holds the dataset
+        name: str
+            name of the dataset
+        """
+        if self._wrapper_id is not None:
+            raise Exception('Can not change state data after running the wrapper.')
+
+        if name in self._cuds.SD or name in [n for _, n in self._pulls]:
+            raise ValueError('There is already a dataset with given name.')
+
+        self._pulls.append((source, name))
+
     def remove_dataset(self, wrapper_id, name):
         """Remove a dataset from the correspoinding modeling engine
 
@@ -217,10 +732,11 @@ class ProxyEngine(ABCModelingEngine):
         if self._wrapper_id is None:
             raise Exception('No results exist yet. Wrapper not initialized.')
 
-        pickled_dataset = self._remote.get_dataset(self._wrapper_id,
-                                                   name)
+        with self._traced(), self.trace.span('fetch'):
+            message = self._remote.get_dataset(self._wrapper_id, name, True)
 
-        return pickle.loads(pickled_dataset)
+        with self.trace.span('unpickle'):
+            return serialization.loads(message)
 
     def iter_datasets(self, names=None):
         """Iterate over a subset or all of the lattices.
@@ -238,6 +754,165 @@ class ProxyEngine(ABCModelingEngine):
         raise NotImplementedError()
 
     # Proxy specific methods, not available in the base class
+    def on_progress(self, callback):
+        """Call the given function upon every event of the remote wrapper.
+
+        Callbacks have to be registered before running the wrapper. They are
+        called with the event dictionary, containing the `state` of the
+        wrapper and for progress events also `step`, `total_steps`,
+        `elapsed` and `throughput`.
+
+        Parameters
+        ----------
+        callback: callable
+            function accepting a single event argument
+        """
+        self._progress_callbacks.append(callback)
+
+    def iter_progress(self, timeout=None):
+        """Iterate over the events of the remote wrapper.
+
+        Iteration stops once the wrapper is finished. Events published
+        before calling this method are only received if a progress callback
+        was registered before running the wrapper. Callbacks and every
+        iteration receive all the events.
+
+        Parameters
+        ----------
+        timeout: float, optional
+            stop if no event arrives within the given seconds
+
+        Yields
+        ------
+        dict
+            the published events
+        """
+        events = Queue()
+        self._progress_queues.append(events)
+        try:
+            self._start_dispatcher()
+            while True:
+                try:
+                    event = events.get(timeout=timeout)
+                except Empty:
+                    return
+                yield event
+                if _finished(event):
+                    return
+        finally:
+            self._progress_queues.remove(events)
+
+    def cancel(self):
+        """Stop the remote run and return the state of the remote wrapper"""
+        if self._wrapper_id is None:
+            raise Exception("I don't have the wrapepr_id yet. Did you run the wrapper?")
+
+        return self._remote.cancel_wrapper(self._wrapper_id)
+
+    def checkpoint(self):
+        """Checkpoint the remote wrapper now, return the time steps done"""
+        if self._wrapper_id is None:
+            raise Exception("I don't have the wrapepr_id yet. Did you run the wrapper?")
+
+        return self._remote.checkpoint_wrapper(self._wrapper_id)
+
+    def delete(self):
+        """Delete the remote wrapper and free its resources on the remote host"""
+        if self._wrapper_id is None:
+            raise Exception("I don't have the wrapepr_id yet. Did you run the wrapper?")
+
+        self._remote.delete_wrapper(self._wrapper_id)
+        self._wrapper_id = None
+
+    def _get_subscriber(self):
+        """Return the subscriber to the events of the remote wrapper"""
+        if self._wrapper_id is None:
+            raise Exception("I don't have the wrapepr_id yet. Did you run the wrapper?")
+
+        if self._subscriber is None:
+            self._subscriber = EventSubscriber(self._host,
+                                               self._pub_port,
+                                               [self._wrapper_id])
+        return self._subscriber
+
+    def _start_dispatcher(self):
+        """Start passing the events of the remote wrapper on, if not yet"""
+        if self._dispatcher is None or self._dispatcher.dead:
+            self._get_subscriber()
+            self._dispatcher = gevent.spawn(self._dispatch_progress)
+
+    def _dispatch_progress(self):
+        """Pass the events of the remote wrapper to the callbacks and to
+        the running iterations"""
+        while True:
+            _, event = self._subscriber.recv()
+            for callback in self._progress_callbacks:
+                callback(event)
+            for events in self._progress_queues:
+                events.put(event)
+            if _finished(event):
+                return
+
+    def iter_trajectory(self, name, start=0, stop=None, attribute=None):
+        """Iterate over the recorded trajectory of a dataset.
+
+        Frames are streamed from the remote host one at a time.
+
+        Parameters
+        ----------
+        name: str
+            name of the dataset
+        start: int
+            first frame to fetch
+        stop: int, optional
+            frame to stop before, the last recorded frame by default
+        attribute: str, optional
+            only fetch this attribute, e.g. 'VELOCITY'
+
+        Yields
+        ------
+        dict or numpy.ndarray
+            frame number, time step and attribute arrays of every frame, or
+            only the array of the given attribute.
+        """
+        if self._wrapper_id is None:
+            raise Exception('No results exist yet. Wrapper not initialized.')
+
+        attributes = None if attribute is None else [attribute]
+        frames = self._remote.iter_trajectory(self._wrapper_id, name,
+                                              start, stop, attributes)
+        for frame in frames:
+            if attribute is None:
+                yield frame
+            else:
+                yield frame['data'][attribute]
+
+    def get_trajectory_info(self, name):
+        """Return number of frames, time steps and attributes of a trajectory"""
+        if self._wrapper_id is None:
+            raise Exception('No results exist yet. Wrapper not initialized.')
+
+        return self._remote.get_trajectory_info(self._wrapper_id, name)
+
+    def get_stats(self):
+        """Return the resources used by the remote wrapper so far"""
+        if self._wrapper_id is None:
+            raise Exception("I don't have the wrapepr_id yet. Did you run the wrapper?")
+
+        return self._remote.get_wrapper_stats(self._wrapper_id)
+
+    def get_trace_summary(self):
+        """Return the seconds spent in every phase of the last job.
+
+        Phases are `pickle`, `upload`, `create`, `queue`, `run`,
+        `completion`, `fetch` and `unpickle`. Upload, queue and completion
+        times are only known if the trace was propagated to the remote host,
+        otherwise `run` covers everything from submitting the run until the
+        finished state was noticed. Use `tracing.summarize` to aggregate the
+        traces of several engines, e.g. of a sweep.
+        """
+        return self.trace.summary()
+
     def get_state(self):
         """Return the current state of the wrapper"""
         # Complain if the wrapper_id is not known yet, give some hints.
@@ -0,0 +1,88 @@
+"""
+This module is part of simphony-network package.
+
+`EventPublisher` sends the events of the application to its subscribers.
+
+Events are not sent one by one. They are queued and flushed once per batch
+window, every topic as a single multipart message: the first frame is the
+topic, every following frame is one msgpack packed event. Events which only
+describe the latest status of something, e.g. progress of a wrapper, are
+conflated: a newer event replaces a queued one of the same topic and type,
+so slow subscribers and high frequency sources do not flood the socket.
+"""
+from collections import OrderedDict
+from itertools import count
+
+import gevent
+import zmq.green as zmq
+import msgpack
+# Monkey patching msgpack to support numpy arrays
+import msgpack_numpy as mn
+mn.patch()
+
+
+class EventPublisher(object):
+    """Batching and conflating publisher on top of a PUB socket.
+
+    Parameters
+    ----------
+    socket: zmq.Socket
+        a bound PUB socket
+    batch_window: float
+        seconds to collect events before sending them. Events are sent
+        immediately if it is zero.
+    conflated_events: sequence of int
+        types of events for which only the latest queued one is sent
+    """
+    def __init__(self, socket, batch_window=0.05, conflated_events=()):
+        self._socket = socket
+        self._batch_window = batch_window
+        self._conflated_events = set(conflated_events)
+        self._pending = OrderedDict()
+        self._counter = count()
+
+    def publish(self, topic, **kwargs):
+        """Queue an event to be sent in the next batch.
+
+        Parameters
+        ----------
+        topic: str
+            prefix of the message, subscribers filter messages on it.
+        kwargs:
+            the content of the event, `event` designates its type.
+        """
+        if not topic:
+            raise Exception("No topic given. Won't publish anything without it.")
+
+        event = kwargs.get('event')
+        if event in self._conflated_events:
+            key = (topic, event)
+            # Newer event supersedes the queued one and goes to the end
+            self._pending.pop(key, None)
+        else:
+            key = (topic, event, next(self._counter))
+        self._pending[key] = msgpack.packb(kwargs)
+
+        if not self._batch_window:
+            self.flush()
+
+    def flush(self):
+        """Send all the queued events, one multipart message per topic"""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, OrderedDict()
+
+        batches = OrderedDict()
+        for key, packed in pending.iteritems():
+            batches.setdefault(key[0], []).append(packed)
+
+        for topic, frames in batches.iteritems():
+            # PUB sockets drop messages of subscribers which reached
+            # their high-water mark instead of blocking.
+            self._socket.send_multipart([str(topic)] + frames)
+
+    def run(self):
+        """Flush queued events once per batch window. Will run for ever."""
+        while True:
+            gevent.sleep(self._batch_window or 1)
+            self.flush()
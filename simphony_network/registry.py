@@ -0,0 +1,232 @@
+"""
+This module is part of simphony-network package.
+
+Lazy registry of the engines available through the `simphony.engine`
+entry point.
+
+Instead of importing every engine module at startup, the registry reads
+the source of the entry point modules and indexes the class names they
+define or import from their own package. An engine module is only imported when one of its
+classes is requested for the first time. Modules whose names cannot be
+read from their source, e.g. with star imports, are imported right away,
+and the modules indexed from source are imported when a requested name is
+missing from the index. The index is cached on disk and reused as long as
+the set of installed distributions providing engines, their versions and
+the modification times of the entry point modules stay the same.
+"""
+import os
+import ast
+import imp
+import json
+import errno
+import inspect
+import logging
+import importlib
+
+import pkg_resources
+from simphony.cuds.abc_modeling_engine import ABCModelingEngine
+
+ENTRY_POINT_GROUP = 'simphony.engine'
+
+# Names which never refer to a concrete engine
+EXCLUDED_NAMES = ('ABCModelingEngine',)
+
+
+def _find_source(module_name):
+    """Return the source file of a module without importing it, or None"""
+    path = None
+    for part in module_name.split('.'):
+        try:
+            f, pathname, (_, _, kind) = imp.find_module(
+                part, [path] if path else None)
+        except ImportError:
+            return None
+        if f is not None:
+            f.close()
+        if kind == imp.PKG_DIRECTORY:
+            path = pathname
+            source = os.path.join(pathname, '__init__.py')
+        elif kind == imp.PY_SOURCE:
+            source = pathname
+        else:
+            return None
+    return source if os.path.exists(source) else None
+
+
+def _is_candidate(name):
+    """Tell whether a name looks like an engine class, e.g. JYUEngine"""
+    return name[:1].isupper() and not name.isupper() and \
+        name not in EXCLUDED_NAMES
+
+
+def _scan_source(source, module_name):
+    """Return the candidate class names a module defines or imports.
+
+    Only names imported from the top level package of the module count,
+    e.g. not `DataContainer` imported from simphony. Returns None if the
+    names of the module cannot be told from its source, i.e. if it has
+    star imports.
+    """
+    package = module_name.split('.')[0]
+    with open(source) as f:
+        tree = ast.parse(f.read(), source)
+    names = []
+    for node in tree.body:
+        if isinstance(node, ast.ClassDef):
+            names.append(node.name)
+        elif isinstance(node, ast.ImportFrom):
+            if any(alias.name == '*' for alias in node.names):
+                return None
+            # Relative imports stay within the package
+            if node.level or node.module == package or \
+                    node.module.startswith(package + '.'):
+                names.extend(alias.asname or alias.name
+                             for alias in node.names)
+    return [name for name in names if _is_candidate(name)]
+
+
+def _scan_module(module_name):
+    """Return the engine class names of a module by importing it"""
+    module = importlib.import_module(module_name)
+    return [k for k, v in module.__dict__.iteritems()
+            if inspect.isclass(v) and issubclass(v, ABCModelingEngine) and
+            k not in EXCLUDED_NAMES]
+
+
+class EngineRegistry(object):
+    """Index of engine class names, importing engines on first use.
+
+    Parameters
+    ----------
+    cache_path: str, optional
+        file to cache the index in, no caching if not given
+    """
+    def __init__(self, cache_path=None):
+        self.logger = logging.getLogger('simphony')
+        self._cache_path = cache_path
+        # Engine class name to the name of its module
+        self._index = {}
+        # Engine classes which are already imported
+        self._classes = {}
+        # Modules indexed from source only, they may hold more engines
+        self._unscanned = []
+
+    def __contains__(self, name):
+        if name not in self._classes and name not in self._index:
+            self._scan_remaining(name)
+        return name in self._classes or name in self._index
+
+    def names(self):
+        """Return the names of all the known engines"""
+        return sorted(set(self._index) | set(self._classes))
+
+    def _cache_key(self, entry_points, sources):
+        """Identify the installed engines, their versions and sources"""
+        key = []
+        for ep in entry_points:
+            dist = '%s==%s' % (ep.dist.project_name, ep.dist.version) \
+                if ep.dist else ''
+            source = sources[ep.module_name]
+            # Editable installs change without a version bump
+            mtime = repr(os.path.getmtime(source)) if source else ''
+            key.append('%s=%s %s %s' % (ep.name, ep.module_name, dist, mtime))
+        return sorted(key)
+
+    def _read_cache(self, key):
+        """Return the cached index and unscanned modules if still valid"""
+        if not self._cache_path or not os.path.exists(self._cache_path):
+            return None
+        try:
+            with open(self._cache_path) as f:
+                cache = json.load(f)
+        except ValueError:
+            return None
+        if cache.get('key') != key or 'unscanned' not in cache:
+            return None
+        return cache
+
+    def _write_cache(self, key):
+        """Store the index for the next startup"""
+        if not self._cache_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self._cache_path))
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        with open(self._cache_path, 'w') as f:
+            json.dump({'key': key,
+                       'index': self._index,
+                       'unscanned': self._unscanned}, f)
+
+    def load(self):
+        """Index the engines of the `simphony.engine` entry point"""
+        entry_points = list(pkg_resources.iter_entry_points(
+            group=ENTRY_POINT_GROUP))
+        sources = dict((ep.module_name, _find_source(ep.module_name))
+                       for ep in entry_points)
+        key = self._cache_key(entry_points, sources)
+
+        cache = self._read_cache(key)
+        if cache is not None:
+            self._index = cache['index']
+            self._unscanned = cache['unscanned']
+            self.logger.info('%s wrappers indexed from cache %s.'
+                             % (len(self._index), self._cache_path))
+            return
+
+        for ep in entry_points:
+            source = sources[ep.module_name]
+            names = _scan_source(source, ep.module_name) \
+                if source is not None else None
+            if names is None:
+                # No source to read, e.g. a compiled extension, or names
+                # only known once imported
+                names = _scan_module(ep.module_name)
+            elif ep.module_name not in self._unscanned:
+                self._unscanned.append(ep.module_name)
+            for name in names:
+                self._index[name] = ep.module_name
+        self._write_cache(key)
+        self.logger.info('%s wrappers indexed from simphony.engine entry points.'
+                         % len(self._index))
+
+    def _scan_remaining(self, name):
+        """Import the modules indexed from source until one has the name.
+
+        Sources only tell the classes a module defines or imports by name,
+        e.g. not those it assigns.
+        """
+        while name not in self._index and self._unscanned:
+            module_name = self._unscanned.pop(0)
+            try:
+                names = _scan_module(module_name)
+            except Exception:
+                self.logger.exception('Importing engine module %s failed.'
+                                      % module_name)
+                continue
+            for found in names:
+                self._index.setdefault(found, module_name)
+
+    def register(self, name, cls):
+        """Register an engine class explicitly"""
+        self._classes[name] = cls
+
+    def get(self, name):
+        """Return the engine class of the given name, importing it if needed"""
+        if name not in self._classes:
+            if name not in self._index:
+                self._scan_remaining(name)
+            if name not in self._index:
+                raise KeyError('Wrapper %s is not registered.' % name)
+            module = importlib.import_module(self._index[name])
+            cls = getattr(module, name, None)
+            if not (inspect.isclass(cls) and
+                    issubclass(cls, ABCModelingEngine)):
+                # Indexed from source by mistake, e.g. a helper class
+                raise KeyError('%s in %s is not a modeling engine.'
+                               % (name, self._index.pop(name)))
+            self._classes[name] = cls
+            self.logger.info('Loaded wrapper %s from %s.'
+                             % (name, self._index[name]))
+        return self._classes[name]
@@ -0,0 +1,116 @@
+"""
+This module is part of simphony-network package.
+
+Serialization of CUDS objects and datasets with out-of-band buffers.
+
+Pickling copies the content of every numpy array into the pickle stream,
+which is copied again into the RPC message. Here large arrays are kept out
+of the stream, in the style of pickle protocol 5: the pickled skeleton
+only refers to them by index, and their memory is passed on as separate
+frames. As this happens for every array anywhere in the object, CUDS
+objects and engine specific containers get the speedup without a codec of
+their own. Small arrays, e.g. the data of a single lattice node, stay in
+the skeleton where they are cheaper.
+
+A message is a list of the skeleton followed by the frames, which zerorpc
+sends as binary strings without copying them into a pickle first.
+"""
+import cPickle
+from cStringIO import StringIO
+
+import numpy as np
+import msgpack
+from cloud.serialization.cloudpickle import CloudPickler
+
+# Arrays smaller than this many bytes are pickled in the skeleton
+MIN_FRAME_SIZE = 1024
+
+# Prefix of a message joined into a single string, see `join`
+MAGIC = 'SNOOB\x01'
+
+
+class _Pickler(CloudPickler):
+    """Pickler which moves the memory of large arrays out of band"""
+    def __init__(self, file, frames, min_frame_size):
+        CloudPickler.__init__(self, file, 2)
+        self.frames = frames
+        self.min_frame_size = min_frame_size
+
+    def persistent_id(self, obj):
+        if type(obj) not in (np.ndarray, np.memmap) or obj.dtype.hasobject \
+                or obj.nbytes < self.min_frame_size:
+            return None
+        order = 'F' if obj.flags.f_contiguous and \
+            not obj.flags.c_contiguous else 'C'
+        if order == 'C':
+            obj = np.ascontiguousarray(obj)
+        # Frames are plain bytes, whatever the dtype
+        self.frames.append(memoryview(obj.reshape(-1, order=order)
+                                      .view(np.uint8)))
+        return (len(self.frames) - 1, obj.dtype, obj.shape, order)
+
+
+def dumps(obj, min_frame_size=MIN_FRAME_SIZE):
+    """Serialize an object into a message.
+
+    Parameters
+    ----------
+    obj: object
+        e.g. a CUDS or a dataset
+    min_frame_size: int
+        bytes an array needs to be sent out of band
+
+    Returns
+    -------
+    list
+        pickled skeleton followed by the memory of the large arrays. Frames
+        refer to the memory of the arrays, which must not change until the
+        message is sent.
+    """
+    file = StringIO()
+    frames = []
+    _Pickler(file, frames, min_frame_size).dump(obj)
+    return [file.getvalue()] + frames
+
+
+def loads(message, writable=True):
+    """Rebuild an object from a message.
+
+    Parameters
+    ----------
+    message: list
+        as returned by `dumps`
+    writable: bool
+        copy the frames, so the arrays can be changed. Otherwise the arrays
+        share the memory of the frames and are read only if the frames are,
+        e.g. for the strings received from zerorpc.
+    """
+    skeleton, frames = message[0], message[1:]
+    if writable:
+        frames = [bytearray(frame) for frame in frames]
+
+    def persistent_load(pid):
+        index, dtype, shape, order = pid
+        array = np.frombuffer(frames[index], dtype=dtype)
+        return array.reshape(shape, order=order)
+
+    unpickler = cPickle.Unpickler(StringIO(skeleton))
+    unpickler.persistent_load = persistent_load
+    return unpickler.load()
+
+
+def nbytes(message):
+    """Return the bytes of a message"""
+    return sum(len(part) for part in message)
+
+
+def join(message):
+    """Return a message as a single string, e.g. to store it in a file"""
+    return MAGIC + msgpack.packb(message, use_bin_type=True)
+
+
+def loads_blob(blob):
+    """Rebuild an object from a joined message or from a plain pickle"""
+    if not blob.startswith(MAGIC):
+        return cPickle.loads(blob)
+    return loads(msgpack.unpackb(blob[len(MAGIC):], raw=False))
@@ -2,11 +2,21 @@
 This is a utility script to start the SimPhoNy server and listen for
 incoming commands.
 """
+import sys
+import time
+import atexit
+import socket
+import argparse
+import subprocess
 from threading import Thread
 
+import zmq.green as zmq
+
 from fabric.api import cd, env, prefix, run, task, settings, execute
 
 from simphony_network import SimphonyApplication
+from simphony_network.application import report_startup
+from simphony_network.constants import DEFAULT_CONFIG
 from simphony_network.fabfile import setup_env, deploy, start
 import logging
 
@@ -14,45 +24,299 @@ root_logger = logging.getLogger('root')
 root_logger.setLevel(logging.DEBUG)
 
 
+class ReadyListener(object):
+    """Receives the startup reports of servers, see `--ready-endpoint`.
+
+    Parameters
+    ----------
+    host: str
+        name or address of this machine, as the servers reach it
+    """
+    def __init__(self, host):
+        self._context = zmq.Context()
+        self._socket = self._context.socket(zmq.PULL)
+        port = self._socket.bind_to_random_port('tcp://*')
+        self.endpoint = 'tcp://%s:%s' % (host, port)
+
+    def wait(self, ids, timeout, failure=lambda: None):
+        """Wait until the servers of the given ids report they are ready.
+
+        Parameters
+        ----------
+        ids: list of str
+            ready ids of the servers
+        timeout: float
+            seconds to wait for all of them
+        failure: callable, optional
+            returns why launching the servers failed, or None
+
+        Raises
+        ------
+        RuntimeError
+            as soon as a server fails to start, or once the timeout passed
+        """
+        pending = set(ids)
+        deadline = time.time() + timeout
+        while pending:
+            reason = failure()
+            if reason:
+                raise RuntimeError(reason)
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise RuntimeError('Servers %s did not start within %s s.'
+                                   % (', '.join(sorted(pending)), timeout))
+            if self._socket.poll(min(remaining, 0.1) * 1000):
+                report = self._socket.recv_json()
+                if report.get('error'):
+                    raise RuntimeError('Server %s failed to start: %s'
+                                       % (report['id'], report['error']))
+                pending.discard(report['id'])
+
+    def close(self):
+        self._socket.close(linger=0)
+        self._context.term()
+
+
 class SimphonyFarm(object):
     """Helper to deploy and launch SimPhoNy servers.
 
+    Servers on all hosts are launched at once. Every server reports back
+    once its sockets are bound and its engines are registered, `start`
+    returns as soon as all of them did.
+
     Parameters
     ----------
     hosts: list
         list of host names
+    options: list of str
+        command line options of every server, e.g. `['--workers', '8']`
+    ready_host: str, optional
+        name of this machine as the hosts reach it, its FQDN by default
     """
-    def __init__(self, hosts):
+    def __init__(self, hosts, options=(), ready_host=None):
         self._hosts = hosts
+        self._options = list(options)
+        self._ready_host = ready_host or socket.getfqdn()
+        self._failure = None
 
-    def _run(self):
+    def _run(self, options):
         """Install and run simphony on remote servers."""
         # Set the env variable
         env.hosts = self._hosts
-        with settings(parallel=True):
-            # Install virtual environment on remote host if it is not there already
-            #execute(setup_env)
+        try:
+            with settings(parallel=True):
+                # Install virtual environment on remote host if it is not there already
+                #execute(setup_env)
 
-            # Deploy the dependencies to the remote virtual environment
-            #execute(deploy)
+                # Deploy the dependencies to the remote virtual environment
+                #execute(deploy)
 
-            # Start the server on remote machine
-            execute(start)
+                # Start the server on remote machine
+                execute(start, options=options)
+        except BaseException as e:
+            # Fabric aborts with SystemExit
+            self._failure = 'Launching the servers failed: %s' % e
+        else:
+            self._failure = 'Servers exited.'
 
-    def start(self):
-        """Deploy and launch the servers."""
+    def _launch(self, ready_endpoint):
+        """Launch the servers, which report to the given endpoint"""
         # Initialize the remote server
-        t = Thread(target=self._run)
+        t = Thread(target=self._run,
+                   args=(' '.join(self._options +
+                                  ['--ready-endpoint', ready_endpoint]),))
         # The thread will terminate if the parent process terminates.
         # this will consequently terminates the server on the remote machine.
         t.setDaemon(True)
         # Start the thread
         t.start()
 
+    def _ready_ids(self):
+        """Return the ready ids the servers report with"""
+        return list(self._hosts)
+
+    def _launch_failure(self):
+        """Return why launching the servers failed, or None"""
+        return self._failure
+
+    def start(self, timeout=60):
+        """Deploy and launch the servers, wait until they are ready.
+
+        Raises
+        ------
+        RuntimeError
+            as soon as a server fails to start, or once the timeout passed
+        """
+        listener = ReadyListener(self._ready_host)
+        try:
+            self._launch(listener.endpoint)
+            listener.wait(self._ready_ids(), timeout, self._launch_failure)
+        finally:
+            listener.close()
+
+
+class LocalFarm(SimphonyFarm):
+    """Helper to launch SimPhoNy servers as processes on this machine.
+
+    Every server gets a port pair of its own, the API port of server `i` is
+    `base_port + 2 * i` and its publisher listens at the next port. No SSH
+    is involved, hence a fat node can be used by several servers and the
+    multi-host paths can be tried out on a single machine.
+
+    Parameters
+    ----------
+    count: int
+        number of servers
+    ip: str
+        address the servers listen at
+    base_port: int
+        API port of the first server
+    workers: int
+        worker processes of every server
+    options: list of str
+        further command line options of every server, e.g.
+        `['--engine-cache', '/tmp/engines.json']`
+    """
+    def __init__(self, count, ip='127.0.0.1', base_port=8020, workers=1,
+                 options=()):
+        SimphonyFarm.__init__(self, [ip] * count, options,
+                              '127.0.0.1' if ip == '0.0.0.0' else ip)
+        self._ip = ip
+        self._ports = [(base_port + 2 * i, base_port + 2 * i + 1)
+                       for i in range(count)]
+        self._workers = workers
+        self._processes = [None] * count
+        # Servers the farm currently waits for
+        self._starting = range(count)
+
+    @property
+    def endpoints(self):
+        """Host, port and pub_port of every server, as taken by ProxyEngine"""
+        return [{'host': self._ip, 'port': port, 'pub_port': pub_port}
+                for port, pub_port in self._ports]
+
+    def _launch(self, ready_endpoint):
+        for index in self._starting:
+            port, pub_port = self._ports[index]
+            self._processes[index] = subprocess.Popen(
+                [sys.executable, '-m', 'simphony_network.server',
+                 '--ip', self._ip,
+                 '--api-port', str(port),
+                 '--pub-port', str(pub_port),
+                 '--workers', str(self._workers),
+                 '--metrics-port', '0',
+                 '--ready-endpoint', ready_endpoint,
+                 '--ready-id', str(index)] + self._options)
+
+    def _ready_ids(self):
+        return [str(index) for index in self._starting]
+
+    def _launch_failure(self):
+        for index in self._starting:
+            code = self._processes[index].poll()
+            if code is not None:
+                return 'Server at port %s exited with code %s.' \
+                    % (self._ports[index][0], code)
+
+    def start(self, timeout=30):
+        """Launch the servers and wait until all of them are ready.
+
+        The servers are stopped when this process exits, or if any of them
+        fails to start.
+        """
+        atexit.register(self.stop)
+        self._starting = range(len(self._processes))
+        try:
+            SimphonyFarm.start(self, timeout)
+        except Exception:
+            self.stop()
+            raise
+
+    def alive(self):
+        """Tell for every server whether its process is running"""
+        return [process is not None and process.poll() is None
+                for process in self._processes]
+
+    def restart(self, index, timeout=30):
+        """Stop a server if it is running, and launch it again"""
+        self._stop(index)
+        self._starting = [index]
+        SimphonyFarm.start(self, timeout)
+
+    def _stop(self, index, timeout=10):
+        process = self._processes[index]
+        if process is None or process.poll() is not None:
+            return
+        process.terminate()
+        deadline = time.time() + timeout
+        while process.poll() is None and time.time() < deadline:
+            time.sleep(0.05)
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+
+    def stop(self):
+        """Stop all the servers"""
+        for index in range(len(self._processes)):
+            self._stop(index)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def run_server(argv=None):
+    parser = argparse.ArgumentParser(description='Run a SimPhoNy server.')
+    parser.add_argument('--ip', default=DEFAULT_CONFIG['SERVER_IP'],
+                        help='address to listen at')
+    parser.add_argument('--api-port', type=int,
+                        default=DEFAULT_CONFIG['API_PORT'],
+                        help='port of the API')
+    parser.add_argument('--pub-port', type=int,
+                        default=DEFAULT_CONFIG['PUB_PORT'],
+                        help='port of the publisher')
+    parser.add_argument('--workers', type=int,
+                        default=DEFAULT_CONFIG['WORKERS'],
+                        help='number of worker processes serving the API')
+    parser.add_argument('--engine-cache',
+                        default=DEFAULT_CONFIG['ENGINE_CACHE'],
+                        help='file caching the index of installed engines')
+    parser.add_argument('--checkpoint-dir',
+                        default=DEFAULT_CONFIG['CHECKPOINT_DIR'],
+                        help='directory to keep wrapper checkpoints in, '
+                             'wrappers survive restarts if given')
+    parser.add_argument('--metrics-port', type=int,
+                        default=DEFAULT_CONFIG['METRICS_PORT'],
+                        help='local HTTP port serving the metrics, not '
+                             'served if not given')
+    parser.add_argument('--cpu-placement', action='store_true',
+                        help='pin every run to CPUs of its own, only '
+                             'pays off with more than one worker')
+    parser.add_argument('--ready-endpoint',
+                        help='endpoint to report to once the server is '
+                             'ready or failed to start')
+    parser.add_argument('--ready-id',
+                        help='id to report with, the host name by default')
+    args = parser.parse_args(argv)
 
-def run_server():
-    # Instanciate the application with default configuration
-    app = SimphonyApplication()
+    # Instanciate the application, defaults apply to the rest
+    try:
+        app = SimphonyApplication({'SERVER_IP': args.ip,
+                                   'API_PORT': args.api_port,
+                                   'PUB_PORT': args.pub_port,
+                                   'WORKERS': args.workers,
+                                   'ENGINE_CACHE': args.engine_cache,
+                                   'CHECKPOINT_DIR': args.checkpoint_dir,
+                                   'METRICS_PORT': args.metrics_port,
+                                   'CPU_PLACEMENT': args.cpu_placement,
+                                   'READY_ENDPOINT': args.ready_endpoint,
+                                   'READY_ID': args.ready_id})
+    except Exception as e:
+        report_startup(args.ready_endpoint, args.ready_id, error=repr(e))
+        raise
     logging.getLogger().setLevel(logging.DEBUG)
     print 'Starting simphony application'
     print 'Current logger is: %s' % logging.getLogger().name
@@ -60,7 +324,7 @@ def run_server():
     print 'Logger levels are: %s' % logging._levelNames
 
 
-    # Run the application on default port and external IP
+    # Run the application on the given ports and IP
     app.run()
 
 
@@ -6,24 +6,56 @@ Testing module for a proxy for internal wrapper of JYU-LB modeling engine.
 import time
 import math
 import os
+import sys
 import tempfile
 import shutil
 import unittest
 import logging
 
+import gevent
+from gevent.event import AsyncResult
+from gevent.queue import Queue
+import zerorpc
+import zmq.green as zmq
+import numpy as np
+import msgpack
+
 root_logger = logging.getLogger()
 root_logger.setLevel(logging.DEBUG)
 
 from simphony.core.cuba import CUBA
+from simphony.core.data_container import DataContainer
 from simphony.cuds.abc_modeling_engine import ABCModelingEngine
 from jyulb.cuba_extension import CUBAExtension
 from simphony.cuds.lattice import make_cubic_lattice
 from simphony.engine import jyulb_internal_isothermal as lb
 from jyulb.internal.common.proxy_lattice import ProxyLattice
 from simphony.engine import proxy
+from cloud.serialization import cloudpickle as pickle
 
 from .model import CUDS
-from .server import SimphonyFarm
+from .server import SimphonyFarm, LocalFarm
+from .application import _wait_workers
+from .trajectory import TrajectoryStore
+from .publisher import EventPublisher
+from .registry import EngineRegistry, _scan_source
+from .warmpool import EnginePool
+from .pool import PooledClient
+from .broker import WorkerBroker
+from .proxy import ProxyEngine, HostLost, GatherTimeout, RunFailed, gather
+from .checkpoint import CheckpointStore
+from .benchmarks.synthetic import SyntheticEngine, busy_wait
+from .manager import SimphonyManager
+from .metrics import MetricsRegistry, RPCMetrics
+from .tracing import Trace, summarize
+from .pipeline import Pipeline
+from .geometry import LatticeDescriptor
+from .datasets import dataset_arrays
+from .placement import CpuPlacer, parse_cpulist
+from .api import SimphonyAPI
+from . import serialization
+from . import memory
+from . import constants
 
 
 class SimphonyNetworkTestCase(unittest.TestCase):
@@ -113,16 +145,14 @@ class SimphonyNetworkTestCase(unittest.TestCase):
         # Run the case
         start_time = time.time()
 
-        # Prepare remote SimPhoNy servers
-        farm = SimphonyFarm(['pc-p115'])
+        # Prepare a local SimPhoNy server
+        farm = LocalFarm(1)
         farm.start()
-        logging.debug('Farm is starting...')
-
-        import time as t
-        t.sleep(5)
+        self.addCleanup(farm.stop)
 
         # Create the proxy
-        proxy_engine = proxy.ProxyEngine(cuds, 'JYUEngine', host='pc-p115')
+        proxy_engine = proxy.ProxyEngine(cuds, 'JYUEngine',
+                                         **farm.endpoints[0])
         proxy_engine.run(async=False)
 
         self.assertIsInstance(proxy_engine, ABCModelingEngine,
@@ -192,5 +222,982 @@ class SimphonyNetworkTestCase(unittest.TestCase):
         d = (centerl/self.channel_h)*(centerl/self.channel_h)
         return self.max_vel*(1.0 - d)
 
+
+class TrajectoryStoreTestCase(unittest.TestCase):
+
+    """Test case for TrajectoryStore class."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+
+    def test_append_and_read_frames(self):
+        """Frames are spread over chunks and can be read back."""
+        store = TrajectoryStore(self.temp_dir, chunk_frames=2)
+        for step in range(5):
+            store.append(step * 10, {'DENSITY': np.full(6, step, float),
+                                     'VELOCITY': np.ones((6, 3)) * step})
+
+        # Reopen the store from its index
+        store = TrajectoryStore(self.temp_dir, chunk_frames=2)
+        self.assertEqual(len(store), 5)
+        self.assertEqual(store.steps, [0, 10, 20, 30, 40])
+        self.assertEqual(len(os.listdir(self.temp_dir)), 4)
+
+        frame = store.get_frame(4)
+        np.testing.assert_array_equal(frame['VELOCITY'], np.ones((6, 3)) * 4)
+
+        densities = [a[0] for a in store.iter_attribute('DENSITY', 1, 4)]
+        self.assertEqual(densities, [1.0, 2.0, 3.0])
+
+
+class EventPublisherTestCase(unittest.TestCase):
+
+    """Test case for EventPublisher class."""
+
+    class RecordingSocket(object):
+        def __init__(self):
+            self.sent = []
+
+        def send_multipart(self, frames):
+            self.sent.append(frames)
+
+    def test_conflate_progress_events(self):
+        """Only the latest progress event of a topic is sent."""
+        socket = self.RecordingSocket()
+        publisher = EventPublisher(socket, 1.0, constants.CONFLATED_EVENTS)
+        publisher.publish('w1', event=constants.WRAPPER_STATE_CHANGE_TOPIC,
+                          state='running')
+        for step in range(10):
+            publisher.publish('w1', event=constants.WRAPPER_PROGRESS_TOPIC,
+                              step=step)
+            publisher.publish('w2', event=constants.WRAPPER_PROGRESS_TOPIC,
+                              step=step)
+        self.assertEqual(socket.sent, [])
+
+        publisher.flush()
+        self.assertEqual([frames[0] for frames in socket.sent], ['w1', 'w2'])
+        events = [msgpack.unpackb(packed) for packed in socket.sent[0][1:]]
+        self.assertEqual([event.get('step') for event in events], [None, 9])
+
+
+class PooledClientTestCase(unittest.TestCase):
+
+    """Test case for PooledClient class."""
+
+    def test_stream(self):
+        """Streams hold the client until they are exhausted."""
+        client = PooledClient('tcp://127.0.0.1:1')
+        client._client = lambda method, *args, **kwargs: (
+            x for x in range(3))
+        stream = client.stream_frames('w1')
+        self.assertEqual(client.in_flight, 1)
+        self.assertEqual(client.idle_for(), 0)
+        self.assertEqual(list(stream), [0, 1, 2])
+        self.assertEqual(client.in_flight, 0)
+        client.stream_frames('w1').close()
+        self.assertEqual(client.in_flight, 0)
+        self.assertRaises(AttributeError, getattr, client, '__deepcopy__')
+
+
+class WorkerBrokerTestCase(unittest.TestCase):
+
+    """Test case for WorkerBroker class."""
+
+    class FakeSocket(object):
+        def __init__(self):
+            self.sent = []
+
+        def send_multipart(self, frames):
+            self.sent.append(frames)
+
+    def setUp(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        endpoint = 'ipc://%s/%%s' % temp_dir
+        self.broker = WorkerBroker(endpoint % 'api',
+                                   [endpoint % 'w0', endpoint % 'w1'],
+                                   endpoint % 'pub', endpoint % 'xsub',
+                                   channel_timeout=10)
+        self.broker._frontend = self.FakeSocket()
+        self.broker._xpub = self.FakeSocket()
+
+    def call(self, channel, name, *args):
+        """Send a call and return the worker it was routed to"""
+        self.broker._from_client(['client', '', msgpack.packb(
+            [{'message_id': channel, 'v': 3}, name, list(args)])])
+        return self.broker._channels[channel]
+
+    def answer(self, channel, result, name='OK'):
+        event = msgpack.packb([{'message_id': 'r', 'response_to': channel,
+                                'v': 3}, name, [result]])
+        self.broker._from_worker(self.broker._channels[channel],
+                                 ['client', '', event])
+
+    def test_routing(self):
+        """Calls avoid workers running engines and follow wrappers."""
+        broker = self.broker
+        worker = self.call('c1', 'create_wrapper', 'Engine', '')
+        self.answer('c1', 'w1')
+        self.assertEqual(self.call('c2', 'run_wrapper', 'w1', {}), worker)
+        self.answer('c2', None)
+        # Both workers are idle, but one is blocked by the run
+        for channel in ('c3', 'c4'):
+            self.assertNotEqual(self.call(channel, 'get_wrappers'), worker)
+            self.answer(channel, [])
+        broker._from_publisher(['w1', msgpack.packb(
+            {'event': constants.WRAPPER_STATE_CHANGE_TOPIC,
+             'state': constants.WrapperState.done.value})])
+        self.assertEqual(broker._running, {})
+        self.assertEqual(broker._xpub.sent[-1][0], 'w1')
+        self.call('c5', 'delete_wrapper', 'w1')
+        self.answer('c5', None)
+        self.assertEqual(broker.registry, {})
+
+    def test_stale_channels(self):
+        """Channels of vanished clients stop counting as load."""
+        worker = self.call('c1', 'get_wrappers')
+        self.broker._last_seen['c1'] -= 20
+        self.broker._drop_stale()
+        self.assertEqual(self.broker._load[worker], 0)
+        self.assertNotIn('c1', self.broker._channels)
+
+
+class EngineRegistryTestCase(unittest.TestCase):
+
+    """Test case for EngineRegistry class."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        sys.path.insert(0, self.temp_dir)
+        self.addCleanup(sys.path.remove, self.temp_dir)
+
+    def test_missing_name(self):
+        """Modules are imported when a name is not in their source."""
+        with open(os.path.join(self.temp_dir, 'star_engines.py'), 'w') as f:
+            f.write('from simphony_network.benchmarks.synthetic import *\n'
+                    'AliasEngine = SyntheticEngine\n')
+        self.assertIsNone(_scan_source(f.name, 'star_engines'))
+        registry = EngineRegistry()
+        registry._unscanned = ['star_engines']
+        self.assertIn('AliasEngine', registry)
+        self.assertIs(registry.get('AliasEngine'), SyntheticEngine)
+        self.assertNotIn('OtherEngine', registry)
+
+    def test_scan_source(self):
+        """Only classes of the module and of its own package are indexed."""
+        with open(os.path.join(self.temp_dir, 'own_engines.py'), 'w') as f:
+            f.write('from simphony.core.data_container import DataContainer\n'
+                    'from own_engines.fast import FastEngine\n'
+                    'from .helpers import Settings\n'
+                    'class SlowEngine(object):\n'
+                    '    pass\n')
+        self.assertEqual(_scan_source(f.name, 'own_engines'),
+                         ['FastEngine', 'Settings', 'SlowEngine'])
+
+    def test_not_an_engine(self):
+        """Names which turn out not to be engines are dropped."""
+        with open(os.path.join(self.temp_dir, 'helper_engines.py'), 'w') as f:
+            f.write('class Settings(object):\n'
+                    '    pass\n')
+        registry = EngineRegistry()
+        registry._index['Settings'] = 'helper_engines'
+        self.assertRaises(KeyError, registry.get, 'Settings')
+        self.assertNotIn('Settings', registry)
+
+
+class EnginePoolTestCase(unittest.TestCase):
+
+    """Test case for EnginePool class."""
+
+    class CountingEngine(object):
+        created = 0
+
+        def __init__(self):
+            type(self).created += 1
+            self.dirty = False
+
+        def reset(self):
+            self.dirty = False
+
+    def test_acquire_and_release(self):
+        """Instances are built ahead of time and recycled after reset."""
+        registry = EngineRegistry()
+        registry.register('CountingEngine', self.CountingEngine)
+        pool = EnginePool(registry, {'CountingEngine': 2})
+        self.assertIsNone(pool.acquire('OtherEngine'))
+
+        pool.start()
+        gevent.sleep(0.01)
+        self.assertEqual(pool.sizes(), {'CountingEngine': 2})
+
+        engine = pool.acquire('CountingEngine')
+        engine.dirty = True
+        self.assertTrue(pool.release('CountingEngine', engine))
+        self.assertFalse(engine.dirty)
+        gevent.sleep(0.01)
+        # The refill after acquiring did not overfill the pool
+        self.assertEqual(pool.sizes(), {'CountingEngine': 2})
+        self.assertFalse(pool.release('CountingEngine',
+                                      self.CountingEngine()))
+
+
+class CheckpointStoreTestCase(unittest.TestCase):
+
+    """Test case for CheckpointStore class."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+
+    def test_save_and_restore(self):
+        """Lattices are restored from their attribute arrays."""
+        engine = SyntheticEngine()
+        engine.CM[CUBA.NUMBER_OF_TIME_STEPS] = 4
+        lat = make_cubic_lattice('lattice1', 1.0, (2, 3, 1))
+        nodes = []
+        for node in lat.iter_nodes():
+            node.data[CUBA.DENSITY] = float(node.index[1])
+            if node.index[0] == 0:
+                node.data[CUBA.VELOCITY] = (1.0, 2.0, 3.0)
+            nodes.append(node)
+        lat.update_nodes(nodes)
+        engine.add_dataset(lat)
+
+        store = CheckpointStore(self.temp_dir)
+        store.save('w1', engine, 2, 10)
+        store.save('w1', engine, 4, 10)
+        self.assertEqual(len(os.listdir(os.path.join(self.temp_dir, 'w1'))), 2)
+
+        restored = SyntheticEngine()
+        self.assertEqual(store.restore('w1', restored), (4, 10))
+        self.assertEqual(restored.CM[CUBA.NUMBER_OF_TIME_STEPS], 10)
+        for node in store.load_dataset('w1', 'lattice1').iter_nodes():
+            self.assertEqual(node.data[CUBA.DENSITY], node.index[1])
+            self.assertEqual(CUBA.VELOCITY in node.data, node.index[0] == 0)
+
+    def test_registry(self):
+        """Every wrapper keeps its own record, deleted ones are dropped."""
+        store = CheckpointStore(self.temp_dir)
+        store.save_initial('w1', 'cuds')
+        store.save_record('w1', {'state': 'init'})
+        store.save_record('w2', {'state': 'running'})
+        store.save_record('w1', {'state': 'done'})
+        store.remove('w2')
+        self.assertEqual(store.load_registry(), {'w1': {'state': 'done'}})
+
+
+class ManagerTestMixin(object):
+
+    """Managers and submissions for test cases of SimphonyManager."""
+
+    def make_manager(self, **config):
+        """Return a manager with SyntheticEngine registered, removing its
+        trajectories after the test"""
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        config.update(TRAJECTORY_DIR=temp_dir, ENGINE_CACHE=None)
+        manager = SimphonyManager(config)
+        manager._registry.register('SyntheticEngine', SyntheticEngine)
+        return manager
+
+    def make_cuds(self, steps=10, **datasets):
+        """Return a pickled CUDS with the given datasets, running the given
+        number of time steps"""
+        cm = DataContainer()
+        cm[CUBA.NUMBER_OF_TIME_STEPS] = steps
+        return pickle.dumps(CUDS(cm=cm, sd=datasets))
+
+
+class CancellationTestCase(ManagerTestMixin, unittest.TestCase):
+
+    """Test case for stopping runs of SimphonyManager."""
+
+    class SlowEngine(SyntheticEngine):
+        def run(self):
+            busy_wait(0.01 * self.CM[CUBA.NUMBER_OF_TIME_STEPS])
+
+    def setUp(self):
+        self.manager = self.make_manager()
+        self.manager._registry.register('SlowEngine', self.SlowEngine)
+        self.cuds = self.make_cuds(1000)
+
+    def wait(self, wrapper_id):
+        while self.manager.get_wrapper_state(wrapper_id) not in \
+                constants.FINISHED_STATES:
+            gevent.sleep(0.01)
+        return self.manager.get_wrapper_state(wrapper_id)
+
+    def test_cancel(self):
+        """Cancelled runs stop between chunks and release their engine."""
+        wrapper_id = self.manager.create_wrapper('SlowEngine', self.cuds)
+        self.manager.run_wrapper(wrapper_id, {'chunk_steps': 5})
+        gevent.sleep(0.1)
+        self.assertEqual(self.manager.cancel_wrapper(wrapper_id),
+                         constants.WrapperState.cancelled.value)
+        self.assertIsNone(self.manager._wrappers[wrapper_id]['wrapper'])
+        self.assertRaises(Exception, self.manager.get_dataset,
+                          wrapper_id, 'lattice1')
+
+    def test_deadline(self):
+        """Runs passing their deadline are stopped."""
+        wrapper_id = self.manager.create_wrapper('SlowEngine', self.cuds)
+        start = time.time()
+        self.manager.run_wrapper(wrapper_id, {'chunk_steps': 5,
+                                              'timeout': 0.2})
+        self.assertEqual(self.wait(wrapper_id),
+                         constants.WrapperState.timed_out.value)
+        self.assertLess(time.time() - start, 1.0)
+
+    def test_deadline_unchunked(self):
+        """Runs with a deadline are chunked even if not asked to."""
+        wrapper_id = self.manager.create_wrapper('SlowEngine', self.cuds)
+        start = time.time()
+        self.manager.run_wrapper(wrapper_id, {'timeout': 0.2})
+        self.assertEqual(self.wait(wrapper_id),
+                         constants.WrapperState.timed_out.value)
+        self.assertLess(time.time() - start, 1.0)
+
+    def test_stats(self):
+        """Resources used by the engine are accounted to its wrapper."""
+        wrapper_id = self.manager.create_wrapper('SlowEngine', self.cuds)
+        self.manager.run_wrapper(wrapper_id, {'chunk_steps': 5,
+                                              'timeout': 0.2})
+        self.wait(wrapper_id)
+        stats = self.manager.get_wrapper_stats(wrapper_id)
+        self.assertEqual(stats['bytes_in'], len(self.cuds))
+        self.assertGreater(stats['cpu_time'], 0.1)
+        self.assertGreaterEqual(stats['run_time'], stats['cpu_time'] * 0.5)
+        self.assertGreater(stats['max_rss'], 0)
+
+
+class PlacementTestCase(ManagerTestMixin, unittest.TestCase):
+
+    """Test case for CpuPlacer class."""
+
+    def setUp(self):
+        self.placer = CpuPlacer(range(8), {0: range(4), 1: range(4, 8)})
+
+    def test_parse_cpulist(self):
+        """Kernel CPU lists are expanded."""
+        self.assertEqual(parse_cpulist('0-3,8\n'), [0, 1, 2, 3, 8])
+
+    def test_numa_local(self):
+        """Runs get disjoint CPUs, on a single node while they fit."""
+        first = self.placer.acquire(2)
+        second = self.placer.acquire(2)
+        third = self.placer.acquire(4)
+        self.assertEqual(sorted(first + second), range(4))
+        self.assertEqual(third, range(4, 8))
+
+    def test_wait(self):
+        """Runs wait until enough CPUs are released."""
+        cpus = self.placer.acquire(6)
+        waiting = gevent.spawn(self.placer.acquire, 4)
+        gevent.sleep(0.01)
+        self.assertFalse(waiting.ready())
+        self.placer.release(cpus)
+        self.assertEqual(len(waiting.get(timeout=1)), 4)
+        self.assertRaises(ValueError, self.placer.acquire, 9)
+
+    def test_split(self):
+        """Workers get disjoint shares of the CPUs, node by node."""
+        self.assertEqual(self.placer.split(1, 2).cpus, range(4, 8))
+        self.assertEqual(self.placer.split(2, 3).nodes, [[5, 6, 7]])
+
+    def test_manager(self):
+        """The manager pins runs to the CPUs they ask for."""
+        manager = self.make_manager(CPU_PLACEMENT=True)
+        wrapper_id = manager.create_wrapper('SyntheticEngine',
+                                            self.make_cuds())
+        self.assertRaises(ValueError, manager.run_wrapper, wrapper_id,
+                          {'cores': len(manager._placer.cpus) + 1})
+        manager.run_wrapper(wrapper_id, {'cores': 1})
+        manager._wrappers[wrapper_id]['greenlet'].join()
+        cpus = manager.get_wrapper_stats(wrapper_id)['cpus']
+        self.assertEqual(len(cpus), 1)
+        self.assertEqual(manager._placer.free(), len(manager._placer.cpus))
+
+    def test_cancel_queued(self):
+        """Runs waiting for CPUs can be cancelled and never start."""
+        manager = self.make_manager(CPU_PLACEMENT=True)
+        wrapper_id = manager.create_wrapper('SyntheticEngine',
+                                            self.make_cuds())
+        cpus = manager._placer.acquire(len(manager._placer.cpus))
+        manager.run_wrapper(wrapper_id)
+        self.assertEqual(manager.get_wrapper_state(wrapper_id),
+                         constants.WrapperState.init.value)
+        self.assertEqual(manager.cancel_wrapper(wrapper_id),
+                         constants.WrapperState.cancelled.value)
+        manager._placer.release(cpus)
+        gevent.sleep(0.01)
+        self.assertEqual(manager.get_wrapper_state(wrapper_id),
+                         constants.WrapperState.cancelled.value)
+        self.assertEqual(manager._placer.free(), len(manager._placer.cpus))
+
+
+class MemoryTestCase(ManagerTestMixin, unittest.TestCase):
+
+    """Test case for memory profiling."""
+
+    class Leak(object):
+        pass
+
+    def test_deep_size(self):
+        """Array data shared by views is counted once."""
+        array = np.zeros(10000)
+        size = memory.deep_size([array, array[1:], array[::2]])
+        self.assertGreater(size, array.nbytes)
+        self.assertLess(size, array.nbytes + 1000)
+
+    def test_diff(self):
+        """Snapshot diffs tell which types grew."""
+        profiler = memory.MemoryProfiler()
+        self.assertRaises(KeyError, profiler.diff)
+        baseline = profiler.start()
+        leaks = [self.Leak() for _ in range(1000)]
+        snapshot = profiler.snapshot()
+        name = '%s.Leak' % __name__
+        changes = dict((change['type'], change) for change in
+                       profiler.diff(baseline['snapshot_id'],
+                                     snapshot['snapshot_id'],
+                                     limit=None)['types'])
+        self.assertEqual(changes[name]['count_diff'], len(leaks))
+        self.assertIn(name, [top['type'] for top in profiler.top(None)])
+        profiler.stop()
+        self.assertFalse(profiler.started)
+
+    def test_wrapper_memory(self):
+        """The footprint of a wrapper covers its datasets."""
+        manager = self.make_manager()
+        lattice = make_cubic_lattice('lattice1', 1.0, (10, 10, 1))
+        wrapper_id = manager.create_wrapper(
+            'SyntheticEngine', self.make_cuds(lattice1=lattice))
+        footprint = manager.get_wrapper_memory(wrapper_id)
+        self.assertGreater(footprint['datasets']['lattice1'], 0)
+        self.assertGreaterEqual(footprint['total'],
+                                footprint['datasets']['lattice1'])
+
+
+class MetricsTestCase(unittest.TestCase):
+
+    """Test case for RPCMetrics class."""
+
+    class API(object):
+        def echo(self, msg):
+            return msg
+
+        def fail(self):
+            raise ValueError()
+
+    def test_instrument(self):
+        """Calls are counted and rendered in the Prometheus format."""
+        registry = MetricsRegistry()
+        methods = RPCMetrics(registry).instrument(self.API())
+        self.assertEqual(sorted(methods), ['echo', 'fail'])
+        self.assertEqual(methods['echo']('x' * 2000), 'x' * 2000)
+        self.assertRaises(ValueError, methods['fail'])
+
+        lines = registry.render().splitlines()
+        self.assertIn('simphony_rpc_calls_total{method="echo",status="ok"} 1.0',
+                      lines)
+        self.assertIn('simphony_rpc_calls_total{method="fail",status="error"} 1.0',
+                      lines)
+        self.assertIn('simphony_rpc_in_flight{method="echo"} 0.0', lines)
+        self.assertIn('simphony_rpc_request_bytes_bucket'
+                      '{method="echo",le="1024.0"} 0', lines)
+        self.assertIn('simphony_rpc_request_bytes_bucket'
+                      '{method="echo",le="4096.0"} 1', lines)
+
+
+class ProgressTestCase(unittest.TestCase):
+
+    """Test case for the progress events of ProxyEngine."""
+
+    class FakeSubscriber(object):
+        def __init__(self):
+            self.events = Queue()
+
+        def recv(self, timeout=None):
+            return 'w1', self.events.get(timeout=timeout)
+
+    def test_every_listener(self):
+        """Callbacks and iterations all receive every event."""
+        engine = ProxyEngine(CUDS(), 'Engine', 'a')
+        engine._wrapper_id = 'w1'
+        engine._subscriber = subscriber = self.FakeSubscriber()
+        received = []
+        engine.on_progress(received.append)
+        engine._start_dispatcher()
+        iterations = [gevent.spawn(list, engine.iter_progress())
+                      for _ in range(2)]
+        gevent.sleep(0)
+        events = [{'event': constants.WRAPPER_PROGRESS_TOPIC, 'step': 1},
+                  {'event': constants.WRAPPER_STATE_CHANGE_TOPIC,
+                   'state': constants.WrapperState.done.value}]
+        for event in events:
+            subscriber.events.put(event)
+        self.assertEqual([iteration.get(timeout=1)
+                          for iteration in iterations], [events, events])
+        self.assertEqual(received, events)
+
+
+class GatherTestCase(unittest.TestCase):
+
+    """Test case for gather function."""
+
+    def test_timeout(self):
+        """Results which are not ready in time are handed back."""
+        ready, pending = AsyncResult(), AsyncResult()
+        ready.set('w1')
+        with self.assertRaises(GatherTimeout) as caught:
+            gather([ready, pending], timeout=0.01)
+        self.assertEqual(caught.exception.pending, [pending])
+        pending.set('w2')
+        self.assertEqual(gather([ready, pending]), ['w1', 'w2'])
+
+    def test_failed_run(self):
+        """Runs which do not finish done make gather raise."""
+        remote = ProxyFailoverTestCase.FakeRemote(
+            True, state=constants.WrapperState.failed.value)
+        engine = ProxyEngine(CUDS(), 'Engine', 'a', poll_interval=0)
+        engine._remote = remote
+        with self.assertRaises(RunFailed) as caught:
+            gather([engine.run(async=True)])
+        self.assertEqual(caught.exception.wrapper_id, 'w1')
+        self.assertEqual(caught.exception.state,
+                         constants.WrapperState.failed.value)
+
+
+class ProxyFailoverTestCase(unittest.TestCase):
+
+    """Test case for resubmitting jobs of lost hosts."""
+
+    class FakeRemote(object):
+        def __init__(self, alive, dies=False, busy=0,
+                     state=constants.WrapperState.done.value):
+            self.alive = alive
+            # Final state of the runs
+            self.state = state
+            self.reachable = alive
+            self.dies = dies
+            # State polls to time out before answering
+            self.busy = busy
+            self.created = 0
+            self.calls = []
+
+        def ping(self, timeout):
+            return self.alive
+
+        def __call__(self, method, *args, **kwargs):
+            self.calls.append(method)
+            if not self.alive:
+                raise zerorpc.LostRemote('Lost remote')
+            if method == 'create_wrapper':
+                self.created += 1
+                return 'w%s' % self.created
+            if method == 'get_wrapper_state':
+                if self.dies:
+                    self.alive = self.reachable = False
+                    raise zerorpc.TimeoutExpired(1)
+                if self.busy:
+                    self.busy -= 1
+                    raise zerorpc.TimeoutExpired(1)
+                return self.state
+
+    def setUp(self):
+        self.remotes = {'a': self.FakeRemote(True, dies=True),
+                        'b': self.FakeRemote(False),
+                        'c': self.FakeRemote(True)}
+
+    def make_engine(self, max_retries):
+        engine = ProxyEngine(CUDS(), 'Engine', 'a', fallback_hosts=['b', 'c'],
+                             max_retries=max_retries, poll_interval=0)
+        engine._get_remote = self.remotes.get
+        engine._remote = self.remotes['a']
+        engine._reachable = lambda: self.remotes[engine._host].reachable
+        return engine
+
+    def test_busy_host(self):
+        """A host busy with an engine is waited for, not failed over."""
+        self.remotes['a'] = self.FakeRemote(True, busy=3)
+        engine = self.make_engine(max_retries=1)
+        self.assertEqual(engine.run(), 'w1')
+        self.assertEqual(engine._host, 'a')
+        self.assertEqual(self.remotes['c'].created, 0)
+
+    def test_abandon_lost_run(self):
+        """The run on a lost host is cancelled and deleted if it answers."""
+        engine = self.make_engine(max_retries=1)
+        # The host stops accepting connections but still answers calls
+        self.remotes['a'].dies = False
+        self.remotes['a'].busy = 1
+        self.remotes['a'].reachable = False
+        self.assertEqual(engine.run(), 'w1')
+        self.assertEqual(engine._host, 'c')
+        self.assertEqual(self.remotes['a'].calls[-2:],
+                         ['cancel_wrapper', 'delete_wrapper'])
+
+    def test_resubmit_to_next_live_host(self):
+        """A job of a lost host is resubmitted to the next live host."""
+        engine = self.make_engine(max_retries=1)
+        self.assertEqual(engine.run(), 'w1')
+        self.assertEqual(engine._host, 'c')
+        self.assertEqual(self.remotes['c'].created, 1)
+
+    def test_bounded_retries(self):
+        """No resubmission happens beyond the retry limit."""
+        engine = self.make_engine(max_retries=0)
+        self.assertRaises(HostLost, engine.run)
+        self.assertEqual(self.remotes['c'].created, 0)
+
+
+class SyntheticEngineTestCase(unittest.TestCase):
+
+    """Test case for SyntheticEngine class."""
+
+    class Engine(SyntheticEngine):
+        item_time = 0.001
+        output_nodes = 10
+
+    def test_run(self):
+        """Runs take time per item and time step and write an output lattice."""
+        engine = self.Engine()
+        engine.CM[CUBA.NUMBER_OF_TIME_STEPS] = 5
+        engine.add_dataset(make_cubic_lattice('lattice', 1.0, (4, 5, 1)))
+        start = time.time()
+        engine.run()
+        self.assertGreaterEqual(time.time() - start, 0.1)
+        self.assertEqual(engine.steps, 5)
+        output = engine.get_dataset('output')
+        self.assertEqual(len(list(output.iter_nodes())), 10)
+
+
+class PipelineTestCase(ManagerTestMixin, unittest.TestCase):
+
+    """Test case for pipelines run by SimphonyManager."""
+
+    class FailingEngine(SyntheticEngine):
+        def run(self):
+            raise RuntimeError()
+
+    def setUp(self):
+        self.manager = self.make_manager()
+        self.manager._registry.register('FailingEngine', self.FailingEngine)
+        self.lattice = make_cubic_lattice('lattice1', 1.0, (2, 2, 1))
+        node = self.lattice.get_node((1, 0, 0))
+        node.data[CUBA.DENSITY] = 2.0
+        self.lattice.update_nodes([node])
+        self.source = self.make_cuds(lattice1=self.lattice)
+        self.cuds = self.make_cuds()
+
+    def wait(self, pipeline_id):
+        while self.manager.get_pipeline_state(pipeline_id)['state'] not in \
+                constants.FINISHED_STATES:
+            gevent.sleep(0.01)
+        return self.manager.get_pipeline_state(pipeline_id)
+
+    def test_validation(self):
+        """Stages have to form a DAG."""
+        self.assertEqual(Pipeline([
+            {'name': 'b', 'type': 'E', 'cuds': '', 'inputs': [('a', 'x')]},
+            {'name': 'a', 'type': 'E', 'cuds': ''}]).order, ['a', 'b'])
+        self.assertRaises(ValueError, Pipeline, [
+            {'name': 'a', 'type': 'E', 'cuds': '', 'inputs': [('b', 'x')]},
+            {'name': 'b', 'type': 'E', 'cuds': '', 'inputs': [('a', 'x')]}])
+        self.assertRaises(ValueError, Pipeline, [
+            {'name': 'a', 'type': 'E', 'cuds': '', 'inputs': [('c', 'x')]}])
+
+    def test_datasets_flow(self):
+        """Datasets of a stage are copied to the next one in memory."""
+        created = self.manager.create_pipeline([
+            {'name': 'first', 'type': 'SyntheticEngine', 'cuds': self.source},
+            {'name': 'second', 'type': 'SyntheticEngine', 'cuds': self.cuds,
+             'inputs': [('first', 'lattice1')]}])
+        state = self.wait(created['pipeline_id'])
+        self.assertEqual(state['state'], constants.WrapperState.done.value)
+        first = self.manager._get_wrapper(created['wrappers']['first'])
+        second = self.manager._get_wrapper(created['wrappers']['second'])
+        copied = second.get_dataset('lattice1')
+        self.assertIsNot(copied, first.get_dataset('lattice1'))
+        expected, _, expected_masks = dataset_arrays(
+            first.get_dataset('lattice1'))
+        arrays, _, masks = dataset_arrays(copied)
+        self.assertEqual(sorted(arrays), sorted(expected))
+        for name in expected:
+            np.testing.assert_array_equal(arrays[name], expected[name])
+        for name in expected_masks:
+            np.testing.assert_array_equal(masks[name], expected_masks[name])
+        self.assertEqual(second.steps, 10)
+
+    def test_failed_stage(self):
+        """Stages after a failed stage are skipped."""
+        created = self.manager.create_pipeline([
+            {'name': 'first', 'type': 'FailingEngine', 'cuds': self.source},
+            {'name': 'second', 'type': 'SyntheticEngine', 'cuds': self.cuds,
+             'inputs': [('first', 'lattice1')]}])
+        state = self.wait(created['pipeline_id'])
+        self.assertEqual(state['state'], constants.WrapperState.failed.value)
+        self.assertEqual(state['stages']['first']['state'],
+                         constants.WrapperState.failed.value)
+        self.assertEqual(state['stages']['second']['state'], 'skipped')
+        self.manager.delete_pipeline(created['pipeline_id'])
+        self.assertEqual(self.manager._wrappers, {})
+
+
+class TransferTestCase(ManagerTestMixin, unittest.TestCase):
+
+    """Test case for dataset transfers between servers."""
+
+    ports = (18045, 18046)
+
+    def setUp(self):
+        self.managers = []
+        for port in self.ports:
+            manager = self.make_manager()
+            server = zerorpc.Server(SimphonyAPI(manager))
+            server.bind('tcp://127.0.0.1:%s' % port)
+            self.addCleanup(server.close)
+            gevent.spawn(server.run)
+            self.managers.append(manager)
+        lattice = make_cubic_lattice('lattice1', 1.0, (2, 2, 1))
+        self.source = self.managers[0].create_wrapper(
+            'SyntheticEngine', self.make_cuds(lattice1=lattice))
+        self.target = self.managers[1].create_wrapper(
+            'SyntheticEngine', self.make_cuds())
+
+    def test_pull(self):
+        """A server fetches a dataset from another server."""
+        self.managers[1].pull_dataset(self.target,
+                                      'tcp://127.0.0.1:%s' % self.ports[0],
+                                      self.source, 'lattice1')
+        wrapper = self.managers[1]._get_wrapper(self.target)
+        self.assertEqual(wrapper.get_dataset('lattice1').name, 'lattice1')
+
+    def test_push(self):
+        """A server sends a dataset to another server."""
+        self.managers[0].push_dataset(self.source, 'lattice1',
+                                      'tcp://127.0.0.1:%s' % self.ports[1],
+                                      self.target)
+        wrapper = self.managers[1]._get_wrapper(self.target)
+        self.assertEqual(wrapper.get_dataset('lattice1').name, 'lattice1')
+
+
+class LocalFarmTestCase(unittest.TestCase):
+
+    """Test case for servers launched on this machine."""
+
+    def test_start_stop(self):
+        """Every server answers once started and exits once stopped."""
+        farm = LocalFarm(2, base_port=18050)
+        farm.start()
+        self.addCleanup(farm.stop)
+        for endpoint in farm.endpoints:
+            client = zerorpc.Client('tcp://%(host)s:%(port)s' % endpoint)
+            self.assertEqual(client.echo('hi'), 'hi')
+            client.close()
+        farm.stop()
+        self.assertEqual(farm.alive(), [False, False])
+
+    def test_workers(self):
+        """Servers with workers answer once started."""
+        farm = LocalFarm(1, base_port=18056, workers=2)
+        farm.start(timeout=30)
+        self.addCleanup(farm.stop)
+        client = zerorpc.Client('tcp://%(host)s:%(port)s' % farm.endpoints[0])
+        self.assertEqual(client.echo('hi'), 'hi')
+        client.close()
+
+    def test_worker_exit(self):
+        """Workers exiting before they are ready are reported."""
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        context = zmq.Context()
+        socket = context.socket(zmq.PULL)
+        socket.bind('ipc://%s/ready' % temp_dir)
+        self.addCleanup(context.term)
+        self.addCleanup(socket.close, linger=0)
+        pid = gevent.fork()
+        if pid == 0:
+            os._exit(3)
+        with self.assertRaisesRegexp(RuntimeError, 'exit status 3'):
+            _wait_workers(socket, [pid])
+
+    def test_fail_fast(self):
+        """Servers which cannot start are reported without waiting."""
+        # Take the API port of the server
+        taken = zerorpc.Server(object())
+        taken.bind('tcp://127.0.0.1:18054')
+        self.addCleanup(taken.close)
+        farm = LocalFarm(1, base_port=18054)
+        start = time.time()
+        with self.assertRaisesRegexp(RuntimeError, 'failed to start'):
+            farm.start(timeout=30)
+        self.assertLess(time.time() - start, 20)
+        self.assertEqual(farm.alive(), [False])
+
+
+class GeometryTestCase(ManagerTestMixin, unittest.TestCase):
+
+    """Test case for LatticeDescriptor class."""
+
+    SOLID, FLUID = 0, 255
+
+    def setUp(self):
+        self.size = (5, 3, 4)
+        nx = self.size[0]
+        self.descriptor = LatticeDescriptor('lattice1', self.size, 0.5)
+        self.descriptor.assign(CUBA.MATERIAL_ID, self.FLUID)
+        self.descriptor.assign(CUBA.MATERIAL_ID, self.SOLID,
+                               upper=(0, None, None))
+        self.descriptor.assign(CUBA.MATERIAL_ID, self.SOLID,
+                               lower=(nx - 1, None, None))
+        self.descriptor.assign(CUBA.VELOCITY, (0.0, 0.0, 0.0),
+                               where=(CUBA.MATERIAL_ID, self.FLUID))
+        self.descriptor.assign(CUBA.DENSITY, 1.0,
+                               where=(CUBA.MATERIAL_ID, self.FLUID))
+
+    def test_materialize(self):
+        """The lattice matches one built node by node."""
+        lattice = make_cubic_lattice('lattice1', 0.5, self.size)
+        nodes = []
+        for node in lattice.iter_nodes():
+            if node.index[0] in (0, self.size[0] - 1):
+                node.data[CUBA.MATERIAL_ID] = self.SOLID
+            else:
+                node.data[CUBA.MATERIAL_ID] = self.FLUID
+                node.data[CUBA.VELOCITY] = (0.0, 0.0, 0.0)
+                node.data[CUBA.DENSITY] = 1.0
+            nodes.append(node)
+        lattice.update_nodes(nodes)
+
+        built = self.descriptor.materialize()
+        expected, _, expected_masks = dataset_arrays(lattice)
+        arrays, _, masks = dataset_arrays(built)
+        self.assertEqual(sorted(arrays), sorted(expected))
+        for name in expected:
+            np.testing.assert_array_equal(arrays[name], expected[name])
+        for name in expected_masks:
+            np.testing.assert_array_equal(masks[name], expected_masks[name])
+        self.assertEqual(built.size, self.size)
+        self.assertEqual(built.type, 'Cubic')
+
+    def test_mask(self):
+        """Masks are packed and select the same nodes."""
+        mask = np.zeros(self.size, dtype=bool)
+        mask[1, 2, 3] = mask[3, 0, 0] = True
+        self.descriptor.assign(CUBA.DENSITY, 2.0, mask=mask)
+        self.assertEqual(self.descriptor.rules[-1]['mask'].nbytes,
+                         (mask.size + 7) // 8)
+        lattice = self.descriptor.materialize()
+        for index in np.ndindex(*self.size):
+            node = lattice.get_node(index)
+            if mask[index]:
+                self.assertEqual(node.data[CUBA.DENSITY], 2.0)
+            elif index[0] in (0, self.size[0] - 1):
+                self.assertNotIn(CUBA.DENSITY, node.data)
+
+    def test_lattice_type(self):
+        """The type follows the spacing, cubic ones need equal spacing."""
+        self.assertEqual(LatticeDescriptor('lattice2', self.size,
+                                           (0.5, 1.0, 0.5)).type,
+                         'OrthoRhombic')
+        self.assertRaises(ValueError, LatticeDescriptor, 'lattice2',
+                          self.size, (0.5, 1.0, 0.5), lattice_type='Cubic')
+
+    def test_invalid_rules(self):
+        """Rules not fitting the lattice are refused."""
+        self.assertRaises(ValueError, self.descriptor.assign, CUBA.DENSITY,
+                          1.0, mask=np.ones((2, 2, 2)))
+        descriptor = LatticeDescriptor('lattice2', self.size)
+        self.assertRaises(ValueError, descriptor.assign, CUBA.DENSITY, 1.0,
+                          where=(CUBA.MATERIAL_ID, self.FLUID))
+
+    def test_create_wrapper(self):
+        """The server builds the lattice of a descriptor."""
+        manager = self.make_manager()
+        wrapper_id = manager.create_wrapper(
+            'SyntheticEngine', self.make_cuds(lattice1=self.descriptor))
+        lattice = manager._get_wrapper(wrapper_id).get_dataset('lattice1')
+        self.assertEqual(lattice.get_node((0, 1, 1)).data[CUBA.MATERIAL_ID],
+                         self.SOLID)
+        self.assertEqual(lattice.get_node((2, 1, 1)).data[CUBA.DENSITY], 1.0)
+
+
+class SerializationTestCase(unittest.TestCase):
+
+    """Test case for out-of-band serialization."""
+
+    def test_round_trip(self):
+        """Large arrays travel as frames and come back unchanged."""
+        large = np.arange(1000.).reshape(10, 100)
+        cuds = CUDS(sd={'data': {'large': large,
+                                 'fortran': np.asfortranarray(large),
+                                 'strided': large[:, ::2],
+                                 'small': np.arange(3)}})
+        message = serialization.dumps(cuds)
+        self.assertEqual(len(message), 4)
+        # Frames are sent as zerorpc does it
+        message = msgpack.unpackb(msgpack.packb(message, use_bin_type=True),
+                                  raw=False)
+        data = serialization.loads(message).SD['data']
+        np.testing.assert_array_equal(data['large'], large)
+        np.testing.assert_array_equal(data['fortran'], large)
+        np.testing.assert_array_equal(data['strided'], large[:, ::2])
+        np.testing.assert_array_equal(data['small'], np.arange(3))
+        self.assertTrue(data['fortran'].flags.f_contiguous)
+        data['large'][0, 0] = 1.0
+
+    def test_blob(self):
+        """Joined messages and plain pickles are both loaded."""
+        cuds = CUDS(sd={'large': np.arange(1000.)})
+        for blob in (serialization.join(serialization.dumps(cuds)),
+                     pickle.dumps(cuds)):
+            np.testing.assert_array_equal(
+                serialization.loads_blob(blob).SD['large'], np.arange(1000.))
+
+
+class TraceTestCase(unittest.TestCase):
+
+    """Test case for Trace class."""
+
+    def make_trace(self, server=True):
+        trace = Trace()
+        trace.add('pickle', 0.0, 1.0)
+        trace.add('create', 1.0, 4.0)
+        trace.add('wait', 4.0, 14.0)
+        if server:
+            trace.server_spans = [{'name': 'create', 'start': 100.0, 'end': 101.0},
+                                  {'name': 'queue', 'start': 101.5, 'end': 102.5},
+                                  {'name': 'run', 'start': 102.5, 'end': 110.5}]
+        return trace
+
+    def test_summary(self):
+        """Phases spanning client and server are derived from durations."""
+        summary = self.make_trace().summary()
+        self.assertEqual(list(summary), ['pickle', 'upload', 'create', 'queue',
+                                         'run', 'completion'])
+        self.assertEqual(summary['upload'], 2.0)
+        self.assertEqual(summary['create'], 1.0)
+        self.assertEqual(summary['queue'], 1.0)
+        self.assertEqual(summary['run'], 8.0)
+        self.assertEqual(summary['completion'], 1.0)
+
+    def test_summary_without_server(self):
+        """Without server spans waiting counts as running."""
+        summary = self.make_trace(server=False).summary()
+        self.assertEqual(list(summary), ['pickle', 'create', 'run'])
+        self.assertEqual(summary['run'], 10.0)
+
+    def test_summarize(self):
+        """Summaries of several traces are aggregated per phase."""
+        report = summarize([self.make_trace(), self.make_trace(server=False)])
+        self.assertEqual(report['pickle']['count'], 2)
+        self.assertEqual(report['queue']['count'], 1)
+        self.assertEqual(report['run']['min'], 8.0)
+        self.assertEqual(report['run']['max'], 10.0)
+        self.assertEqual(report['run']['mean'], 9.0)
+
 if __name__ == '__main__':
     unittest.main()
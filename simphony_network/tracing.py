@@ -0,0 +1,161 @@
+"""
+This module is part of simphony-network package.
+
+Phase timing of remote jobs.
+
+A `Trace` collects the spans of a single job, e.g. pickling the CUDS,
+creating the remote wrapper or fetching a dataset. With the
+`TracingMiddleware` registered in zerorpc, the trace id of the calling
+greenlet travels in the headers of every call, so the server can record
+its own spans of the same job and hand them back to the client.
+
+Client and server clocks are not synchronized. Phases which span both
+sides, e.g. the upload of the CUDS, are derived from durations only.
+"""
+import time
+import uuid
+from contextlib import contextmanager
+from collections import OrderedDict
+
+from gevent.local import local
+import zerorpc
+
+# Phases of a job in the order they happen
+PHASES = ('pickle', 'upload', 'create', 'queue', 'run', 'completion',
+          'fetch', 'unpickle')
+
+_current = local()
+
+
+def current_trace_id():
+    """Return the trace id of the running greenlet, or None"""
+    return getattr(_current, 'trace_id', None)
+
+
+def set_trace_id(trace_id):
+    """Set the trace id of the running greenlet"""
+    _current.trace_id = trace_id
+
+
+@contextmanager
+def traced(trace_id):
+    """Pass the given trace id along the calls made within a block"""
+    previous = current_trace_id()
+    set_trace_id(trace_id)
+    try:
+        yield
+    finally:
+        set_trace_id(previous)
+
+
+class TracingMiddleware(object):
+    """zerorpc middleware passing the trace id of a greenlet along calls"""
+    def get_task_context(self):
+        trace_id = current_trace_id()
+        return {'trace_id': trace_id} if trace_id else {}
+
+    def load_task_context(self, event_header):
+        set_trace_id(event_header.get('trace_id'))
+
+
+_installed = []
+
+
+def install(context=None):
+    """Register the tracing middleware, once per zerorpc context"""
+    context = context or zerorpc.Context.get_instance()
+    if context not in _installed:
+        context.register_middleware(TracingMiddleware())
+        _installed.append(context)
+
+
+class Trace(object):
+    """Spans of a single job.
+
+    Parameters
+    ----------
+    trace_id: str, optional
+        id shared with the server, a new one by default
+    """
+    def __init__(self, trace_id=None):
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.spans = []
+        self.server_spans = []
+
+    def add(self, name, start, end):
+        """Record a span with the given start and end time"""
+        self.spans.append({'name': name, 'start': start, 'end': end})
+
+    @contextmanager
+    def span(self, name):
+        """Record the time spent in a block as a span"""
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add(name, start, time.time())
+
+    @staticmethod
+    def _durations(spans):
+        durations = {}
+        for span in spans:
+            durations[span['name']] = durations.get(span['name'], 0.0) + \
+                span['end'] - span['start']
+        return durations
+
+    def summary(self):
+        """Return the seconds spent in every phase of the job.
+
+        Phases which are not known, e.g. `queue` without server spans,
+        are left out.
+        """
+        client = self._durations(self.spans)
+        server = self._durations(self.server_spans)
+        phases = {}
+        for name in ('pickle', 'fetch', 'unpickle'):
+            if name in client:
+                phases[name] = client[name]
+        if 'create' in client:
+            if 'create' in server:
+                # The rest of the create call is moving the CUDS
+                phases['create'] = server['create']
+                phases['upload'] = max(client['create'] - server['create'], 0.0)
+            else:
+                phases['create'] = client['create']
+        if 'wait' in client:
+            if 'run' in server:
+                phases['queue'] = server.get('queue', 0.0)
+                phases['run'] = server['run']
+                # Time until the client noticed the end of the run
+                phases['completion'] = max(client['wait'] -
+                                           phases['queue'] - phases['run'],
+                                           0.0)
+            else:
+                phases['run'] = client['wait']
+        return OrderedDict((name, phases[name]) for name in PHASES
+                           if name in phases)
+
+
+def summarize(traces):
+    """Aggregate the summaries of several traces, e.g. of a sweep.
+
+    Returns
+    -------
+    OrderedDict
+        phase name to a dict of `count`, `total`, `mean`, `min` and `max`
+        seconds
+    """
+    values = {}
+    for trace in traces:
+        for name, seconds in trace.summary().iteritems():
+            values.setdefault(name, []).append(seconds)
+    report = OrderedDict()
+    for name in PHASES:
+        if name in values:
+            seconds = values[name]
+            report[name] = {'count': len(seconds),
+                            'total': sum(seconds),
+                            'mean': sum(seconds) / len(seconds),
+                            'min': min(seconds),
+                            'max': max(seconds)}
+    return report
@@ -0,0 +1,171 @@
+"""
+This module is part of simphony-network package.
+
+Append-only on-disk store for time-series output of a wrapper.
+
+Each dataset of a wrapper gets its own `TrajectoryStore` directory. Frames
+are written as raw array bytes into chunk files, each holding a bounded
+number of frames. For every frame one JSON line is appended to the
+`index.jsonl` file telling in which chunk and at which byte offset every
+attribute lives. Readers memory-map exactly the bytes they need, so long
+trajectories can be analysed without keeping the frames in memory.
+"""
+import os
+import json
+import errno
+
+import numpy as np
+
+INDEX_FILE = 'index.jsonl'
+CHUNK_FILE = 'chunk-%05d.bin'
+
+
+class TrajectoryStore(object):
+    """Append-only, chunked and memory-mappable store of dataset frames.
+
+    Parameters
+    ----------
+    path: str
+        directory of the store, created if it does not exist
+    chunk_frames: int
+        maximum number of frames written into a single chunk file
+    """
+    def __init__(self, path, chunk_frames=64):
+        self._path = path
+        self._chunk_frames = chunk_frames
+        try:
+            os.makedirs(path)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+        # Load the index of an existing store
+        self._index = []
+        index_path = os.path.join(self._path, INDEX_FILE)
+        if os.path.exists(index_path):
+            with open(index_path) as f:
+                self._index = [json.loads(line) for line in f if line.strip()]
+
+    @property
+    def path(self):
+        """Directory of the store"""
+        return self._path
+
+    def __len__(self):
+        return len(self._index)
+
+    @property
+    def steps(self):
+        """Time steps of the recorded frames"""
+        return [entry['step'] for entry in self._index]
+
+    @property
+    def attributes(self):
+        """Mapping of attribute names to their (dtype, shape) in the last frame"""
+        if not self._index:
+            return {}
+        return dict((name, (meta['dtype'], meta['shape']))
+                    for name, meta in self._index[-1]['data'].iteritems())
+
+    def append(self, step, arrays):
+        """Append a new frame to the store.
+
+        Parameters
+        ----------
+        step: int
+            time step the frame belongs to
+        arrays: dict
+            attribute name to numpy array
+
+        Returns
+        -------
+        int
+            number of the new frame
+        """
+        frame = len(self._index)
+        chunk = frame // self._chunk_frames
+        chunk_path = os.path.join(self._path, CHUNK_FILE % chunk)
+
+        entry = {'step': step, 'chunk': chunk, 'data': {}}
+        with open(chunk_path, 'ab') as f:
+            f.seek(0, os.SEEK_END)
+            for name in sorted(arrays):
+                array = np.ascontiguousarray(arrays[name])
+                if array.dtype.hasobject:
+                    raise TypeError('Attribute %s can not be stored, it '
+                                    'contains python objects.' % name)
+                entry['data'][name] = {'offset': f.tell(),
+                                       'dtype': array.dtype.str,
+                                       'shape': list(array.shape)}
+                f.write(array.data)
+
+        # The index is written last, readers never see half written frames
+        with open(os.path.join(self._path, INDEX_FILE), 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+        self._index.append(entry)
+        return frame
+
+    def get_frame(self, frame, attributes=None):
+        """Return the arrays of the given frame, memory-mapped read-only.
+
+        Parameters
+        ----------
+        frame: int
+            number of the frame
+        attributes: sequence of str, optional
+            names of the attributes to return, all of them by default
+
+        Returns
+        -------
+        dict
+            attribute name to numpy array
+        """
+        entry = self._index[frame]
+        if attributes is None:
+            attributes = entry['data'].keys()
+
+        chunk_path = os.path.join(self._path, CHUNK_FILE % entry['chunk'])
+        arrays = {}
+        for name in attributes:
+            if name not in entry['data']:
+                raise KeyError('Frame %s has no attribute %s.' % (frame, name))
+            meta = entry['data'][name]
+            dtype = np.dtype(str(meta['dtype']))
+            shape = tuple(meta['shape'])
+            if not np.prod(shape):
+                arrays[name] = np.empty(shape, dtype=dtype)
+                continue
+            arrays[name] = np.memmap(chunk_path, dtype=dtype, mode='r',
+                                     offset=meta['offset'], shape=shape)
+        return arrays
+
+    def iter_frames(self, start=0, stop=None, attributes=None):
+        """Iterate over a range of frames.
+
+        Parameters
+        ----------
+        start: int
+            first frame to return
+        stop: int, optional
+            frame to stop before, the end of the store by default
+        attributes: sequence of str, optional
+            names of the attributes to return, all of them by default
+
+        Yields
+        ------
+        tuple
+            (frame, step, arrays) of every frame in the range
+        """
+        for frame in xrange(*slice(start, stop).indices(len(self._index))):
+            yield (frame, self._index[frame]['step'],
+                   self.get_frame(frame, attributes))
+
+    def iter_attribute(self, name, start=0, stop=None):
+        """Iterate over a single attribute across a range of frames.
+
+        Yields
+        ------
+        numpy.ndarray
+        """
+        for _, _, arrays in self.iter_frames(start, stop, [name]):
+            yield arrays[name]
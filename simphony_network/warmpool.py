@@ -0,0 +1,91 @@
+"""
+This module is part of simphony-network package.
+
+Pool of pre-constructed engine instances.
+
+Some engines do expensive work in their constructor, e.g. allocating
+solvers or loading tables. For the engine types configured in
+`WRAPPER_POOL`, `EnginePool` constructs instances ahead of time in the
+background, so a new wrapper gets a ready instance. Instances of finished
+wrappers are recycled if the engine offers a `reset` method, which has to
+bring the engine back to its freshly constructed state.
+"""
+import logging
+from collections import defaultdict
+
+import gevent
+
+
+class EnginePool(object):
+    """Pre-constructed engine instances, per engine type.
+
+    Parameters
+    ----------
+    registry: EngineRegistry
+        registry to get the engine classes from
+    sizes: dict
+        engine type to the number of instances to keep ready
+    """
+    def __init__(self, registry, sizes):
+        self.logger = logging.getLogger('simphony')
+        self._registry = registry
+        self._sizes = dict(sizes)
+        self._idle = defaultdict(list)
+        self._fillers = {}
+
+    def start(self):
+        """Start constructing instances of all the pooled engine types"""
+        for engine_type in self._sizes:
+            self._refill(engine_type)
+
+    def _refill(self, engine_type):
+        """Construct missing instances in the background"""
+        filler = self._fillers.get(engine_type)
+        if filler is None or filler.ready():
+            self._fillers[engine_type] = gevent.spawn(self._fill, engine_type)
+
+    def _fill(self, engine_type):
+        """Construct instances until the pool of a type is full"""
+        cls = self._registry.get(engine_type)
+        while len(self._idle[engine_type]) < self._sizes[engine_type]:
+            self._idle[engine_type].append(cls())
+            self.logger.debug('Pooled a new %s instance.' % engine_type)
+            # Serve requests in between constructions
+            gevent.idle()
+
+    def acquire(self, engine_type):
+        """Return a ready instance of the given type, or None if there is none"""
+        if engine_type not in self._sizes:
+            return None
+        instance = None
+        if self._idle[engine_type]:
+            instance = self._idle[engine_type].pop()
+        self._refill(engine_type)
+        return instance
+
+    def release(self, engine_type, instance):
+        """Give an instance back to the pool.
+
+        Returns
+        -------
+        bool
+            True if the instance was reset and kept for later use
+        """
+        if engine_type not in self._sizes or \
+                len(self._idle[engine_type]) >= self._sizes[engine_type]:
+            return False
+        reset = getattr(instance, 'reset', None)
+        if not callable(reset):
+            return False
+        try:
+            reset()
+        except Exception:
+            self.logger.exception('Could not reset a %s instance.' % engine_type)
+            return False
+        self._idle[engine_type].append(instance)
+        return True
+
+    def sizes(self):
+        """Return the number of ready instances per engine type"""
+        return dict((engine_type, len(self._idle[engine_type]))
+                    for engine_type in self._sizes)